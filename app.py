@@ -1,10 +1,25 @@
 """
 Usage:
-  app.py [--host=<host>] [--port=<port>]
+  app.py [--host=<host>] [--port=<port>] [--asgi]
+  app.py --profile-startup [--top=<n>]
+  app.py export <file> [--session=<id>]
+  app.py import <file> [--replace] [--session=<id>]
+  app.py scan [--workers=<n>] [--session=<id>]
+
+Commands:
+  export             Write every profile to <file> as JSON lines, compressed if it ends in .gz, .bz2 or .xz
+  import             Add the profiles in an exported <file>
+  scan               Validate every stored profile in parallel and list the corrupt ones
 
 Options:
-  --host=<host>  Host to run the server on [default: 0.0.0.0]
-  --port=<port>  Port to run the server on [default: 8080]
+  --host=<host>      Host to run the server on [default: 0.0.0.0]
+  --port=<port>      Port to run the server on [default: 8080]
+  --asgi             Serve the ASGI app in src/asgi.py with uvicorn instead of Flask's server
+  --profile-startup  Report the time and allocations of each startup phase and import, then exit
+  --top=<n>          Number of slowest imports to report [default: 15]
+  --replace          Replace existing profiles with the same name instead of skipping them
+  --workers=<n>      Worker processes for the scan; defaults to one per CPU
+  --session=<id>     Use a session's profiles in multi-tenant mode instead of the shared ones
 """
 
 import sys
@@ -21,25 +36,139 @@ if sys.version_info < (3, 12):
 
 # --- Flask Application Setup ---
 from docopt import docopt
-from flask import Flask, jsonify, request, send_from_directory
-from src import profile_manager
+from flask import Flask, Response, abort, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from src import json_codec, metrics, profile_manager
+from src.http_cache import STATIC_ASSETS, etag_matches
+from src.tenants import new_session_id, session_cookie, session_id_from_cookies
+from time import perf_counter
 import logging
 import os
 
-app = Flask(__name__, static_folder="src", static_url_path="")
+# Static files are served by the routes below, from memory and precompressed
+app = Flask(__name__, static_folder=None)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
 
+# --- JSON ---
+class FastJSONProvider(DefaultJSONProvider):
+    """Encodes and decodes JSON with src.json_codec, which uses orjson when it is installed."""
+
+    def dumps(self, obj, **kwargs):
+        return json_codec.dumps_str(obj, indent=bool(kwargs.get("indent")), sort_keys=kwargs.get("sort_keys", False))
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+    def encode(self, obj, indent=False):
+        return json_codec.dumps(obj, indent=indent, sort_keys=self.sort_keys)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        # Encoded straight to bytes, skipping the str round-trip of the default provider
+        return self._app.response_class(self.encode(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+app.json = FastJSONProvider(app)
+
+
+# --- Sessions ---
+def enter_tenant_session():
+    """
+    Makes the session's tenant current for API requests, starting a new session if needed.
+    A session's tenant is only stored once a request changes something.
+    """
+    session_id = session_id_from_cookies(request.headers.get("Cookie"))
+    if session_id is None:
+        session_id = g.new_session_id = new_session_id()
+    if request.path.startswith("/api/"):
+        read_only = request.method in ("GET", "HEAD")
+        g.tenant_session = profile_manager.tenant_session(session_id, read_only)
+        g.tenant_session.__enter__()
+
+
+def set_session_cookie(response):
+    if "new_session_id" in g:
+        response.headers.add("Set-Cookie", session_cookie(g.new_session_id))
+    return response
+
+
+def exit_tenant_session(error=None):
+    tenant_session = g.pop("tenant_session", None)
+    if tenant_session is not None:
+        tenant_session.__exit__(None, None, None)
+
+
+# Without multi-tenancy every request uses the default tenant, so no hooks are needed
+if profile_manager.MULTI_TENANT:
+    app.before_request(enter_tenant_session)
+    app.after_request(set_session_cookie)
+    app.teardown_request(exit_tenant_session)
+
+
+# --- Instrumentation ---
+class InstrumentedJSONProvider(FastJSONProvider):
+    """Records the time spent serializing JSON responses."""
+
+    def encode(self, obj, indent=False):
+        with metrics.span("serialize"):
+            return super().encode(obj, indent)
+
+
+def start_request_timer():
+    g.request_start = perf_counter()
+
+
+def record_request_metrics(response):
+    metrics.observe_request(
+        request.url_rule.rule if request.url_rule else "unmatched",
+        request.method, response.status_code, perf_counter() - g.request_start)
+    return response
+
+
+# Hooks are only installed when metrics are enabled, so they cost nothing otherwise
+if metrics.METRICS_ENABLED:
+    app.json = InstrumentedJSONProvider(app)
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+
+
 # --- API Endpoints ---
 @app.route("/api/game-state", methods=["GET"])
 def get_game_state():
-    """Retrieves the current state of all profiles."""
+    """
+    Retrieves the current state of all profiles. Answers with 304 Not Modified, without
+    building the state, if the client's If-None-Match matches the current ETag.
+    Idle progress of the selected profile that is not stored yet is reported in
+    "idle_pending"; it is credited by the next change, or by POST /api/idle/settle.
+    """
+    etag = profile_manager.get_game_state_etag()
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return "", 304, headers
     state = profile_manager.get_processed_game_state()
+    idle_pending = profile_manager.get_pending_idle_gain()
+    if idle_pending:
+        state["idle_pending"] = idle_pending
     # The detailed game state is no longer logged to avoid clutter.
     # app.logger.info(f"Game State: {state}")
-    return jsonify(state)
+    return jsonify(state), 200, headers
+
+
+@app.route("/api/events", methods=["GET"])
+def stream_events_route():
+    """
+    Streams game state changes as Server-Sent Events: a "state" event with the full state,
+    then "diff" events with only the changed fields. Clients reconnecting with
+    Last-Event-ID (or ?cursor=<event id>) receive a catch-up diff instead.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("cursor")
+    return Response(
+        profile_manager.stream_state_changes(last_event_id), mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/api/profile/migrate", methods=["POST"])
@@ -61,13 +190,57 @@ def fix_profile_route():
 
 @app.route("/api/action", methods=["POST"])
 def handle_action_route():
-    """Handles a player action (e.g., gathering resources)."""
+    """
+    Handles a player action (e.g., gathering resources).
+    Set "delta" in the request body to receive only the changed profile.
+    """
     data = request.get_json()
     action_id = data.get("action_id")
     if not action_id:
         return jsonify({"error": "No action ID provided"}), 400
 
-    result = profile_manager.handle_action(action_id)
+    result = profile_manager.handle_action(action_id, delta=bool(data.get("delta")))
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+
+@app.route("/api/action/batch", methods=["POST"])
+def handle_action_batch_route():
+    """
+    Handles a burst of player actions in one request, e.g.
+    {"actions": [{"action_id": "gather-wood-button", "count": 50}]}.
+    """
+    data = request.get_json()
+    result = profile_manager.handle_actions(data.get("actions"), delta=bool(data.get("delta")))
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+
+@app.route("/api/idle/start", methods=["POST"])
+def start_idle_action_route():
+    """Starts a timed action that repeats while the player is away, e.g. {"action_id": "gather-wood-button"}."""
+    data = request.get_json()
+    action_id = data.get("action_id")
+    if not action_id:
+        return jsonify({"error": "No action ID provided"}), 400
+    result = profile_manager.start_idle_action(action_id)
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+
+@app.route("/api/idle/settle", methods=["POST"])
+def settle_idle_action_route():
+    """Credits the selected profile's idle progress so far, reporting it in "idle_gain"."""
+    return jsonify(profile_manager.settle_idle_action())
+
+
+@app.route("/api/idle/stop", methods=["POST"])
+def stop_idle_action_route():
+    """Stops the selected profile's idle action, crediting its progress."""
+    result = profile_manager.stop_idle_action()
     if "error" in result:
         return jsonify(result), 400
     return jsonify(result)
@@ -133,6 +306,26 @@ def hard_reset_route():
     return jsonify(result)
 
 
+@app.route("/api/leaderboard", methods=["GET"])
+def get_leaderboard_route():
+    """
+    Ranks profiles by total level, or by a skill's total XP with ?board=<skill>. Returns the
+    top ?limit= entries from ?offset= and the rank of ?name= (the selected profile by default).
+    """
+    if profile_manager.MULTI_TENANT:
+        return jsonify({"error": "Leaderboards are disabled with MULTI_TENANT=1, where each session only has its own profiles."}), 404
+    try:
+        limit = int(request.args.get("limit", 10))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "Limit and offset must be integers"}), 400
+    result = profile_manager.get_leaderboard(
+        request.args.get("board", profile_manager.TOTAL_LEVEL_BOARD), limit, offset, request.args.get("name"))
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+
 @app.route("/api/settings", methods=["GET"])
 def get_settings_route():
     """Returns all user settings from settings.json."""
@@ -150,24 +343,61 @@ def set_settings_route():
     return jsonify({"success": True, **data})
 
 
+@app.route("/api/metrics", methods=["GET"])
+def metrics_route():
+    """Exposes request and hot-path metrics in Prometheus text format to local clients."""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled. Set METRICS_ENABLED=1 to enable them."}), 404
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "Metrics are only available locally"}), 403
+    return metrics.render_prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
 # --- Static File Serving ---
+def send_static_asset(path):
+    """Serves a precompressed static asset, answering a matching If-None-Match with 304."""
+    response = STATIC_ASSETS.response(
+        path, request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match"))
+    if response is None:
+        abort(404)
+    status, headers, body = response
+    return body, status, headers
+
+
 @app.route("/")
 def index():
     """Serves the main index.html file."""
-    return send_from_directory("src", "index.html")
+    return send_static_asset("index.html")
 
 
 @app.route("/<path:path>")
 def send_static_files(path):
     """Serves other static files from the "src" directory."""
-    return send_from_directory("src", path)
+    return send_static_asset(path)
 
 
 def main():
     """Main entry point for the Flask application."""
     args = docopt(__doc__)
+    if args["--profile-startup"]:
+        from src.startup_profile import format_startup_report, run_startup_profile
+        print(format_startup_report(run_startup_profile(top=int(args["--top"]))))
+        return
+    if args["export"] or args["import"] or args["scan"]:
+        from src.profile_tools import run_profile_command
+        raise SystemExit(run_profile_command(args))
+    # Hash and precompress static assets and compile the action table before the first request
+    STATIC_ASSETS.load()
+    profile_manager.get_action_table()
     host = args["--host"] or os.environ.get("HOST", "127.0.0.1")
     port = int(args["--port"] or os.environ.get("PORT", 5000))
+    if args["--asgi"]:
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit("ASGI mode requires uvicorn. Install it with: pip install uvicorn")
+        uvicorn.run("src.asgi:app", host=host, port=port)
+        return
     app.run(host=host, port=port)
 
 
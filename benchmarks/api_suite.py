@@ -0,0 +1,548 @@
+"""
+Load-testing and benchmark suite for the API.
+
+Generates synthetic profile directories of each size, then measures latency percentiles
+and throughput of the main endpoints against each target:
+
+  client   the Flask app through its test client, in process
+  asgi     the ASGI app in src/asgi.py, called in process
+  server   a real local Flask server, over HTTP
+  uvicorn  a real local ASGI server, over HTTP (skipped if uvicorn is not installed)
+
+Each profile size runs in fresh processes, so every measurement starts from a cold
+profile store. Content loading is measured separately, from the content files and from
+the compiled snapshot. Results are printed and can be saved as JSON with --output. Pass
+an earlier JSON file with --baseline to compare against it. The run then fails if any
+median latency or throughput regressed by more than the tolerance. The compare command
+compares two saved results without running anything.
+
+Usage:
+  api_suite.py [--profiles=<list>] [--skills=<n>] [--targets=<list>] [--scenarios=<list>]
+               [--requests=<n>] [--max-seconds=<s>] [--concurrency=<n>] [--warmup=<n>]
+               [--seed=<n>] [--output=<file>] [--baseline=<file>] [--tolerance=<pct>]
+  api_suite.py compare <baseline> <current> [--tolerance=<pct>]
+
+Options:
+  --profiles=<list>   Comma-separated numbers of profiles to generate [default: 10,1000,100000]
+  --skills=<n>        Number of skills and items per profile [default: 20]
+  --targets=<list>    Comma-separated targets to measure [default: client,asgi,server,uvicorn]
+  --scenarios=<list>  Comma-separated scenarios to run, or "all" [default: all]
+  --requests=<n>      Requests per scenario [default: 200]
+  --max-seconds=<s>   Time limit per scenario; at least one request always runs [default: 10]
+  --concurrency=<n>   Concurrent clients for the game state, action and leaderboard scenarios [default: 4]
+  --warmup=<n>        Untimed requests before each scenario [default: 3]
+  --seed=<n>          Seed for the generated profiles [default: 1]
+  --output=<file>     Save the results as JSON
+  --baseline=<file>   Compare the results with a saved JSON file
+  --tolerance=<pct>   Allowed regression before a comparison fails, in percent [default: 20]
+"""
+
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, sleep
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+from docopt import docopt
+
+RESULTS_VERSION = 1
+TARGETS = ["client", "asgi", "server", "uvicorn"]
+# Scenarios measured with concurrent clients, in order
+CONCURRENT_SCENARIOS = ["game_state", "game_state_cached", "action", "leaderboard"]
+# Create, rename and delete act on the selected profile, so they run one at a time
+LIFECYCLE_SCENARIOS = ["profile_create", "profile_rename", "profile_delete"]
+CONTENT_SCENARIOS = ["content_load_files", "content_load_snapshot"]
+SCENARIOS = CONCURRENT_SCENARIOS + LIFECYCLE_SCENARIOS + CONTENT_SCENARIOS
+# Skills and items that actions use; the generated ones are added after them
+BASE_SKILLS = ["woodcutting", "mining", "foraging"]
+BASE_ITEMS = ["wood", "stone", "herbs"]
+ACTION_ID = "gather-wood-button"
+SERVER_START_TIMEOUT = 60
+
+
+# --- Synthetic Data ---
+def generate_dataset(directory, profile_count, skill_count, seed):
+    """
+    Writes profile_count random profiles into directory/profiles in the layout the JSON
+    backend reads, selects the first one, and copies the initial profile template.
+    """
+    rng = random.Random(seed)
+    skills = BASE_SKILLS + [f"skill{i}" for i in range(max(skill_count - len(BASE_SKILLS), 0))]
+    items = BASE_ITEMS + [f"item{i}" for i in range(max(skill_count - len(BASE_ITEMS), 0))]
+    profiles_dir, data_dir = directory / "profiles", directory / "data"
+    profiles_dir.mkdir(parents=True)
+    data_dir.mkdir()
+    shutil.copy(ROOT / "data" / "init_profile.json", data_dir / "init_profile.json")
+    for i in range(profile_count):
+        profile = {
+            "skills": {skill: float(rng.randint(0, 200_000)) for skill in skills},
+            "inventory": {item: float(rng.randint(0, 5_000)) for item in items},
+        }
+        (profiles_dir / f"player{i:06d}.json").write_text(json.dumps(profile, indent=2))
+    (data_dir / "settings.json").write_text(json.dumps({"selected_profile_name": "player000000"}))
+
+
+# --- Measurement ---
+def percentile(sorted_values, fraction):
+    """Returns the value at a fraction of a sorted list, interpolating between neighbours."""
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, errors, seconds):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "errors": errors, "seconds": seconds, "throughput": 0.0, "latency_ms": None}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p90": percentile(latencies, 0.90) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000,
+        },
+    }
+
+
+def _is_error(status):
+    return status >= 400
+
+
+def run_threads(make_send, request, options, concurrency):
+    """
+    Sends request() from concurrent threads, each with its own connection from make_send(),
+    until the request count or the time limit is reached.
+    """
+    tickets, lock = count(), Lock()
+    latencies, errors = [], [0]
+    warmup_send = make_send()
+    for _ in range(options["warmup"]):
+        warmup_send(*request())
+    deadline = perf_counter() + options["max_seconds"]
+
+    def worker():
+        send = make_send()
+        while next(tickets) < options["requests"]:
+            start = perf_counter()
+            status, _ = send(*request())
+            elapsed = perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += _is_error(status)
+            if perf_counter() > deadline:
+                break
+
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(latencies, errors[0], perf_counter() - start)
+
+
+async def run_tasks(send, request, options, concurrency):
+    """The asyncio counterpart of run_threads, for an async send."""
+    tickets = count()
+    latencies, errors = [], 0
+    for _ in range(options["warmup"]):
+        await send(*request())
+    deadline = perf_counter() + options["max_seconds"]
+
+    async def worker():
+        nonlocal errors
+        while next(tickets) < options["requests"]:
+            start = perf_counter()
+            status, _ = await send(*request())
+            latencies.append(perf_counter() - start)
+            errors += _is_error(status)
+            if perf_counter() > deadline:
+                break
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, perf_counter() - start)
+
+
+def lifecycle_steps(iteration):
+    """The create, rename and delete requests of one profile lifecycle."""
+    name = f"bench{iteration:06d}"
+    return [
+        ("profile_create", ("POST", "/api/profile/new", {"name": name}, {})),
+        ("profile_rename", ("PUT", "/api/profile/rename", {"name": f"{name}-renamed"}, {})),
+        ("profile_delete", ("DELETE", "/api/profile/delete", None, {})),
+    ]
+
+
+def scenario_request(scenario, etag):
+    """Returns a function producing the (method, path, body, headers) of a scenario's requests."""
+    if scenario == "game_state":
+        return lambda: ("GET", "/api/game-state", None, {})
+    if scenario == "game_state_cached":
+        return lambda: ("GET", "/api/game-state", None, {"If-None-Match": etag})
+    if scenario == "action":
+        return lambda: ("POST", "/api/action", {"action_id": ACTION_ID, "delta": True}, {})
+    if scenario == "leaderboard":
+        return lambda: ("GET", "/api/leaderboard?limit=10", None, {})
+    raise ValueError(scenario)
+
+
+def run_lifecycle(send, scenarios, options):
+    """Times each step of repeated create, rename and delete cycles, one request at a time."""
+    timings = {scenario: ([], [0]) for scenario in LIFECYCLE_SCENARIOS}
+    for iteration in range(options["warmup"]):
+        for _, request in lifecycle_steps(options["requests"] + iteration):
+            send(*request)
+    start, deadline = perf_counter(), perf_counter() + options["max_seconds"]
+    for iteration in range(options["requests"]):
+        for scenario, request in lifecycle_steps(iteration):
+            request_start = perf_counter()
+            status, _ = send(*request)
+            latencies, errors = timings[scenario]
+            latencies.append(perf_counter() - request_start)
+            errors[0] += _is_error(status)
+        if perf_counter() > deadline:
+            break
+    seconds = perf_counter() - start
+    return {
+        scenario: summarize(latencies, errors[0], seconds)
+        for scenario, (latencies, errors) in timings.items() if scenario in scenarios
+    }
+
+
+# --- Targets ---
+def flask_client_send(app):
+    def make_send():
+        client = app.test_client()
+
+        def send(method, path, body, headers):
+            response = client.open(path, method=method, json=body, headers=headers)
+            response.get_data()
+            return response.status_code, {name.lower(): value for name, value in response.headers.items()}
+        return send
+    return make_send
+
+
+def asgi_send(app):
+    async def send(method, path, body, headers):
+        path, _, query = path.partition("?")
+        raw = b"" if body is None else json.dumps(body).encode()
+        raw_headers = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+        if body is not None:
+            raw_headers.append((b"content-type", b"application/json"))
+        scope = {
+            "type": "http", "method": method, "path": path, "query_string": query.encode(),
+            "headers": raw_headers, "client": ("127.0.0.1", 0),
+        }
+        messages = [{"type": "http.request", "body": raw, "more_body": False}]
+        start = {}
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send_message(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+
+        await app(scope, receive, send_message)
+        return start["status"], {name.decode(): value.decode() for name, value in start["headers"]}
+    return send
+
+
+def http_send(port):
+    def make_send():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+
+        def send(method, path, body, headers):
+            data = None if body is None else json.dumps(body).encode()
+            if data is not None:
+                headers = {**headers, "Content-Type": "application/json"}
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+            except (ConnectionError, http.client.HTTPException):
+                # The Flask development server closes HTTP/1.0 connections after each response
+                connection.close()
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+            response.read()
+            return response.status, {name.lower(): value for name, value in response.getheaders()}
+        return send
+    return make_send
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(directory, asgi):
+    """Starts app.py in directory on a free port. Returns the process and the port."""
+    port = _free_port()
+    command = [sys.executable, str(ROOT / "app.py"), "--host=127.0.0.1", f"--port={port}"]
+    if asgi:
+        command.append("--asgi")
+    process = subprocess.Popen(
+        command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, "PYTHONPATH": str(ROOT)})
+    deadline = perf_counter() + SERVER_START_TIMEOUT
+    while perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return process, port
+        except OSError:
+            sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server did not start in time")
+
+
+# --- Runs ---
+def measure_target(directory, target, scenarios, options):
+    """
+    Runs the API scenarios against one target with directory as the working directory.
+    Returns {scenario: summary}. Runs in a fresh process for in-process targets.
+    """
+    results = {}
+    process = None
+    if target in ("client", "asgi"):
+        os.chdir(directory)
+        if target == "client":
+            from app import app
+            make_send = flask_client_send(app)
+        else:
+            from src.asgi import app
+            send_async = asgi_send(app)
+
+            def make_send():
+                return lambda *request: asyncio.run(send_async(*request))
+    else:
+        process, port = start_server(directory, asgi=target == "uvicorn")
+        make_send = http_send(port)
+
+    try:
+        # "*" matches any entity tag, so this learns the current one without building the state
+        _, headers = make_send()("GET", "/api/game-state", None, {"If-None-Match": "*"})
+        etag = headers.get("etag", "")
+        for scenario in CONCURRENT_SCENARIOS:
+            if scenario not in scenarios:
+                continue
+            request = scenario_request(scenario, etag)
+            if target == "asgi":
+                results[scenario] = asyncio.run(run_tasks(send_async, request, options, options["concurrency"]))
+            else:
+                results[scenario] = run_threads(make_send, request, options, options["concurrency"])
+        if any(scenario in scenarios for scenario in LIFECYCLE_SCENARIOS):
+            results.update(run_lifecycle(make_send(), scenarios, options))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return results
+
+
+def measure_content(scenarios, options):
+    """Times loading all game content from the files and from the compiled snapshot."""
+    from src.content import ContentRegistry
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = Path(directory, "content_cache.pickle")
+        for scenario in CONTENT_SCENARIOS:
+            if scenario not in scenarios:
+                continue
+            latencies = []
+            start, deadline = perf_counter(), perf_counter() + options["max_seconds"]
+            for _ in range(options["requests"]):
+                if scenario == "content_load_files":
+                    cache_file.unlink(missing_ok=True)
+                else:
+                    ContentRegistry(cache_file=cache_file).load()  # Makes sure the snapshot exists
+                registry = ContentRegistry(cache_file=cache_file)
+                load_start = perf_counter()
+                registry.load()
+                latencies.append(perf_counter() - load_start)
+                if perf_counter() > deadline:
+                    break
+            results[scenario] = summarize(latencies, 0, perf_counter() - start)
+    return results
+
+
+def _in_fresh_process(function, *args):
+    """Calls function(*args) in a new interpreter, so module state never carries over."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def _uvicorn_installed():
+    try:
+        import uvicorn  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run_suite(profile_counts, skill_count, targets, scenarios, options, seed):
+    rows = []
+
+    def add(target, profiles, results):
+        for scenario, summary in results.items():
+            rows.append({"target": target, "profiles": profiles, "scenario": scenario, **summary})
+            print_row(rows[-1])
+
+    print_header()
+    if any(scenario in scenarios for scenario in CONTENT_SCENARIOS):
+        add("content", 0, _in_fresh_process(measure_content, scenarios, options))
+
+    api_scenarios = [scenario for scenario in scenarios if scenario not in CONTENT_SCENARIOS]
+    if "uvicorn" in targets and not _uvicorn_installed():
+        print("uvicorn is not installed; skipping the uvicorn target")
+        targets = [target for target in targets if target != "uvicorn"]
+    if not api_scenarios:
+        return rows
+    for profile_count in profile_counts:
+        with tempfile.TemporaryDirectory(prefix="number-sense-bench-") as base:
+            template = Path(base, "template")
+            start = perf_counter()
+            generate_dataset(template, profile_count, skill_count, seed)
+            print(f"Generated {profile_count} profiles in {perf_counter() - start:.1f}s")
+            for target in targets:
+                # Every target starts from an identical copy, since scenarios change profiles
+                directory = Path(base, target)
+                shutil.copytree(template, directory)
+                if target in ("client", "asgi"):
+                    results = _in_fresh_process(measure_target, directory, target, api_scenarios, options)
+                else:
+                    results = measure_target(directory, target, api_scenarios, options)
+                add(target, profile_count, results)
+                shutil.rmtree(directory)
+    return rows
+
+
+# --- Reporting ---
+def print_header():
+    print(f"{'Target':<9}{'Profiles':>9}  {'Scenario':<22}{'Requests':>9}{'Errors':>7}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+
+
+def print_row(row):
+    latency = row["latency_ms"] or dict.fromkeys(("p50", "p90", "p99", "max"), float("nan"))
+    print(f"{row['target']:<9}{row['profiles']:>9}  {row['scenario']:<22}{row['requests']:>9}{row['errors']:>7}"
+          f"{row['throughput']:>10.1f}{latency['p50']:>10.2f}{latency['p90']:>10.2f}{latency['p99']:>10.2f}"
+          f"{latency['max']:>10.2f}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, tolerance):
+    """
+    Prints the change of each result from its baseline. Returns the number of regressions:
+    median latency up, or throughput down, by more than tolerance percent.
+    """
+    baseline_rows = {(row["target"], row["profiles"], row["scenario"]): row for row in baseline["results"]}
+    regressions = compared = 0
+    print(f"{'Target':<9}{'Profiles':>9}  {'Scenario':<22}{'p50 ms':>10}{'change':>9}{'req/s':>10}{'change':>9}")
+    for row in current["results"]:
+        old = baseline_rows.get((row["target"], row["profiles"], row["scenario"]))
+        if old is None or not old["latency_ms"] or not row["latency_ms"]:
+            continue
+        p50_change = (row["latency_ms"]["p50"] / old["latency_ms"]["p50"] - 1) * 100
+        throughput_change = (row["throughput"] / old["throughput"] - 1) * 100
+        regressed = p50_change > tolerance or throughput_change < -tolerance
+        regressions += regressed
+        compared += 1
+        print(f"{row['target']:<9}{row['profiles']:>9}  {row['scenario']:<22}{row['latency_ms']['p50']:>10.2f}"
+              f"{p50_change:>+8.1f}%{row['throughput']:>10.1f}{throughput_change:>+8.1f}%"
+              + ("  REGRESSION" if regressed else ""))
+    if not compared:
+        print("No results in common with the baseline")
+    return regressions
+
+
+def _check(baseline_file, current, tolerance):
+    baseline = json.loads(Path(baseline_file).read_text())
+    print()
+    print(f"Compared with {baseline_file} (commit {baseline['meta'].get('commit')}):")
+    regressions = compare(baseline, current, tolerance)
+    if regressions:
+        raise SystemExit(f"{regressions} result(s) regressed by more than {tolerance:g}%")
+
+
+def _split(value):
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+def main():
+    args = docopt(__doc__)
+    tolerance = float(args["--tolerance"])
+    if args["compare"]:
+        _check(args["<baseline>"], json.loads(Path(args["<current>"]).read_text()), tolerance)
+        return
+
+    targets = _split(args["--targets"])
+    scenarios = SCENARIOS if args["--scenarios"] == "all" else _split(args["--scenarios"])
+    for name, chosen, known in (("target", targets, TARGETS), ("scenario", scenarios, SCENARIOS)):
+        unknown = set(chosen) - set(known)
+        if unknown:
+            raise SystemExit(f"Unknown {name}(s): {', '.join(sorted(unknown))}. Choose from {', '.join(known)}.")
+    options = {
+        "requests": int(args["--requests"]),
+        "max_seconds": float(args["--max-seconds"]),
+        "concurrency": int(args["--concurrency"]),
+        "warmup": int(args["--warmup"]),
+    }
+    profile_counts = [int(value) for value in _split(args["--profiles"])]
+    skill_count, seed = int(args["--skills"]), int(args["--seed"])
+
+    rows = run_suite(profile_counts, skill_count, targets, scenarios, options, seed)
+    results = {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "skills": skill_count,
+            "seed": seed,
+            **options,
+        },
+        "results": rows,
+    }
+    if args["--output"]:
+        Path(args["--output"]).write_text(json.dumps(results, indent=2))
+        print(f"Saved results to {args['--output']}")
+    if args["--baseline"]:
+        _check(args["--baseline"], results, tolerance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark of JSON encoding for large game states.
+
+Builds game states shaped like get_processed_game_state() results, with a growing number
+of profiles, and times how long it takes to encode them with the encoder Flask used before
+(the standard library with sorted keys) and with src.json_codec, on orjson when it is
+installed and on its standard library fallback.
+
+Usage:
+  json_encoding.py [--profiles=<list>] [--skills=<n>] [--repeat=<n>]
+
+Options:
+  --profiles=<list>  Comma-separated numbers of profiles per game state [default: 10,100,1000]
+  --skills=<n>       Number of skills and items per profile [default: 20]
+  --repeat=<n>       Number of encodings to time per game state [default: 20]
+"""
+
+import json
+import random
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from docopt import docopt
+from src import json_codec
+
+
+def make_game_state(profile_count, skill_count):
+    """Returns a game state with random XP and item counts, shaped like the real one."""
+    rng = random.Random(profile_count)
+    profiles = []
+    for i in range(profile_count):
+        skills = {}
+        for j in range(skill_count):
+            total_xp = rng.uniform(0, 1e6)
+            skills[f"skill{j}"] = {
+                "total_xp": total_xp, "level": int(total_xp ** 0.25), "current_xp": total_xp % 997,
+                "xp_to_next_level": rng.randint(100, 10000),
+            }
+        profiles.append({
+            "name": f"Profile {i}",
+            "data": {
+                "skills": skills,
+                "inventory": {f"item{j}": float(rng.randint(0, 5000)) for j in range(skill_count)},
+                "stats": {"strength": rng.randint(1, 99), "intelligence": rng.randint(1, 99),
+                          "dexterity": rng.randint(1, 99)},
+            },
+            "status": "ok",
+            "total_level": sum(skill["level"] for skill in skills.values()),
+        })
+    return {"profiles": profiles, "selected_profile_index": 0}
+
+
+def flask_default(state):
+    # What flask.jsonify did with the default provider outside debug mode
+    return json.dumps(state, separators=(",", ":"), sort_keys=True).encode()
+
+
+def codec(use_orjson):
+    def encode(state):
+        json_codec.USE_ORJSON = use_orjson
+        return json_codec.dumps(state, sort_keys=True)
+    return encode
+
+
+def time_per_call(encode, state, repeat):
+    encode(state)  # Warm up
+    start = perf_counter()
+    for _ in range(repeat):
+        encode(state)
+    return (perf_counter() - start) / repeat
+
+
+def main():
+    args = docopt(__doc__)
+    skill_count = int(args["--skills"])
+    repeat = int(args["--repeat"])
+
+    encoders = [("stdlib (before)", flask_default), ("json_codec stdlib", codec(False))]
+    if json_codec.orjson is not None:
+        encoders.append(("json_codec orjson", codec(True)))
+    else:
+        print("orjson is not installed; only the standard library fallback is measured")
+
+    print(f"{'Profiles':>9}{'Payload (KiB)':>15}" + "".join(f"{label + ' (ms)':>24}" for label, _ in encoders))
+    for profile_count in map(int, args["--profiles"].split(",")):
+        state = make_game_state(profile_count, skill_count)
+        expected = json.loads(flask_default(state))
+        timings = []
+        for _, encode in encoders:
+            # Every encoder must produce the same values, floats included
+            assert json.loads(encode(state)) == expected
+            timings.append(time_per_call(encode, state, repeat))
+        size = len(flask_default(state)) / 1024
+        print(f"{profile_count:>9}{size:>15.1f}" + "".join(f"{seconds * 1000:>24.2f}" for seconds in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark of the read-time cost of profile schema migrations.
+
+Profiles at the current schema version should cost no more to read with migrations
+enabled than without them. This times decoding stored profiles with and without the
+app's migration registry, both directly and as cold reads through a ProfileStore over a
+temporary profiles directory. For comparison, it also times the one-off upgrade of
+profiles stored before versioning. Exits with an error if reading current profiles with
+migrations is more than --max-overhead percent slower.
+
+Usage:
+  profile_migrations.py [--profiles=<n>] [--skills=<n>] [--repeat=<n>] [--max-overhead=<pct>]
+
+Options:
+  --profiles=<n>        Number of stored profiles [default: 2000]
+  --skills=<n>          Number of skills and items per profile [default: 20]
+  --repeat=<n>          Number of timed passes over the profiles; the median is reported [default: 7]
+  --max-overhead=<pct>  Largest acceptable slowdown for current profiles, in percent [default: 5]
+"""
+
+import random
+import sys
+import tempfile
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from docopt import docopt
+from src import json_codec
+from src.profile_manager import PROFILE_MIGRATIONS
+from src.profile_store import ProfileStore, decode_profile
+from src.storage import JsonDirectoryBackend
+
+
+def make_profile_texts(count, size, schema_version):
+    """Returns stored forms of random profiles, as the store writes them."""
+    rng = random.Random(count)
+    texts = []
+    for _ in range(count):
+        data = {
+            "skills": {f"skill{i}": rng.uniform(0, 1e6) for i in range(size)},
+            "inventory": {f"item{i}": float(rng.randint(0, 1000)) for i in range(size)},
+        }
+        if schema_version is not None:
+            data["schema_version"] = schema_version
+        texts.append(json_codec.dumps(data).decode())
+    return texts
+
+
+def time_passes(run, repeat):
+    run()  # Warm up
+    seconds = []
+    for _ in range(repeat):
+        start = perf_counter()
+        run()
+        seconds.append(perf_counter() - start)
+    return median(seconds)
+
+
+def time_decoding(texts, migrations, repeat):
+    def run():
+        for text in texts:
+            decode_profile(text, None, migrations)
+    return time_passes(run, repeat)
+
+
+def time_store_reads(directory, names, migrations, repeat):
+    """Times reading every profile through a new store, so none are cached yet."""
+    def run():
+        store = ProfileStore(JsonDirectoryBackend(directory), migrations=migrations)
+        for name in names:
+            store.get(name)
+        store.stop()
+    return time_passes(run, repeat)
+
+
+def report(label, count, without, with_migrations):
+    overhead = (with_migrations / without - 1) * 100
+    print(f"{label:<26}{without / count * 1e6:>12.2f}{with_migrations / count * 1e6:>12.2f}{overhead:>+11.1f}%")
+    return overhead
+
+
+def main():
+    args = docopt(__doc__)
+    count, size, repeat = int(args["--profiles"]), int(args["--skills"]), int(args["--repeat"])
+    max_overhead = float(args["--max-overhead"])
+    current = make_profile_texts(count, size, PROFILE_MIGRATIONS.version)
+    unversioned = make_profile_texts(count, size, None)
+
+    print(f"{count} profiles with {size} skills and items, schema version {PROFILE_MIGRATIONS.version}")
+    print(f"{'Read':<26}{'us plain':>12}{'us migrate':>12}{'overhead':>12}")
+    overheads = [report("decode, current", count, time_decoding(current, None, repeat),
+                        time_decoding(current, PROFILE_MIGRATIONS, repeat))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        names = [f"profile{i}" for i in range(count)]
+        JsonDirectoryBackend(directory).save_many(list(zip(names, current)))
+        overheads.append(report("store cold read, current", count, time_store_reads(directory, names, None, repeat),
+                                time_store_reads(directory, names, PROFILE_MIGRATIONS, repeat)))
+
+    # Not held to the limit: each old profile is upgraded once, then written back on its next change
+    report("decode, unversioned", count, time_decoding(unversioned, None, repeat),
+           time_decoding(unversioned, PROFILE_MIGRATIONS, repeat))
+
+    if max(overheads) > max_overhead:
+        print(f"FAIL: reading current profiles is {max(overheads):.1f}% slower with migrations "
+              f"(limit {max_overhead:g}%)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
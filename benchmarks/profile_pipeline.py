@@ -0,0 +1,95 @@
+"""
+Benchmark of the per-action profile pipeline.
+
+Performs actions through profile_manager.handle_action, the path behind POST /api/action,
+against profiles stored in a temporary directory: reading the profile from the store,
+checking and applying the action, storing the changed profile and building the response.
+Reports the time and the peak memory allocated per action, for full game state responses
+and for delta responses.
+
+Usage:
+  profile_pipeline.py [--iterations=<n>] [--skills=<n>] [--backend=<name>] [--journal]
+
+Options:
+  --iterations=<n>  Number of actions to time per response kind [default: 5000]
+  --skills=<n>      Extra skills and items added to the benchmark profile [default: 0]
+  --backend=<name>  Profile backend, json or sqlite [default: json]
+  --journal         Journal each change, as with PROFILE_JOURNAL=1
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from docopt import docopt
+
+ACTION_ID = "gather-wood-button"
+
+
+def import_profile_manager(directory):
+    # Profiles and settings are stored relative to the working directory
+    os.chdir(directory)
+    from src import profile_manager
+    return profile_manager
+
+
+def measure(label, profile_manager, delta, iterations):
+    def step():
+        result = profile_manager.handle_action(ACTION_ID, delta=delta)
+        if "error" in result:
+            raise SystemExit(f"Action failed: {result['error']}")
+
+    for _ in range(min(iterations, 1000)):  # Warm up
+        step()
+
+    start = perf_counter()
+    for _ in range(iterations):
+        step()
+    seconds = perf_counter() - start
+
+    # Transient memory per action: how far each action pushes traced memory above its start
+    tracemalloc.start()
+    sample, transient = min(iterations, 2000), 0
+    for _ in range(sample):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        step()
+        transient += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    print(f"{label:<10}{seconds / iterations * 1e6:>14.2f}{transient / sample:>20.1f}")
+
+
+def main():
+    args = docopt(__doc__)
+    iterations = int(args["--iterations"])
+    size = int(args["--skills"])
+    os.environ["PROFILE_BACKEND"] = args["--backend"]
+    if args["--journal"]:
+        os.environ["PROFILE_JOURNAL"] = "1"
+
+    with tempfile.TemporaryDirectory() as directory:
+        profile_manager = import_profile_manager(directory)
+        name = profile_manager.get_selected_profile_name()
+        if size:
+            profile = profile_manager.get_profile(name)
+            profile_manager.write_profile(name, profile.model_copy(update={
+                "skills": {**profile.skills, **{f"skill{i}": 0.0 for i in range(size)}},
+                "inventory": {**profile.inventory, **{f"item{i}": 0.0 for i in range(size)}},
+            }))
+
+        print(f"{'Response':<10}{'us/action':>14}{'peak bytes/action':>20}")
+        measure("full", profile_manager, False, iterations)
+        measure("delta", profile_manager, True, iterations)
+        profile_manager.PROFILE_STORE.stop()
+        os.chdir(PROJECT_ROOT)
+
+
+if __name__ == "__main__":
+    main()
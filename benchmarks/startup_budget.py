@@ -0,0 +1,41 @@
+"""
+Cold-start budget check for the server.
+
+Profiles several cold starts and fails if the median total startup time exceeds the budget,
+so startup regressions are caught before deployment.
+
+Usage:
+  startup_budget.py [--budget=<seconds>] [--runs=<n>]
+
+Options:
+  --budget=<seconds>  Maximum median cold-start time [default: 1.0]
+  --runs=<n>          Number of cold starts to measure [default: 5]
+"""
+
+import sys
+from pathlib import Path
+from statistics import median
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from docopt import docopt
+from src.startup_profile import format_startup_report, run_startup_profile
+
+
+def main():
+    args = docopt(__doc__)
+    budget = float(args["--budget"])
+    reports = [run_startup_profile() for _ in range(int(args["--runs"]))]
+    reports.sort(key=lambda report: report["total_seconds"])
+    typical = reports[len(reports) // 2]
+    total = median(report["total_seconds"] for report in reports)
+
+    print(format_startup_report(typical))
+    print()
+    print(f"Median cold start: {total * 1000:.1f} ms (budget {budget * 1000:.1f} ms)")
+    if total > budget:
+        raise SystemExit(f"Cold start exceeds the budget by {(total - budget) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
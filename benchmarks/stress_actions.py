@@ -0,0 +1,133 @@
+"""
+Stress test for concurrent profile mutations.
+
+Starts workers that all perform the same action on the same profile through the Flask
+test client, then checks that no update was lost: every action must show up in the
+stored XP and inventory. Thread workers share one server process. Process workers each
+import their own copy of the app against the same storage, with SHARED_PROFILE_STORAGE
+enabled so they coordinate through file locks. Runs in a temporary directory.
+
+Usage:
+  stress_actions.py [--threads=<n>] [--processes=<n>] [--actions=<n>] [--backend=<name>]
+
+Options:
+  --threads=<n>     Worker threads per process [default: 8]
+  --processes=<n>   Worker processes; 0 runs the threads in this process [default: 0]
+  --actions=<n>     Actions performed by each thread [default: 200]
+  --backend=<name>  Profile backend, json or sqlite [default: json]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+from pathlib import Path
+from threading import Barrier, Thread
+from time import perf_counter
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from docopt import docopt
+
+from src.journal import ProfileJournal, replay
+
+ACTION_ID = "gather-wood-button"
+
+
+def import_app(directory):
+    # The app resolves its data paths relative to the working directory
+    os.chdir(directory)
+    import app
+    from src import profile_manager
+    return app.app, profile_manager
+
+
+def run_threads(flask_app, threads, actions):
+    """Performs actions from several threads at once and returns the number of errors."""
+    barrier = Barrier(threads)
+    errors = []
+
+    def worker():
+        client = flask_app.test_client()
+        barrier.wait()
+        for _ in range(actions):
+            response = client.post("/api/action", json={"action_id": ACTION_ID, "delta": True})
+            if response.status_code != 200:
+                errors.append(response.get_data(as_text=True))
+
+    workers = [Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(errors)
+
+
+def process_worker(directory, threads, actions, start_event):
+    flask_app, profile_manager = import_app(directory)
+    start_event.wait()
+    errors = run_threads(flask_app, threads, actions)
+    profile_manager.PROFILE_STORE.stop()
+    sys.exit(1 if errors else 0)
+
+
+def main():
+    args = docopt(__doc__)
+    threads = int(args["--threads"])
+    processes = int(args["--processes"])
+    actions = int(args["--actions"])
+    os.environ["PROFILE_BACKEND"] = args["--backend"]
+    if processes:
+        os.environ["SHARED_PROFILE_STORAGE"] = "1"
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Create the profile up front so every worker starts from the same state
+        flask_app, profile_manager = import_app(directory)
+        profile_name = profile_manager.get_selected_profile_name()
+        profile_manager.PROFILE_STORE.flush()
+
+        start = perf_counter()
+        if processes:
+            context = multiprocessing.get_context("spawn")
+            start_event = context.Event()
+            workers = [
+                context.Process(target=process_worker, args=(directory, threads, actions, start_event))
+                for _ in range(processes)
+            ]
+            for process in workers:
+                process.start()
+            start_event.set()
+            for process in workers:
+                process.join()
+            errors = sum(process.exitcode != 0 for process in workers)
+            total = processes * threads * actions
+        else:
+            errors = run_threads(flask_app, threads, actions)
+            total = threads * actions
+        seconds = perf_counter() - start
+
+        # Read the result back from storage rather than from this process's cache
+        profile_manager.PROFILE_STORE.stop()
+        text = profile_manager.create_profile_backend().load(profile_name)
+        records = ProfileJournal(profile_manager.PROFILE_JOURNAL_DIR).read(profile_name) \
+            if profile_manager.PROFILE_JOURNAL else []
+        profile = replay(text, records)
+        action = profile_manager.get_action_table()[ACTION_ID]
+        (item, quantity), = action.outputs
+        xp = profile["skills"][action.skill]
+        items = profile["inventory"][item]
+        os.chdir(PROJECT_ROOT)
+
+    expected_xp, expected_items = total * action.xp, total * quantity
+    print(f"{total} actions in {seconds:.2f}s ({total / seconds:.0f} actions/s), {errors} failed workers/requests")
+    print(f"{action.skill} XP: {xp:g} (expected {expected_xp:g})")
+    print(f"{item}: {items:g} (expected {expected_items:g})")
+    if errors or xp != expected_xp or items != expected_items:
+        print("Lost updates detected")
+        sys.exit(1)
+    print("No lost updates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+The action table: every player action, compiled once from content/actions into an
+immutable mapping, so performing an action is a dict lookup plus a few additions.
+
+An action grants XP in one skill and adds its outputs to the inventory. An action that
+names a recipe also consumes the recipe's ingredients and adds its result. Requirements
+are minimum skill levels, compiled to minimum total XP so checking them needs no level
+lookup. References to items and recipes are checked at compile time; an action that
+fails the check is logged and left out of the table.
+
+Actions with a duration can also run as idle actions, repeating once per duration while
+the player is away. Their progress is accrued in closed form from the elapsed time when
+the profile is next loaded, so an offline profile costs nothing in the meantime.
+"""
+
+import logging
+from collections import Counter
+from math import floor
+from types import MappingProxyType
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledAction(NamedTuple):
+    id: str
+    skill: str
+    xp: float
+    outputs: tuple  # (item ID, quantity) pairs added to the inventory
+    inputs: tuple  # (item ID, quantity) pairs removed from the inventory
+    requirements: tuple  # (skill, level, minimum total XP) triples
+    duration: float | None  # Seconds per idle repetition; None if the action cannot run idle
+    # The "recent_gain" reported to clients for one action. Shared, so treat as read-only.
+    summary: dict
+
+
+def _compile_action(action, recipes, items, xp_for_level):
+    outputs = Counter()
+    for output in action.outputs:
+        outputs[output.item] += output.quantity
+    inputs = Counter()
+    if action.recipe is not None:
+        recipe = recipes.get(action.recipe)
+        if recipe is None:
+            raise ValueError(f"unknown recipe {action.recipe!r}")
+        inputs.update(recipe.ingredients)
+        outputs[recipe.result] += 1
+
+    for item in outputs.keys() | inputs.keys():
+        if item not in items:
+            raise ValueError(f"unknown item {item!r}")
+
+    net = Counter(outputs)
+    net.subtract(inputs)
+    primary_item, primary_quantity = next(iter(outputs.items()), (None, 0))
+    return CompiledAction(
+        id=action.id,
+        skill=action.skill,
+        xp=float(action.xp),
+        outputs=tuple((item, float(quantity)) for item, quantity in outputs.items()),
+        inputs=tuple((item, float(quantity)) for item, quantity in inputs.items()),
+        requirements=tuple(
+            (skill, level, float(xp_for_level(level))) for skill, level in action.requirements.items()),
+        duration=None if action.duration is None else float(action.duration),
+        summary={
+            "skill": action.skill,
+            "xp": float(action.xp),
+            # The first output, for clients that only show one item per action
+            "item": primary_item,
+            "quantity": float(primary_quantity),
+            "items": {item: float(quantity) for item, quantity in net.items() if quantity},
+        },
+    )
+
+
+def compile_actions(actions, recipes, items, xp_for_level):
+    """
+    Compiles validated Action models into a read-only mapping of action ID to
+    CompiledAction. xp_for_level(level) returns the total XP needed to reach a level.
+    """
+    table = {}
+    for action_id, action in actions.items():
+        try:
+            table[action_id] = _compile_action(action, recipes, items, xp_for_level)
+        except ValueError as error:
+            logger.warning("Skipping action %r: %s", action_id, error)
+    return MappingProxyType(table)
+
+
+def check_action(action, skills, inventory, count=1):
+    """Returns why the action cannot be performed count times, or None if it can."""
+    for skill, level, min_xp in action.requirements:
+        if skills.get(skill, 0.0) < min_xp:
+            return f"Requires {skill} level {level}"
+    for item, quantity in action.inputs:
+        if inventory.get(item, 0.0) < quantity * count:
+            return f"Not enough {item}"
+    return None
+
+
+def apply_action(skills, inventory, action, count=1):
+    """Applies an action, repeated count times, to skills and inventory dicts in place."""
+    skills[action.skill] = skills.get(action.skill, 0.0) + action.xp * count
+    for item, quantity in action.inputs:
+        inventory[item] = inventory.get(item, 0.0) - quantity * count
+    for item, quantity in action.outputs:
+        inventory[item] = inventory.get(item, 0.0) + quantity * count
+
+
+def idle_repetitions(action, inventory, elapsed):
+    """
+    Returns how many repetitions of an idle action complete in elapsed seconds, limited
+    by the ingredients in the inventory, and whether the ingredients ran out.
+    """
+    count = floor(max(elapsed, 0.0) / action.duration)
+    for item, quantity in action.inputs:
+        affordable = floor(inventory.get(item, 0.0) / quantity)
+        if affordable < count:
+            return affordable, True
+    return count, False
@@ -0,0 +1,358 @@
+"""
+ASGI entry point, served by `app.py --asgi` or by any ASGI server, e.g. `uvicorn src.asgi:app`.
+
+Requests are received and answered on the event loop, while profile, settings and static
+file I/O runs in a thread pool through the *_async variants in profile_manager. A slow
+client then only holds a coroutine while its request trickles in, not a worker thread.
+The API matches the Flask app in app.py.
+"""
+
+import logging
+from asyncio import FIRST_COMPLETED, ensure_future, gather, to_thread, wait
+from time import perf_counter
+from urllib.parse import parse_qs
+
+from . import json_codec, metrics, profile_manager
+from .http_cache import STATIC_ASSETS, etag_matches
+from .tenants import new_session_id, session_cookie, session_id_from_cookies
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Request:
+    __slots__ = ("data", "client", "headers", "query")
+
+    def __init__(self, data, client, headers, query):
+        self.data = data
+        self.client = client
+        self.headers = headers  # Lowercase header name -> value
+        self.query = query  # Query parameter -> first value
+
+
+def _json_bytes(data):
+    # Same output as the Flask app's JSON provider
+    return json_codec.dumps(data, sort_keys=True) + b"\n"
+
+
+async def _result(result):
+    result = await result
+    return (400 if "error" in result else 200), result
+
+
+# --- API Endpoints ---
+async def get_game_state(request):
+    etag = await profile_manager.get_game_state_etag_async()
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return 304, b"", headers
+    state = await profile_manager.get_processed_game_state_async()
+    idle_pending = await profile_manager.get_pending_idle_gain_async()
+    if idle_pending:
+        state["idle_pending"] = idle_pending
+    return 200, state, headers
+
+
+async def migrate_profile(request):
+    return 501, {"error": "Migration feature is no longer supported."}
+
+
+async def fix_profile(request):
+    return await _result(profile_manager.fix_profile_async(request.data.get("index")))
+
+
+async def handle_action(request):
+    action_id = request.data.get("action_id")
+    if not action_id:
+        return 400, {"error": "No action ID provided"}
+    return await _result(profile_manager.handle_action_async(action_id, delta=bool(request.data.get("delta"))))
+
+
+async def handle_action_batch(request):
+    return await _result(profile_manager.handle_actions_async(
+        request.data.get("actions"), delta=bool(request.data.get("delta"))))
+
+
+async def start_idle_action(request):
+    action_id = request.data.get("action_id")
+    if not action_id:
+        return 400, {"error": "No action ID provided"}
+    return await _result(profile_manager.start_idle_action_async(action_id))
+
+
+async def settle_idle_action(request):
+    return 200, await profile_manager.settle_idle_action_async()
+
+
+async def stop_idle_action(request):
+    return await _result(profile_manager.stop_idle_action_async())
+
+
+async def new_profile(request):
+    return await _result(profile_manager.new_profile_async(request.data.get("name")))
+
+
+async def select_profile(request):
+    return await _result(profile_manager.select_profile_async(request.data.get("index")))
+
+
+async def rename_profile(request):
+    return await _result(profile_manager.rename_profile_async(request.data.get("name")))
+
+
+async def delete_profile(request):
+    return await _result(profile_manager.delete_profile_async())
+
+
+async def reset_profile(request):
+    return await _result(profile_manager.reset_profile_async())
+
+
+async def hard_reset(request):
+    return await _result(profile_manager.hard_reset_async())
+
+
+async def get_settings(request):
+    return 200, await profile_manager.get_settings_async()
+
+
+async def set_settings(request):
+    if not request.data:
+        return 400, {"error": "No settings provided"}
+    await profile_manager.set_settings_async(request.data)
+    return 200, {"success": True, **request.data}
+
+
+async def get_leaderboard(request):
+    if profile_manager.MULTI_TENANT:
+        return 404, {"error": "Leaderboards are disabled with MULTI_TENANT=1, where each session only has its own profiles."}
+    try:
+        limit = int(request.query.get("limit", 10))
+        offset = int(request.query.get("offset", 0))
+    except ValueError:
+        return 400, {"error": "Limit and offset must be integers"}
+    return await _result(profile_manager.get_leaderboard_async(
+        request.query.get("board", profile_manager.TOTAL_LEVEL_BOARD), limit, offset, request.query.get("name")))
+
+
+async def get_metrics(request):
+    if not metrics.METRICS_ENABLED:
+        return 404, {"error": "Metrics are disabled. Set METRICS_ENABLED=1 to enable them."}
+    if request.client not in ("127.0.0.1", "::1"):
+        return 403, {"error": "Metrics are only available locally"}
+    return 200, metrics.render_prometheus()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_events(scope, receive, send, extra_headers=()):
+    """Streams game state changes as Server-Sent Events, like the Flask /api/events route."""
+    last_event_id = dict(scope["headers"]).get(b"last-event-id", b"").decode()
+    if not last_event_id:
+        last_event_id = parse_qs(scope["query_string"].decode()).get("cursor", [None])[0]
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            *extra_headers,
+        ],
+    })
+    if scope["method"] == "HEAD":
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    async def forward_events():
+        feed = profile_manager.STATE_FEED
+        async for text in feed.stream_async(last_event_id, end_when_idle=profile_manager.in_guest_tenant()):
+            await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+        # Reached only when the feed ends the stream, see profile_manager.in_guest_tenant
+        await send({"type": "http.response.body", "body": b""})
+
+    # Waiting for events does not hold a thread, so the stream ends as soon as the client leaves
+    tasks = [ensure_future(forward_events()), ensure_future(_wait_for_disconnect(receive))]
+    await wait(tasks, return_when=FIRST_COMPLETED)
+    for task in tasks:
+        task.cancel()
+    await gather(*tasks, return_exceptions=True)
+
+
+# (method, path) -> (handler, whether the handler reads a JSON body)
+ROUTES = {
+    ("GET", "/api/game-state"): (get_game_state, False),
+    ("POST", "/api/profile/migrate"): (migrate_profile, False),
+    ("POST", "/api/profile/fix"): (fix_profile, True),
+    ("POST", "/api/action"): (handle_action, True),
+    ("POST", "/api/action/batch"): (handle_action_batch, True),
+    ("POST", "/api/idle/start"): (start_idle_action, True),
+    ("POST", "/api/idle/settle"): (settle_idle_action, False),
+    ("POST", "/api/idle/stop"): (stop_idle_action, False),
+    ("POST", "/api/profile/new"): (new_profile, True),
+    ("POST", "/api/profile/select"): (select_profile, True),
+    ("PUT", "/api/profile/rename"): (rename_profile, True),
+    ("DELETE", "/api/profile/delete"): (delete_profile, False),
+    ("POST", "/api/profile/reset"): (reset_profile, False),
+    ("POST", "/api/hard-reset"): (hard_reset, False),
+    ("GET", "/api/settings"): (get_settings, False),
+    ("POST", "/api/settings"): (set_settings, True),
+    ("GET", "/api/leaderboard"): (get_leaderboard, False),
+    ("GET", "/api/metrics"): (get_metrics, False),
+}
+ROUTE_PATHS = {path for _, path in ROUTES} | {"/api/events"}
+
+
+# --- Static File Serving ---
+async def send_static_file(path, headers):
+    """Serves index.html for "/" and other static files from memory, precompressed."""
+    # Assets are re-read in a worker thread when files change on disk
+    response = await to_thread(
+        STATIC_ASSETS.response, path.lstrip("/"), headers.get("accept-encoding"), headers.get("if-none-match"))
+    if response is None:
+        return 404, {"error": "Not found"}
+    status, response_headers, body = response
+    return status, body, response_headers
+
+
+# --- ASGI Application ---
+async def _read_body(receive):
+    """Returns the request body, or None if the client disconnected first."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _dispatch(scope, receive):
+    """
+    Returns the endpoint name, status, payload and extra headers for a request, or None
+    if the client disconnected.
+    """
+    method, path = scope["method"], scope["path"]
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+    route = ROUTES.get((method, path))
+    if route is None and method == "HEAD":
+        # Answered like GET, and _respond leaves out the body
+        route = ROUTES.get(("GET", path))
+    if route is None:
+        if path in ROUTE_PATHS:
+            return path, 405, {"error": "Method not allowed"}, {}
+        if method in ("GET", "HEAD") and not path.startswith("/api/"):
+            return ("/" if path == "/" else "/<path:path>"), *_with_headers(await send_static_file(path, headers))
+        return "unmatched", 404, {"error": "Not found"}, {}
+
+    handler, reads_body = route
+    data = None
+    if reads_body:
+        body = await _read_body(receive)
+        if body is None:
+            return None
+        try:
+            data = json_codec.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return path, 400, {"error": "Request body must be a JSON object"}, {}
+    client = scope.get("client")
+    query = {name: values[0] for name, values in parse_qs(scope.get("query_string", b"").decode()).items()}
+    try:
+        result = await handler(Request(data, client[0] if client else None, headers, query))
+    except Exception:
+        logger.exception("Error handling %s %s", method, path)
+        result = 500, {"error": "Internal server error"}
+    return path, *_with_headers(result)
+
+
+def _with_headers(result):
+    """Normalizes a handler's (status, payload[, headers]) result to include headers."""
+    return result if len(result) == 3 else (*result, {})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Hash and precompress static assets and compile the action table before the first request
+            await to_thread(STATIC_ASSETS.load)
+            await to_thread(profile_manager.get_action_table)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Persist every tenant's write-behind profile and settings changes before the server exits
+            await to_thread(profile_manager.close_tenants)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _session(scope):
+    """
+    Returns the request's session ID, or None without multi-tenancy, and the Set-Cookie
+    header to send if the session is new.
+    """
+    if not profile_manager.MULTI_TENANT:
+        return None, ()
+    cookie_header = b"; ".join(value for name, value in scope["headers"] if name == b"cookie")
+    session_id = session_id_from_cookies(cookie_header.decode("latin-1"))
+    if session_id is not None:
+        return session_id, ()
+    session_id = new_session_id()
+    return session_id, ((b"set-cookie", session_cookie(session_id).encode("latin-1")),)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    session_id, cookie_headers = _session(scope)
+    if not scope["path"].startswith("/api/"):
+        await _respond(scope, receive, send, cookie_headers)
+        return
+    # API requests run against the session's tenant, which stays loaded until they finish
+    read_only = scope["method"] in ("GET", "HEAD")
+    async with profile_manager.tenant_session_async(session_id, read_only):
+        if scope["path"] == "/api/events" and read_only:
+            await stream_events(scope, receive, send, cookie_headers)
+        else:
+            await _respond(scope, receive, send, cookie_headers)
+
+
+async def _respond(scope, receive, send, extra_headers=()):
+    start = perf_counter()
+    dispatched = await _dispatch(scope, receive)
+    if dispatched is None:
+        return
+    endpoint, status, payload, headers = dispatched
+
+    # Payloads are JSON dicts, Prometheus text, or bytes with their own Content-Type header
+    if isinstance(payload, dict):
+        headers = {"Content-Type": "application/json", **headers}
+        body = _json_bytes(payload)
+    elif isinstance(payload, str):
+        headers = {"Content-Type": PROMETHEUS_CONTENT_TYPE, **headers}
+        body = payload.encode()
+    else:
+        body = payload
+    if status != 304:
+        headers["Content-Length"] = str(len(body))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            *((name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()),
+            *extra_headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+    if metrics.METRICS_ENABLED:
+        metrics.observe_request(endpoint, scope["method"], status, perf_counter() - start)
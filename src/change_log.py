@@ -0,0 +1,97 @@
+"""
+A log of the profiles changed by the processes sharing a store.
+
+Each write appends the names of the profiles it changed, one JSON string per line, while
+holding a file lock on the log. A process remembers its position in the log, and on its
+next check reads only the names appended since, so finding out what other processes
+changed costs one stat when nothing did, however many profiles there are.
+
+Once the log reaches max_bytes, the next append replaces it with an empty one. A reader
+whose position is in a replaced log is told that what changed cannot be known.
+"""
+
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where appends are not serialized
+    fcntl = None
+
+from . import json_codec
+from .file_utils import atomic_write_bytes
+
+
+class ChangeLog:
+    def __init__(self, path: Path, max_bytes: int = 1 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _open_locked(self):
+        """Opens the log for appending and locks it, retrying if it is replaced meanwhile."""
+        while True:
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            except FileNotFoundError:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                continue
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+
+    def append(self, names):
+        """
+        Records that the named profiles changed. Returns the positions of the log before
+        and after the records.
+        """
+        data = b"".join(json_codec.dumps(name) + b"\n" for name in names)
+        fd = self._open_locked()
+        try:
+            stat = os.fstat(fd)
+            if stat.st_size >= self.max_bytes:
+                atomic_write_bytes(self.path, b"")
+                os.close(fd)
+                fd = None
+                fd = self._open_locked()
+                stat = os.fstat(fd)
+            os.write(fd, data)
+        finally:
+            if fd is not None:
+                os.close(fd)
+        return (stat.st_ino, stat.st_size), (stat.st_ino, stat.st_size + len(data))
+
+    def changes_since(self, position):
+        """
+        Returns the current position of the log, and the names recorded after position
+        (None to start from nothing), or None instead of the names if they cannot be known.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # Nothing was ever recorded, unless the log has been removed
+            return None, set() if position is None else None
+        current = (stat.st_ino, stat.st_size)
+        if current == position:
+            return position, set()
+        if position is None or position[0] != stat.st_ino or position[1] > stat.st_size:
+            return current, None
+        try:
+            with open(self.path, "rb") as file:
+                if os.fstat(file.fileno()).st_ino != position[0]:
+                    return current, None
+                file.seek(position[1])
+                data = file.read(stat.st_size - position[1])
+        except FileNotFoundError:
+            return None, None
+        # A record still being appended is read on the next check
+        data = data[:data.rfind(b"\n") + 1]
+        names = {json_codec.loads(line) for line in data.splitlines()}
+        return (position[0], position[1] + len(data)), names
@@ -1,9 +1,25 @@
 import json
+import logging
+import pickle
+from hashlib import blake2b
 from pathlib import Path
+from threading import Lock
 from typing import Any
-from src.models import Recipe, Mob, ItemUnion
+
+from pydantic import ValidationError
+
+from src.file_utils import atomic_write_bytes
+from src.models import Action, Recipe, Mob, ItemAdapter
+
+logger = logging.getLogger(__name__)
 
 CONTENT_ROOT = Path(__file__).parent.parent / "content"
+CONTENT_CACHE_FILE = Path(__file__).parent.parent / "data" / "content_cache.pickle"
+# Bump when the compiled layout changes, so stale snapshots are ignored
+CONTENT_CACHE_VERSION = 3
+# Source files hashed into the snapshot fingerprint: the models the snapshot pickles, and
+# the action compiler that consumes them, so editing either invalidates it
+CONTENT_CACHE_SOURCES = (Path(__file__).parent / "models.py", Path(__file__).parent / "actions.py")
 
 
 def load_json_file(file_path: Path) -> Any:
@@ -11,58 +27,120 @@ def load_json_file(file_path: Path) -> Any:
         return json.load(f)
 
 
-def load_objects_recursively(directory: Path, model_cls, id_field: str = "id", filter_func=None) -> dict:
+def load_objects_recursively(directory: Path, validate, id_field: str = "id", filter_func=None) -> dict:
     """
-    Recursively load all JSON files in a directory, parse them as model_cls, and return a dict keyed by id_field.
+    Recursively load all JSON files in a directory, validate each entry with validate(entry),
+    and return a dict keyed by id_field. Entries that fail validation are skipped.
     Optionally filter objects with filter_func(obj) -> bool.
     """
     objects = {}
-    for path in directory.rglob("*.json"):
+    for path in sorted(directory.rglob("*.json")):
         data = load_json_file(path)
-        if isinstance(data, list):
-            for entry in data:
-                try:
-                    obj = model_cls(**entry)
-                    if not filter_func or filter_func(obj):
-                        objects[getattr(obj, id_field)] = obj
-                except Exception:
-                    continue
-        else:
+        for entry in data if isinstance(data, list) else [data]:
             try:
-                obj = model_cls(**data)
-                if not filter_func or filter_func(obj):
-                    objects[getattr(obj, id_field)] = obj
-            except Exception:
+                obj = validate(entry)
+            except ValidationError:
                 continue
+            if not filter_func or filter_func(obj):
+                objects[getattr(obj, id_field)] = obj
     return objects
 
 
-# Note: For ITEMS, we want to try all ItemUnion types. So we can define a wrapper function:
-def item_union_loader(data):
-    for cls in ItemUnion.__args__:
+class ContentRegistry:
+    """
+    Loads game content on first access and keeps it in memory.
+
+    The validated objects are also saved as a compiled snapshot keyed by the names, sizes
+    and modification times of the content files and a hash of the model sources, so later
+    starts with unchanged content and code load the snapshot instead of parsing and
+    validating every file.
+    """
+
+    def __init__(self, root: Path = CONTENT_ROOT, cache_file: Path = CONTENT_CACHE_FILE):
+        self.root = root
+        self.cache_file = cache_file
+        self._content = None
+        self._lock = Lock()
+
+    def _fingerprint(self):
+        files = []
+        for path in sorted(self.root.rglob("*.json")):
+            stat = path.stat()
+            files.append((path.relative_to(self.root).as_posix(), stat.st_mtime_ns, stat.st_size))
+        sources = blake2b(digest_size=16)
+        for path in CONTENT_CACHE_SOURCES:
+            sources.update(path.read_bytes())
+        return (CONTENT_CACHE_VERSION, sources.hexdigest(), tuple(files))
+
+    def _compile(self):
+        return {
+            "items": load_objects_recursively(self.root / "items", ItemAdapter.validate_python),
+            "recipes": load_objects_recursively(self.root / "recipes", Recipe.model_validate),
+            "mobs": load_objects_recursively(self.root / "mobs", Mob.model_validate),
+            "actions": load_objects_recursively(self.root / "actions", Action.model_validate),
+        }
+
+    def _read_snapshot(self, fingerprint):
         try:
-            return cls(**data)
+            with open(self.cache_file, "rb") as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return None
         except Exception:
-            continue
-    return None
-
-
-# Main loader using the general function
-ITEMS = load_objects_recursively(
-    CONTENT_ROOT / "items", ItemUnion.__args__, filter_func=None)  # See note below
-RECIPES = load_objects_recursively(CONTENT_ROOT / "recipes", Recipe)
-MOBS = load_objects_recursively(CONTENT_ROOT / "mobs", Mob)
-
-# Overwrite ITEMS with the correct loader
-ITEMS = {}
-for path in (CONTENT_ROOT / "items").rglob("*.json"):
-    data = load_json_file(path)
-    if isinstance(data, list):
-        for entry in data:
-            obj = item_union_loader(entry)
-            if obj:
-                ITEMS[obj.id] = obj
-    else:
-        obj = item_union_loader(data)
-        if obj:
-            ITEMS[obj.id] = obj
+            logger.warning("Ignoring unreadable content snapshot %s", self.cache_file)
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("fingerprint") != fingerprint:
+            return None
+        return snapshot["content"]
+
+    def _write_snapshot(self, fingerprint, content):
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(self.cache_file, pickle.dumps(
+                {"fingerprint": fingerprint, "content": content}, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            logger.warning("Could not save content snapshot %s", self.cache_file)
+
+    def load(self):
+        """Returns all content, loading it from the snapshot or the content files if needed."""
+        if self._content is None:
+            with self._lock:
+                if self._content is None:
+                    fingerprint = self._fingerprint()
+                    content = self._read_snapshot(fingerprint)
+                    if content is None:
+                        content = self._compile()
+                        self._write_snapshot(fingerprint, content)
+                    self._content = content
+        return self._content
+
+    def reload(self):
+        """Discards the loaded content so it is loaded again on next access."""
+        with self._lock:
+            self._content = None
+
+    @property
+    def items(self):
+        return self.load()["items"]
+
+    @property
+    def recipes(self):
+        return self.load()["recipes"]
+
+    @property
+    def mobs(self):
+        return self.load()["mobs"]
+
+    @property
+    def actions(self):
+        return self.load()["actions"]
+
+
+REGISTRY = ContentRegistry()
+
+
+def __getattr__(name):
+    # ITEMS, RECIPES, MOBS and ACTIONS are loaded on first access rather than at import time
+    if name in ("ITEMS", "RECIPES", "MOBS", "ACTIONS"):
+        return getattr(REGISTRY, name.lower())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,41 @@
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    Writes data to path so that readers see either the old or the new contents, never a mix.
+    The data goes to a temporary file in the same directory, is fsynced, then renamed into place.
+    """
+    with NamedTemporaryFile("wb", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp",
+                            delete=False) as tmp_file:
+        try:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        except BaseException:
+            tmp_file.close()
+            os.unlink(tmp_file.name)
+            raise
+    try:
+        os.replace(tmp_file.name, path)
+    except BaseException:
+        os.unlink(tmp_file.name)
+        raise
+
+
+def atomic_write_text(path: Path, text: str):
+    """Atomically writes UTF-8 text to path, see atomic_write_bytes."""
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def fsync_directory(path: Path):
+    """Makes the entries of a directory, such as files just created or renamed into it, durable."""
+    if not hasattr(os, "O_DIRECTORY"):  # Directories cannot be opened on Windows
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
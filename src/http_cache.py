@@ -0,0 +1,183 @@
+"""
+HTTP caching helpers shared by the Flask and ASGI apps.
+
+Static assets in src/ are read, hashed and precompressed (gzip, plus brotli when the
+brotli package is installed) once, and then served from memory. Each asset is also
+served under a content-hashed name (script.js -> script.1a2b3c4d5e6f.js) that may be
+cached for a year, and HTML pages are rewritten to reference the hashed names. Pages and
+unhashed names carry an ETag and are revalidated on every use.
+"""
+
+import gzip
+import mimetypes
+import posixpath
+import re
+from hashlib import blake2b
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; assets are then precompressed with gzip only
+    brotli = None
+
+STATIC_DIR = Path(__file__).parent
+# Only these files are served, since the directory also holds the server's modules
+STATIC_SUFFIXES = {
+    ".html", ".css", ".js", ".json", ".map", ".txt", ".svg", ".png", ".jpg", ".jpeg", ".gif",
+    ".webp", ".ico", ".woff", ".woff2", ".ttf",
+}
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Seconds between checks for edited files, so changes show up without a restart
+RECHECK_INTERVAL = 1.0
+
+# Relative src/href attribute values in HTML pages
+_REFERENCE = re.compile(r'(\b(?:src|href)=")([^"#?:]+)(")')
+
+
+def etag_matches(if_none_match, etag):
+    """Returns whether an If-None-Match header value matches an unquoted entity tag."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/").strip('"') == etag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding, available):
+    """Returns the best of "br", "gzip" and "identity" that is available and accepted."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+
+def _content_hash(data):
+    return blake2b(data, digest_size=6).hexdigest()
+
+
+def _hashed_path(path, data):
+    stem, suffix = posixpath.splitext(path)
+    return f"{stem}.{_content_hash(data)}{suffix}"
+
+
+class StaticAsset:
+    __slots__ = ("content_type", "etag", "bodies")
+
+    def __init__(self, path, data):
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.etag = _content_hash(data)
+        self.bodies = {"identity": data}  # Content-Encoding -> body
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                self.bodies["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    self.bodies["br"] = compressed
+
+
+class StaticAssets:
+    """Serves the static files in a directory from memory, precompressed and content-hashed."""
+
+    def __init__(self, directory: Path, recheck_interval: float = RECHECK_INTERVAL):
+        self.directory = directory
+        self.recheck_interval = recheck_interval
+        self._lock = Lock()
+        self._assets = {}  # URL path -> (StaticAsset, whether the path is content-hashed)
+        self._signature = None
+        self._checked_at = None
+
+    def _scan(self):
+        signature = []
+        for path in self.directory.rglob("*"):
+            if path.suffix.lower() in STATIC_SUFFIXES and path.is_file():
+                stat = path.stat()
+                signature.append((path.relative_to(self.directory).as_posix(), stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(signature))
+
+    def _build(self, signature):
+        sources = {path: (self.directory / path).read_bytes() for path, _, _ in signature}
+        hashed_paths = {
+            path: _hashed_path(path, data) for path, data in sources.items() if not path.endswith(".html")}
+
+        def hashed_reference(page, match):
+            reference = match.group(2)
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(page), reference))
+            if target not in hashed_paths:
+                return match.group(0)
+            hashed = reference[:len(reference) - len(posixpath.basename(reference))]
+            return match.group(1) + hashed + posixpath.basename(hashed_paths[target]) + match.group(3)
+
+        assets = {}
+        for path, data in sources.items():
+            if path.endswith(".html"):
+                text = _REFERENCE.sub(lambda match: hashed_reference(path, match), data.decode())
+                data = text.encode()
+            asset = StaticAsset(path, data)
+            assets[path] = (asset, False)
+            if path in hashed_paths:
+                assets[hashed_paths[path]] = (asset, True)
+        return assets
+
+    def load(self):
+        """Reads and precompresses every asset again if any file changed since the last check."""
+        with self._lock:
+            self._checked_at = monotonic()
+            signature = self._scan()
+            if signature != self._signature:
+                self._assets = self._build(signature)
+                self._signature = signature
+
+    def get(self, path):
+        """Returns (StaticAsset, whether path is content-hashed) for a URL path, or None."""
+        if self._checked_at is None or monotonic() - self._checked_at >= self.recheck_interval:
+            self.load()
+        return self._assets.get(path or "index.html")
+
+    def response(self, path, accept_encoding=None, if_none_match=None):
+        """
+        Returns (status, headers, body) for a GET of the asset at path, answering a matching
+        If-None-Match with 304, or None if there is no such asset.
+        """
+        entry = self.get(path)
+        if entry is None:
+            return None
+        asset, hashed = entry
+        encoding = choose_encoding(accept_encoding, asset.bodies)
+        # Each encoding is a different representation, so it needs its own tag
+        etag = asset.etag if encoding == "identity" else f"{asset.etag}-{encoding}"
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if hashed else REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(if_none_match, etag):
+            return 304, headers, b""
+        headers["Content-Type"] = asset.content_type
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return 200, headers, asset.bodies[encoding]
+
+
+STATIC_ASSETS = StaticAssets(STATIC_DIR)
@@ -0,0 +1,172 @@
+"""
+Append-only change journals for stored profiles.
+
+Each profile has a journal file of JSON lines next to its stored snapshot. A change to the
+profile appends one small record instead of rewriting the whole profile. A record sets
+the changed entries of the profile's fields ({"set": {...}}), or, when that cannot
+describe the change, holds the whole profile ({"put": {...}}). Records hold new values
+rather than increments, so replaying a journal over a snapshot that already includes some
+of its records gives the same result. A snapshot can therefore be written out before its
+journal is emptied, and a crash in between loses nothing.
+
+With `sync` set, each record is fsynced before append returns, so it survives a power
+loss as well as a crash of the process. Otherwise a record survives a process crash, but
+can be lost with the operating system's unwritten file data.
+
+Reading a profile replays its journal over the snapshot, starting from the last whole
+profile if the journal has one, so a journal can also stand in for a corrupt snapshot.
+A record cut short by a crash is skipped.
+"""
+
+import logging
+import os
+from hashlib import blake2b
+from pathlib import Path
+
+from . import json_codec
+from .file_utils import atomic_write_bytes, fsync_directory
+
+logger = logging.getLogger(__name__)
+
+
+def profile_record(old, new):
+    """
+    Returns the journal record that turns Profile old into Profile new, or None if they
+    are equal. old may be None when the previous state is not known.
+    """
+    if old is None:
+        return {"put": new.model_dump(mode="json")}
+    changes = {}
+    for field in type(new).model_fields:
+        old_value, new_value = getattr(old, field), getattr(new, field)
+        # Copies made with model_copy(update=...) share the fields they did not update
+        if old_value is new_value:
+            continue
+        if isinstance(new_value, dict) and isinstance(old_value, dict):
+            if old_value.keys() - new_value.keys():
+                return {"put": new.model_dump(mode="json")}
+            entries = {key: value for key, value in new_value.items()
+                       if key not in old_value or old_value[key] != value}
+            if entries:
+                changes[field] = entries
+        elif old_value != new_value:
+            changes[field] = new.model_dump(mode="json", include={field})[field]
+    return {"set": changes} if changes else None
+
+
+def replay(snapshot, records):
+    """
+    Applies journal records to a snapshot in serialized form. Returns the profile data as
+    a dict. Raises ValueError if the snapshot is needed and cannot be decoded.
+    """
+    last_put = next((index for index in range(len(records) - 1, -1, -1) if "put" in records[index]), None)
+    if last_put is None:
+        if snapshot is None:
+            raise ValueError("no stored snapshot")
+        data = json_codec.loads(snapshot)
+    else:
+        data = records[last_put]["put"]
+        records = records[last_put + 1:]
+    for record in records:
+        for field, value in record["set"].items():
+            current = data.get(field)
+            if isinstance(value, dict) and isinstance(current, dict):
+                data[field] = {**current, **value}
+            else:
+                data[field] = value
+    return data
+
+
+class ProfileJournal:
+    """Keeps one journal file per profile name in a directory, created with the first journal."""
+
+    def __init__(self, directory: Path, sync: bool = False):
+        self.directory = directory
+        self.sync = sync
+
+    def _path(self, name):
+        # Hashed, since profile names are not necessarily valid file names
+        return self.directory / (blake2b(name.encode(), digest_size=16).hexdigest() + ".jsonl")
+
+    def append(self, name, record):
+        """Appends a record to a profile's journal. Returns the journal's new size in bytes."""
+        line = json_codec.dumps(record) + b"\n"
+        path = self._path(name)
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            # Starts a new line after a record that a crash cut short, so only that one is lost
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                line = b"\n" + line
+            os.write(fd, line)
+            if self.sync:
+                os.fsync(fd)
+                if not size:
+                    # A new journal is only found again if its directory entry is durable too
+                    fsync_directory(self.directory)
+        finally:
+            os.close(fd)
+        return size + len(line)
+
+    def read(self, name):
+        """Returns the complete records in a profile's journal, oldest first."""
+        try:
+            data = self._path(name).read_bytes()
+        except FileNotFoundError:
+            return []
+        records = []
+        # The text after the last newline is a record still being written, or cut short
+        for line in data.split(b"\n")[:-1]:
+            if not line:
+                continue
+            try:
+                record = json_codec.loads(line)
+            except json_codec.JSONDecodeError:
+                logger.warning("Skipping a damaged record in the journal of profile %r", name)
+                continue
+            records.append(record)
+        return records
+
+    def size(self, name):
+        """Returns the size of a profile's journal in bytes."""
+        try:
+            return self._path(name).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def stamp(self, name):
+        """Returns a value that changes whenever a profile's journal is appended to or emptied."""
+        try:
+            stat = self._path(name).stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def discard(self, name, size):
+        """Removes the first size bytes of a profile's journal, once a snapshot includes them."""
+        path = self._path(name)
+        try:
+            data = path.read_bytes() if path.stat().st_size > size else None
+        except FileNotFoundError:
+            return
+        if data is None:
+            path.unlink(missing_ok=True)
+        else:
+            atomic_write_bytes(path, data[size:])
+
+    def delete(self, name):
+        self._path(name).unlink(missing_ok=True)
+
+    def rename(self, old_name, new_name):
+        """Moves the journal of old_name to new_name, replacing any journal there."""
+        try:
+            os.replace(self._path(old_name), self._path(new_name))
+        except FileNotFoundError:
+            self.delete(new_name)
+            return
+        if self.sync:
+            fsync_directory(self.directory)
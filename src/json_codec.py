@@ -0,0 +1,81 @@
+"""
+JSON encoding for API responses and profile_manager file I/O.
+
+Uses orjson when it is installed and the standard library otherwise. Set JSON_LIBRARY to
+"json" to force the fallback. Both produce the same values: compact UTF-8 output, floats
+that keep their fraction or exponent (10.0, 1e-07), int and float subclasses such as NumPy
+scalars encoded as plain numbers, and non-finite floats, which JSON cannot represent,
+encoded as null like pydantic does. Profile values are validated to be finite, so they
+always round-trip exactly.
+"""
+
+import json
+import math
+import numbers
+from os import environ
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library encoder is used instead
+    orjson = None
+
+JSON_LIBRARY = environ.get("JSON_LIBRARY", "auto")
+USE_ORJSON = orjson is not None and JSON_LIBRARY != "json"
+
+# orjson.JSONDecodeError subclasses this too
+JSONDecodeError = json.JSONDecodeError
+
+
+def _default(obj):
+    if isinstance(obj, numbers.Integral):
+        return int(obj)
+    if isinstance(obj, numbers.Real):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _without_non_finite(obj):
+    """Returns obj with NaN and infinite floats replaced by None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _without_non_finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_without_non_finite(value) for value in obj]
+    return obj
+
+
+def _stdlib_dumps(obj, indent, sort_keys):
+    kwargs = {"indent": 2} if indent else {"separators": (",", ":")}
+    try:
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, sort_keys=sort_keys, default=_default, **kwargs)
+    except ValueError:
+        # Only raised for non-finite floats, which are rare enough to handle in a second pass
+        return json.dumps(
+            _without_non_finite(obj), ensure_ascii=False, sort_keys=sort_keys, default=_default, **kwargs)
+
+
+def dumps(obj, indent=False, sort_keys=False):
+    """Encodes obj as UTF-8 JSON bytes, indented by two spaces if indent is set."""
+    if USE_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+    return _stdlib_dumps(obj, indent, sort_keys).encode()
+
+
+def dumps_str(obj, indent=False, sort_keys=False):
+    """Encodes obj as a JSON string."""
+    if USE_ORJSON:
+        return dumps(obj, indent, sort_keys).decode()
+    return _stdlib_dumps(obj, indent, sort_keys)
+
+
+def loads(data):
+    """Decodes JSON from bytes or a string."""
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,113 @@
+"""
+A ranking index over all profiles, for leaderboards.
+
+Each board ranks profile names by a score, highest first. Boards stay sorted as scores
+change, so top-N and rank queries take logarithmic time instead of processing every
+profile. Uses sortedcontainers when it is installed; otherwise a plain sorted list, where
+updates cost a linear-time insert but queries are still logarithmic.
+"""
+
+from bisect import bisect_left, insort
+from threading import Lock
+
+try:
+    from sortedcontainers import SortedList
+except ImportError:  # sortedcontainers is optional; boards fall back to a bisected list
+    SortedList = None
+
+
+class _SortedKeys:
+    """The subset of sortedcontainers.SortedList used by Leaderboard."""
+    __slots__ = ("_keys",)
+
+    def __init__(self):
+        self._keys = []
+
+    def add(self, key):
+        insort(self._keys, key)
+
+    def remove(self, key):
+        del self._keys[bisect_left(self._keys, key)]
+
+    def bisect_left(self, key):
+        return bisect_left(self._keys, key)
+
+    def __getitem__(self, index):
+        return self._keys[index]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class Leaderboard:
+    """
+    Ranks names on any number of boards. Each name's scores are tagged with the store
+    version they were computed from, and older versions never replace newer ones, so
+    concurrent updates and rebuilds can arrive in any order.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._boards = {}  # board -> sorted (-score, name) keys
+        self._scores = {}  # name -> {board: score}
+        self._versions = {}  # name -> store version of its scores, kept after removal
+        self.ready = False  # Set once every profile has been indexed
+
+    def update(self, name, version, scores):
+        """Sets a name's scores, computed from the given store version. Empty scores unrank it."""
+        with self._lock:
+            if version < self._versions.get(name, -1):
+                return
+            self._versions[name] = version
+            old_scores = self._scores.pop(name, {})
+            for board, score in old_scores.items():
+                if scores.get(board) != score:
+                    self._boards[board].remove((-score, name))
+            for board, score in scores.items():
+                if old_scores.get(board) != score:
+                    keys = self._boards.get(board)
+                    if keys is None:
+                        keys = self._boards[board] = SortedList() if SortedList is not None else _SortedKeys()
+                    keys.add((-score, name))
+            if scores:
+                self._scores[name] = dict(scores)
+
+    def version(self, name):
+        """Returns the store version a name was last indexed at, or None if it never was."""
+        return self._versions.get(name)
+
+    def names(self):
+        """Returns every name that has been indexed, ranked or not."""
+        with self._lock:
+            return set(self._versions)
+
+    def boards(self):
+        """Returns the names of the boards that rank anyone."""
+        with self._lock:
+            return [board for board, keys in self._boards.items() if len(keys)]
+
+    def _entry(self, keys, key):
+        # Equal scores share a rank: one more than the number of higher scores
+        return {"rank": keys.bisect_left((key[0],)) + 1, "name": key[1], "score": -key[0]}
+
+    def top(self, board, count, offset=0):
+        """Returns the ranked entries from offset to offset + count on a board."""
+        with self._lock:
+            keys = self._boards.get(board)
+            if keys is None:
+                return []
+            return [self._entry(keys, key) for key in keys[offset:offset + count]]
+
+    def rank(self, board, name):
+        """Returns the ranked entry for a name on a board, or None if it is not ranked there."""
+        with self._lock:
+            score = self._scores.get(name, {}).get(board)
+            if score is None:
+                return None
+            return self._entry(self._boards[board], (-score, name))
+
+    def size(self, board):
+        """Returns the number of names ranked on a board."""
+        with self._lock:
+            keys = self._boards.get(board)
+            return 0 if keys is None else len(keys)
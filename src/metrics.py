@@ -0,0 +1,139 @@
+"""
+Optional request and hot-path instrumentation, exported in Prometheus text format.
+
+Enable with METRICS_ENABLED=1. When disabled, span() returns a shared no-op context
+manager and increment() returns immediately, so instrumented code pays only a function call.
+"""
+
+from bisect import bisect_left
+from contextlib import nullcontext
+from os import environ
+from threading import Lock
+from time import perf_counter
+
+METRICS_ENABLED = environ.get("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+METRIC_PREFIX = "number_sense"
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_lock = Lock()
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    """A cumulative latency histogram over LATENCY_BUCKETS."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+# Keyed by a tuple of label values
+_request_latency = {}  # (endpoint, method) -> Histogram
+_request_count = {}  # (endpoint, method, status) -> int
+_phase_latency = {}  # (phase,) -> Histogram
+_counters = {}  # counter name -> int
+
+
+def _observe(histograms, key, seconds):
+    with _lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+class _Span:
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _observe(_phase_latency, (self.phase,), perf_counter() - self.start)
+        return False
+
+
+def span(phase):
+    """Returns a context manager that records the time spent in a phase (read, validate, ...)."""
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return _Span(phase)
+
+
+def increment(counter, amount=1):
+    """Adds amount to a named counter, e.g. "profile_reads"."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _counters[counter] = _counters.get(counter, 0) + amount
+
+
+def observe_request(endpoint, method, status, seconds):
+    """Records the latency and status of a handled request."""
+    _observe(_request_latency, (endpoint, method), seconds)
+    with _lock:
+        key = (endpoint, method, status)
+        _request_count[key] = _request_count.get(key, 0) + 1
+
+
+def reset():
+    """Discards all recorded metrics."""
+    with _lock:
+        for mapping in (_request_latency, _request_count, _phase_latency, _counters):
+            mapping.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, **extra):
+    pairs = [*zip(names, values), *extra.items()]
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _render_histogram(lines, name, help_text, label_names, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(label_names, key, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(label_names, key)} {histogram.total}")
+        lines.append(f"{name}_count{_labels(label_names, key)} {histogram.count}")
+
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        _render_histogram(
+            lines, f"{METRIC_PREFIX}_request_duration_seconds", "Request latency by endpoint.",
+            ("endpoint", "method"), _request_latency)
+        name = f"{METRIC_PREFIX}_requests_total"
+        lines.append(f"# HELP {name} Handled requests by endpoint and status.")
+        lines.append(f"# TYPE {name} counter")
+        for key, count in sorted(_request_count.items()):
+            lines.append(f"{name}{_labels(('endpoint', 'method', 'status'), key)} {count}")
+        _render_histogram(
+            lines, f"{METRIC_PREFIX}_phase_duration_seconds", "Time spent per request phase.",
+            ("phase",), _phase_latency)
+        for counter, value in sorted(_counters.items()):
+            name = f"{METRIC_PREFIX}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
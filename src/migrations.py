@@ -0,0 +1,47 @@
+"""
+Schema migrations for stored profiles.
+
+Every stored profile records the schema version it was written at in `schema_version`;
+profiles from before versioning have none, which counts as version 0. Migration n upgrades
+the data of a profile from version n - 1 to version n. The profile store applies the
+pending migrations when it reads an older profile, and writes the upgraded profile back
+along with its next change, so a new version never needs a pass over every stored profile.
+"""
+
+
+class ProfileMigrations:
+    """An ordered registry of migrations. The current version is the number registered."""
+
+    def __init__(self):
+        self._steps = []  # The migration to version n is _steps[n - 1]
+
+    @property
+    def version(self):
+        return len(self._steps)
+
+    def migration(self, version):
+        """
+        Decorator registering a function as the migration to the given version, which must be
+        the next one. The function takes profile data as a dict and returns the upgraded
+        data without modifying its argument.
+        """
+        if version != self.version + 1:
+            raise ValueError(f"The next migration is to version {self.version + 1}, not {version}")
+
+        def register(step):
+            self._steps.append(step)
+            return step
+        return register
+
+    def is_current(self, version):
+        # Profiles written by a newer version of the app are left as they are
+        return version >= len(self._steps)
+
+    def upgrade(self, data):
+        """Returns profile data upgraded to the current version. data itself is not modified."""
+        version = data.get("schema_version", 0)
+        if self.is_current(version):
+            return data
+        for step in self._steps[version:]:
+            data = step(data)
+        return {**data, "schema_version": len(self._steps)}
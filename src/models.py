@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Union, Literal
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing import Annotated, List, Dict, Optional, Union, Literal
 
 
 class Item(BaseModel):
@@ -35,6 +35,9 @@ class Material(Item):
 
 ItemUnion = Union[Tool, Weapon, Armor, Material]
 
+# Validates an item straight into the ItemUnion member selected by its "type" field
+ItemAdapter = TypeAdapter(Annotated[ItemUnion, Field(discriminator="type")])
+
 
 class Recipe(BaseModel):
     id: str  # Changed from int to str
@@ -51,3 +54,24 @@ class Mob(BaseModel):
     stats: Optional[Dict[str, int]] = None
     drops: Optional[List[str]] = None  # List of item IDs as strings
     level: Optional[int] = None
+
+
+class ActionOutput(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)
+
+    item: str  # Item ID
+    quantity: float = Field(default=1, gt=0)
+
+
+class Action(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)
+
+    id: str  # Also the ID of the button that performs the action
+    name: str
+    skill: str  # Skill that gains the XP
+    xp: float = Field(default=0, ge=0)
+    outputs: List[ActionOutput] = Field(default_factory=list)
+    recipe: Optional[str] = None  # Recipe ID: consumes its ingredients and produces its result
+    requirements: Dict[str, Annotated[int, Field(ge=0)]] = Field(default_factory=dict)  # Skill -> minimum level
+    # Seconds per repetition when run as a timed, repeating idle action; None if click-only
+    duration: Optional[float] = Field(default=None, gt=0)
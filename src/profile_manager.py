@@ -1,25 +1,77 @@
-from copy import deepcopy
-from json import JSONDecodeError, dumps as json_dumps, loads as json_loads
-from math import floor
+from bisect import bisect_right
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from hashlib import blake2b
+from math import ceil, floor
+from os import environ
 from pathlib import Path
-
-from .profile_model import Profile
+from secrets import token_hex
+from threading import Lock, RLock
+from time import time
+
+from . import json_codec, metrics
+from .actions import apply_action, check_action, compile_actions, idle_repetitions
+from .content import REGISTRY
+from .file_utils import atomic_write_bytes
+from .journal import ProfileJournal
+from .leaderboard import Leaderboard
+from .migrations import ProfileMigrations
+from .profile_model import IdleAction, Profile
+from .profile_store import CorruptProfileError, ProfileStore
+from .skill_matrix import SkillColumns, SkillMatrix
+from .state_feed import StateFeed
+from .storage import JsonDirectoryBackend, MemoryBackend, SqliteBackend
+from .tenants import TenantCache, is_session_id, tenant_directory
 
 # --- Constants ---
 PROFILES_DIR = Path("profiles")
 SETTINGS_FILE = Path("data", "settings.json")
 INIT_PROFILE_FILE = Path("data", "init_profile.json")
+# Profile storage: "json" keeps one file per profile in PROFILES_DIR,
+# "sqlite" keeps all profiles in PROFILE_DB_FILE
+PROFILE_BACKEND = environ.get("PROFILE_BACKEND", "json")
+PROFILE_DB_FILE = Path("data", "profiles.db")
 BASE_XP = 100
 XP_GROWTH_RATE = 1.15
 ALL_STATS = ["strength", "intelligence", "dexterity"]
+# Write-behind settings: dirty profiles are flushed after this many seconds,
+# or as soon as this many profiles are waiting to be written.
+PROFILE_FLUSH_INTERVAL = float(environ.get("PROFILE_FLUSH_INTERVAL", 2.0))
+PROFILE_FLUSH_MAX_DIRTY = int(environ.get("PROFILE_FLUSH_MAX_DIRTY", 32))
+# Write profile files without indentation to reduce the bytes written per flush
+COMPACT_PROFILE_FILES = environ.get("COMPACT_PROFILE_FILES", "").lower() in ("1", "true", "yes")
+# Set when several server processes share the same profile storage. Profile locks then
+# also exclude other processes, and changes are written through immediately.
+SHARED_PROFILE_STORAGE = environ.get("SHARED_PROFILE_STORAGE", "").lower() in ("1", "true", "yes")
+PROFILE_LOCK_DIR = Path("data", "locks")
+# Set to append each profile change to a journal in PROFILE_JOURNAL_DIR instead of
+# rewriting the profile. A journal is folded into its profile once it reaches the size limit.
+PROFILE_JOURNAL = environ.get("PROFILE_JOURNAL", "").lower() in ("1", "true", "yes")
+PROFILE_JOURNAL_DIR = Path("data", "journal")
+PROFILE_JOURNAL_MAX_BYTES = int(environ.get("PROFILE_JOURNAL_MAX_BYTES", 32768))
+# Set to 0 to skip fsyncing each journal record. Records then survive a crash of the server,
+# but not a power loss or operating system crash before the OS writes them out.
+PROFILE_JOURNAL_SYNC = environ.get("PROFILE_JOURNAL_SYNC", "1").lower() in ("1", "true", "yes")
+# Longest absence credited to an idle action; progress beyond it is forfeited
+IDLE_MAX_SECONDS = float(environ.get("IDLE_MAX_SECONDS", 24 * 60 * 60))
+# Most entries accepted in one batch of actions, which is checked and applied under the profile's lock
+MAX_BATCH_ACTIONS = int(environ.get("MAX_BATCH_ACTIONS", 100))
+# Set to give every browser session its own profiles and settings, kept under TENANTS_DIR.
+# Otherwise all sessions share the profiles in PROFILES_DIR and the settings in SETTINGS_FILE.
+MULTI_TENANT = environ.get("MULTI_TENANT", "").lower() in ("1", "true", "yes")
+TENANTS_DIR = Path("data", "tenants")
+# Memory bounds: tenants kept loaded at once, and profiles kept decoded per tenant (0 for no limit)
+MAX_RESIDENT_TENANTS = int(environ.get("MAX_RESIDENT_TENANTS", 64))
+MAX_RESIDENT_PROFILES = int(environ.get("MAX_RESIDENT_PROFILES", 10000)) or None
 
 
 # --- Load Initial Data ---
 def load_initial_profile_template():
     """Loads the initial profile structure from the JSON file."""
     try:
-        return json_loads(INIT_PROFILE_FILE.read_text())
-    except (FileNotFoundError, JSONDecodeError):
+        return json_codec.loads(INIT_PROFILE_FILE.read_bytes())
+    except (FileNotFoundError, json_codec.JSONDecodeError):
         # Fallback to a hardcoded default if the file is missing or corrupt
         return {
             "skills": {"woodcutting": 0, "mining": 0, "foraging": 0},
@@ -33,15 +85,195 @@ ALL_SKILLS = list(INITIAL_PROFILE_TEMPLATE.get("skills", {}).keys())
 ALL_ITEMS = list(INITIAL_PROFILE_TEMPLATE.get("inventory", {}).keys())
 
 
+# --- Migrations ---
+# Stored profiles are upgraded to the latest version when read. To change the profile
+# schema, register a migration to the next version below. Adding skills or items to
+# init_profile.json also needs one: register add_initial_entries again for the next version.
+PROFILE_MIGRATIONS = ProfileMigrations()
+
+
+@PROFILE_MIGRATIONS.migration(1)
+def add_initial_entries(data):
+    """Adds the skills and items of the initial profile that a profile lacks, at their initial amounts."""
+    upgraded = dict(data)
+    for field in ("skills", "inventory"):
+        if isinstance(data.get(field), dict):
+            upgraded[field] = {**INITIAL_PROFILE_TEMPLATE.get(field, {}), **data[field]}
+    return upgraded
+
+
 # --- Initialization ---
-PROFILES_DIR.mkdir(exist_ok=True)
-SETTINGS_FILE.parent.mkdir(exist_ok=True)
+def create_profile_backend(profiles_dir=PROFILES_DIR, db_file=PROFILE_DB_FILE):
+    """Creates the profile storage backend selected by PROFILE_BACKEND."""
+    if PROFILE_BACKEND == "sqlite":
+        return SqliteBackend(db_file)
+    if PROFILE_BACKEND == "json":
+        return JsonDirectoryBackend(profiles_dir)
+    raise ValueError(f"Unknown profile backend '{PROFILE_BACKEND}'")
+
+
+class Tenant:
+    """
+    The profiles, settings and caches of one player. In multi-tenant mode each session has
+    its own tenant stored in directory; otherwise every session uses the default tenant.
+    An ephemeral tenant keeps everything in memory and is never written to disk.
+    """
+
+    def __init__(self, tenant_id, directory=None, ephemeral=False):
+        self.id = tenant_id
+        journal_dir = None
+        if ephemeral:
+            backend, lock_dir = MemoryBackend(), None
+            self.settings_file = None
+        elif directory is None:
+            backend = create_profile_backend(PROFILES_DIR, PROFILE_DB_FILE)
+            lock_dir, journal_dir = PROFILE_LOCK_DIR, PROFILE_JOURNAL_DIR
+            self.settings_file = SETTINGS_FILE
+        else:
+            # Nothing is created in directory until the tenant's first write
+            backend = create_profile_backend(directory / "profiles", directory / "profiles.db")
+            lock_dir, journal_dir = directory / "locks", directory / "journal"
+            self.settings_file = directory / "settings.json"
+        shared = SHARED_PROFILE_STORAGE and not ephemeral
+        self.store = ProfileStore(
+            backend, flush_interval=PROFILE_FLUSH_INTERVAL,
+            max_dirty=PROFILE_FLUSH_MAX_DIRTY, compact=COMPACT_PROFILE_FILES, shared=shared,
+            lock_dir=lock_dir, max_resident=MAX_RESIDENT_PROFILES,
+            journal=ProfileJournal(journal_dir, sync=PROFILE_JOURNAL_SYNC) if PROFILE_JOURNAL and journal_dir else None,
+            journal_max_bytes=PROFILE_JOURNAL_MAX_BYTES, migrations=PROFILE_MIGRATIONS)
+        # See the Settings Cache section
+        self.settings = None
+        self.settings_stamp = None
+        self.settings_dirty = False
+        self.settings_lock = RLock()
+        # Processed profiles keyed by name, least recently used first. See get_processed_profile.
+        self.processed_profiles = {}
+        # Mutations mark the feed changed; diffs are only computed while clients are streaming.
+        # Other processes sharing the storage do not notify this one, so streams poll for them.
+        self.state_feed = StateFeed(
+            self.bind(get_state_snapshot), poll_interval=1.0 if shared else None)
+        self.leaderboard = Leaderboard()
+        self.leaderboard_lock = Lock()
+        self.leaderboard_generation = None  # Store generation the index was last synced at
+        self.store.add_flush_hook(self.bind(flush_settings))
+
+    def bind(self, func):
+        """Wraps func to run with this tenant as the current one, e.g. in another thread."""
+        @wraps(func)
+        def run_in_tenant(*args, **kwargs):
+            token = _current_tenant.set(self)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_tenant.reset(token)
+        return run_in_tenant
+
+    def close(self):
+        """Writes out pending profile and settings changes and releases the storage."""
+        self.store.stop()
+
+
+_current_tenant = ContextVar("tenant", default=None)
+_default_tenant = None
+_guest_tenant = None
+_default_tenant_lock = Lock()
+TENANTS = TenantCache(lambda tenant_id: Tenant(tenant_id, tenant_directory(TENANTS_DIR, tenant_id)),
+                      MAX_RESIDENT_TENANTS)
+
+
+def get_default_tenant():
+    """Returns the tenant that uses PROFILES_DIR and SETTINGS_FILE, creating it on first use."""
+    global _default_tenant
+    if _default_tenant is None:
+        with _default_tenant_lock:
+            if _default_tenant is None:
+                _default_tenant = Tenant("default")
+    return _default_tenant
+
+
+def get_guest_tenant():
+    """
+    Returns the ephemeral tenant that serves read-only requests of sessions with nothing
+    stored yet. It holds the state a new session starts with, and is never written to disk.
+    """
+    global _guest_tenant
+    if _guest_tenant is None:
+        with _default_tenant_lock:
+            if _guest_tenant is None:
+                _guest_tenant = Tenant("guest", ephemeral=True)
+    return _guest_tenant
+
+
+def _tenant():
+    """Returns the tenant of the current session, or the default tenant outside of one."""
+    return _current_tenant.get() or get_default_tenant()
+
+
+def in_guest_tenant():
+    """
+    Returns whether the current session is served by the guest tenant. Its state streams
+    end once idle, so the client reconnects to its own tenant after its first change.
+    """
+    return _guest_tenant is not None and _current_tenant.get() is _guest_tenant
+
+
+def acquire_tenant(session_id, read_only=False):
+    """
+    Returns the tenant of a session, loaded and pinned in memory until release_tenant.
+    That is the default tenant unless MULTI_TENANT is set and session_id is valid.
+    Read-only requests for a session that has not stored anything get the guest tenant
+    instead, so requests that change nothing never create a tenant on disk.
+    """
+    if not (MULTI_TENANT and is_session_id(session_id)):
+        return get_default_tenant()
+    if read_only and session_id not in TENANTS and not tenant_directory(TENANTS_DIR, session_id).exists():
+        return get_guest_tenant()
+    return TENANTS.acquire(session_id)
+
+
+def release_tenant(tenant):
+    if tenant is not _default_tenant and tenant is not _guest_tenant:
+        TENANTS.release(tenant.id)
+
+
+@contextmanager
+def tenant_session(session_id, read_only=False):
+    """Makes a session's tenant the current one for the duration of a with block."""
+    tenant = acquire_tenant(session_id, read_only)
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+        release_tenant(tenant)
+
+
+def close_tenants():
+    """Writes out the pending changes of every loaded tenant and unloads the per-session ones."""
+    if _default_tenant is not None:
+        _default_tenant.store.flush()
+    TENANTS.close_all()
+
+
+def __getattr__(name):
+    # The current tenant's store, state feed and leaderboard index
+    if name == "PROFILE_STORE":
+        return _tenant().store
+    if name == "STATE_FEED":
+        return _tenant().state_feed
+    if name == "LEADERBOARD":
+        return _tenant().leaderboard
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # --- Data Validation & Defaults ---
+# Validated once at startup. Like every stored Profile it is shared and never mutated.
+DEFAULT_PROFILE = Profile.model_validate(PROFILE_MIGRATIONS.upgrade(INITIAL_PROFILE_TEMPLATE))
+
+
 def get_default_profile_data():
-    """Returns the default data for a single profile by copying the template, as a dict."""
-    return Profile(**deepcopy(INITIAL_PROFILE_TEMPLATE)).dict()
+    """Returns the default data for a single profile, as a dict."""
+    return DEFAULT_PROFILE.model_dump()
 
 
 def validate_profile_data(data):
@@ -49,7 +281,7 @@ def validate_profile_data(data):
     Performs a deep structural integrity check on a profile's data using the Profile model.
     """
     try:
-        Profile(**data)
+        Profile.model_validate(data)
         return True
     except Exception:
         return False
@@ -57,146 +289,368 @@ def validate_profile_data(data):
 
 # --- Profile & Settings I/O ---
 def get_profile_list():
-    """Returns a list of profile names from the profiles directory."""
-    return [p.stem for p in PROFILES_DIR.glob("*.json")]
+    """Returns a list of profile names from the profile store."""
+    return _tenant().store.names()
+
+
+def get_profile(profile_name):
+    """
+    Returns the validated Profile stored under profile_name, or None if there is none.
+    Raises CorruptProfileError if it cannot be decoded. The instance is shared, so
+    changes are made on a copy and stored with write_profile.
+    """
+    return _tenant().store.get(profile_name)
 
 
 def read_profile(profile_name):
-    """Reads and validates a single profile file, returning a Profile instance if valid."""
-    profile_file = PROFILES_DIR / f"{profile_name}.json"
-    if not profile_file.exists():
-        return None
+    """Reads a single profile as a dict, reporting whether it is valid."""
     try:
-        data = json_loads(profile_file.read_text())
-        if validate_profile_data(data):
-            profile_obj = Profile(**data)
-            return {"name": profile_name, "data": profile_obj.dict(), "status": "ok"}
-        else:
-            return {"name": profile_name, "data": get_default_profile_data(), "status": "corrupt"}
-    except (IOError, JSONDecodeError, Exception):
+        profile_obj = get_profile(profile_name)
+    except CorruptProfileError:
         return {"name": profile_name, "data": get_default_profile_data(), "status": "corrupt"}
+    if profile_obj is None:
+        return None
+    return {"name": profile_name, "data": profile_obj.model_dump(), "status": "ok"}
 
 
 def write_profile(profile_name, data):
-    """Writes data to a profile file, ensuring it is valid via the Profile model."""
-    profile_file = PROFILES_DIR / f"{profile_name}.json"
-    # Validate and convert to dict if needed
-    if not isinstance(data, dict):
-        data = data.dict() if hasattr(data, 'dict') else dict(data)
-    profile_obj = Profile(**data)
-    profile_file.write_text(json_dumps(profile_obj.dict(), indent=2))
+    """
+    Stores a profile in the profile store. Profile instances are stored as they are;
+    anything else is validated via the Profile model first.
+    """
+    if not isinstance(data, Profile):
+        with metrics.span("validate"):
+            data = Profile.model_validate(data)
+    _tenant().store.put(profile_name, data)
+    _tenant().state_feed.mark_changed()
+    _index_profile(profile_name, data)
+
+
+def delete_profile_data(profile_name):
+    """Removes a profile from the profile store."""
+    _tenant().store.delete(profile_name)
+    _tenant().state_feed.mark_changed()
+    _index_profile(profile_name, None)
+
+
+# --- Settings Cache ---
+# settings.json is decoded once and re-read only when it changes on disk. Changes are
+# applied in memory and written out atomically by the profile store's background writer,
+# so several updates in quick succession cost a single write. With shared storage they are
+# instead merged into the file and written at once, under a lock other processes take too.
+# The cache is kept per tenant, in Tenant.settings.
+def _get_settings_stamp(settings_file):
+    if settings_file is None:
+        # Ephemeral tenants keep their settings in memory only
+        return None
+    try:
+        stat = settings_file.stat()
+    except FileNotFoundError:
+        return None
+    # Atomic writes replace the file, so the inode changes even within one mtime tick
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def load_settings():
+    """Returns the cached settings dict, re-reading settings.json only if it changed on disk."""
+    tenant = _tenant()
+    with tenant.settings_lock:
+        if tenant.settings_dirty:
+            # Unsaved changes take precedence over whatever is on disk
+            return tenant.settings
+        stamp = _get_settings_stamp(tenant.settings_file)
+        if tenant.settings is None or stamp != tenant.settings_stamp:
+            settings = {}
+            if stamp is not None:
+                try:
+                    settings = json_codec.loads(tenant.settings_file.read_bytes())
+                    metrics.increment("settings_reads")
+                except (IOError, json_codec.JSONDecodeError):
+                    settings = {}
+            tenant.settings = settings if isinstance(settings, dict) else {}
+            tenant.settings_stamp = stamp
+        return tenant.settings
+
+
+def update_settings(changes):
+    """
+    Applies changes to the cached settings and schedules them to be written to disk. With
+    shared storage, they are merged into the settings on disk and written immediately.
+    """
+    tenant = _tenant()
+    # Held across the read and the write, so concurrent changes from other processes are kept
+    with tenant.store.settings_lock(), tenant.settings_lock:
+        settings = load_settings()
+        if all(settings.get(k, object()) == v for k, v in changes.items()):
+            return
+        tenant.settings = {**settings, **changes}
+        tenant.settings_dirty = True
+        if tenant.store.shared:
+            flush_settings()
+    if not tenant.store.shared:
+        tenant.store.schedule_flush()
+    if "selected_profile_name" in changes:
+        tenant.state_feed.mark_changed()
+
+
+def flush_settings():
+    """Writes pending settings changes to settings.json."""
+    tenant = _tenant()
+    with tenant.settings_lock:
+        if not tenant.settings_dirty or tenant.settings_file is None:
+            return
+        tenant.settings_file.parent.mkdir(parents=True, exist_ok=True)
+        with metrics.span("write"):
+            atomic_write_bytes(tenant.settings_file, json_codec.dumps(tenant.settings, indent=True))
+        metrics.increment("settings_writes")
+        tenant.settings_dirty = False
+        tenant.settings_stamp = _get_settings_stamp(tenant.settings_file)
+
+
+def clear_settings():
+    """Deletes settings.json and forgets any cached or pending settings."""
+    tenant = _tenant()
+    with tenant.store.settings_lock(), tenant.settings_lock:
+        if tenant.settings_file is not None:
+            tenant.settings_file.unlink(missing_ok=True)
+        tenant.settings, tenant.settings_stamp, tenant.settings_dirty = {}, None, False
+    tenant.state_feed.mark_changed()
 
 
 def get_selected_profile_name():
     """Gets the selected profile name from settings."""
-    if not SETTINGS_FILE.exists():
-        profile_list = get_profile_list()
-        if not profile_list:
-            # First time run: create a default profile
-            new_profile("Adventurer")  # This will set the selected profile
-            return "Adventurer"
+    selected_name = load_settings().get("selected_profile_name")
+    # Validate that the selected profile still exists
+    if selected_name and selected_name in _tenant().store:
+        return selected_name
 
+    # If not, select the first available profile
+    profile_list = get_profile_list()
+    if profile_list:
         set_selected_profile_name(profile_list[0])
         return profile_list[0]
 
-    try:
-        settings = json_loads(SETTINGS_FILE.read_text())
-        selected_name = settings.get("selected_profile_name")
-        # Validate that the selected profile still exists
-        if selected_name and (PROFILES_DIR / f"{selected_name}.json").exists():
-            return selected_name
-        else:
-            # If not, select the first available profile
-            profile_list = get_profile_list()
-            if profile_list:
-                set_selected_profile_name(profile_list[0])
-                return profile_list[0]
-            else:
-                # If no profiles exist at all, create one
-                new_profile("Adventurer")
-                return "Adventurer"
-    except (IOError, JSONDecodeError):
-        # If settings are corrupt, select the first profile
-        profile_list = get_profile_list()
-        if profile_list:
-            set_selected_profile_name(profile_list[0])
-            return profile_list[0]
-        else:
-            new_profile("Adventurer")
-            return "Adventurer"
+    # If no profiles exist at all, create one
+    new_profile("Adventurer")  # This will set the selected profile
+    return "Adventurer"
 
 
 def set_selected_profile_name(profile_name):
     """Sets the selected profile name in settings, preserving other settings."""
-    settings = {}
-    if SETTINGS_FILE.exists():
-        try:
-            settings = json_loads(SETTINGS_FILE.read_text())
-        except (IOError, JSONDecodeError):
-            settings = {}
-    settings["selected_profile_name"] = profile_name
-    SETTINGS_FILE.write_text(json_dumps(settings, indent=2))
+    update_settings({"selected_profile_name": profile_name})
 
 
 # --- Theme Management ---
 def get_theme():
-    """Gets the current theme from settings.json, or returns a default if not set."""
-    if not SETTINGS_FILE.exists():
-        return "dark"
-    try:
-        settings = json_loads(SETTINGS_FILE.read_text())
-        return settings.get("theme", "dark")
-    except (IOError, JSONDecodeError):
-        return "dark"
+    """Gets the current theme from settings, or returns a default if not set."""
+    return load_settings().get("theme", "dark")
 
 
 def set_theme(theme):
-    """Sets the theme in settings.json, preserving other settings."""
-    settings = {}
-    if SETTINGS_FILE.exists():
-        try:
-            settings = json_loads(SETTINGS_FILE.read_text())
-        except (IOError, JSONDecodeError):
-            settings = {}
-    settings["theme"] = theme
-    SETTINGS_FILE.write_text(json_dumps(settings, indent=2))
+    """Sets the theme in settings, preserving other settings."""
+    update_settings({"theme": theme})
     return True
 
 
 # --- Core Game Logic ---
+# XP_THRESHOLDS[level] is the total XP needed to reach a level, and XP_STEPS[level] the XP
+# needed to advance from it. Both grow on demand as higher XP totals are looked up.
+XP_THRESHOLDS = [0]
+XP_STEPS = [BASE_XP]
+_xp_table_lock = Lock()
+_xp_threshold_array = None  # NumPy copy of XP_THRESHOLDS for batch lookups
+_numpy = None  # The numpy module once imported, or False if it is not installed
+# Smallest batch looked up with NumPy; for fewer totals the call overhead outweighs the gain
+NUMPY_MIN_BATCH = 64
+# Doubles hold every integer below this exactly. XP_THRESHOLDS passes it at level 223, so
+# NumPy only looks up batches below it; larger totals are compared exactly with bisect.
+EXACT_FLOAT_LIMIT = 2 ** 53
+
+
+def extend_xp_table(total_xp):
+    """Extends the XP table until it covers the level reached with total_xp."""
+    with _xp_table_lock:
+        while total_xp >= XP_THRESHOLDS[-1] + XP_STEPS[-1]:
+            # Append the step first so readers never see a level without one
+            XP_STEPS.append(floor(XP_STEPS[-1] * XP_GROWTH_RATE))
+            XP_THRESHOLDS.append(XP_THRESHOLDS[-1] + XP_STEPS[-2])
+
+
+def _level_for_xp(total_xp):
+    if not total_xp >= 0:
+        # Negative (or NaN) totals never reach the first threshold
+        return 0
+    if total_xp >= XP_THRESHOLDS[-1] + XP_STEPS[-1]:
+        extend_xp_table(total_xp)
+    return bisect_right(XP_THRESHOLDS, total_xp) - 1
+
+
 def get_level_from_xp(total_xp):
-    level, xp_for_next_level, total_xp_for_this_level = 0, BASE_XP, 0
-    while total_xp >= total_xp_for_this_level + xp_for_next_level:
-        total_xp_for_this_level += xp_for_next_level
-        level += 1
-        xp_for_next_level = floor(xp_for_next_level * XP_GROWTH_RATE)
+    level = _level_for_xp(total_xp)
     return {
         "level": level,
-        "current_xp": total_xp - total_xp_for_this_level,
-        "xp_to_next_level": xp_for_next_level,
+        "current_xp": total_xp - XP_THRESHOLDS[level],
+        "xp_to_next_level": XP_STEPS[level],
     }
 
 
+def _import_numpy():
+    """
+    Returns the numpy module, or None if it is not installed. NumPy is optional and only
+    imported for the first large batch, so it adds nothing to startup.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:  # Batch level lookups fall back to bisect
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def get_levels_from_xp(xp_totals):
+    """
+    Returns the level for each of the given XP totals, a sequence or array of floats, as a
+    list. Large batches are vectorized with NumPy when it is available.
+    """
+    global _xp_threshold_array
+    numpy = _import_numpy() if len(xp_totals) >= NUMPY_MIN_BATCH else None
+    if numpy is None:
+        return [_level_for_xp(total_xp) for total_xp in xp_totals]
+
+    totals = numpy.asarray(xp_totals, dtype=float)
+    valid = totals >= 0
+    if not valid.any():
+        return [0] * totals.size
+    max_total = float(totals[valid].max())
+    if max_total >= EXACT_FLOAT_LIMIT:
+        return [_level_for_xp(total_xp) for total_xp in xp_totals]
+    extend_xp_table(max_total)
+    thresholds = _xp_threshold_array
+    if thresholds is None or len(thresholds) != len(XP_THRESHOLDS):
+        thresholds = _xp_threshold_array = numpy.array(XP_THRESHOLDS, dtype=float)
+    levels = numpy.searchsorted(thresholds, totals, side="right") - 1
+    levels[~valid] = 0
+    return levels.tolist()
+
+
+# Every stat starts at 1 and gains a point per this many levels in its skill
+STAT_SOURCES = {"strength": ("mining", 5), "dexterity": ("woodcutting", 5), "intelligence": ("foraging", 3)}
+# Skill XP is packed into arrays with a fixed column per skill for batched level lookups
+SKILL_COLUMNS = SkillColumns([*ALL_SKILLS, *(skill for skill, _ in STAT_SOURCES.values())])
+_STAT_COLUMNS = [(stat, SKILL_COLUMNS.column(skill), per_level) for stat, (skill, per_level) in STAT_SOURCES.items()]
+
+
+def process_skills(skill_dicts):
+    """
+    Computes the processed skills, total level and stats for many dicts of skill name to
+    total XP at once: the levels of every skill in every dict come from one batched lookup.
+    Returns a (processed skills, total level, stats) triple per dict.
+    """
+    matrix = SkillMatrix.pack(SKILL_COLUMNS, skill_dicts)
+    levels = get_levels_from_xp(matrix.values)
+    columns = SKILL_COLUMNS.index
+    results = []
+    for row, skills in enumerate(skill_dicts):
+        offset = row * matrix.width
+        processed_skills, total_level = {}, 0
+        for skill_name, total_xp in skills.items():
+            level = levels[offset + columns[skill_name]]
+            processed_skills[skill_name] = {
+                "total_xp": total_xp,
+                "level": level,
+                "current_xp": total_xp - XP_THRESHOLDS[level],
+                "xp_to_next_level": XP_STEPS[level],
+            }
+            total_level += level
+        # A missing skill is NaN in the matrix, which is level 0
+        stats = {stat: 1 for stat in ALL_STATS}
+        for stat, column, per_level in _STAT_COLUMNS:
+            stats[stat] += levels[offset + column] // per_level
+        results.append((processed_skills, total_level, stats))
+    return results
+
+
+def get_total_levels(skill_dicts):
+    """Returns the total level, the sum of all skill levels, for each dict of skill name to total XP."""
+    matrix = SkillMatrix.pack(SKILL_COLUMNS, skill_dicts)
+    levels = get_levels_from_xp(matrix.values)
+    width = matrix.width
+    return [sum(levels[row * width:(row + 1) * width]) for row in range(matrix.rows)]
+
+
 def calculate_stats(skills):
     """Calculates player stats based on skill levels."""
-    stats = {stat: 1 for stat in ALL_STATS}  # Base value of 1 for all stats
+    return process_skills([skills])[0][2]
+
+
+# Processed profiles are cached per tenant, keyed by name and tagged with the store version
+# they were built from. Entries are rebuilt only when that profile changes, and are shared
+# between responses, so they must not be mutated. Like the decoded profiles, at most
+# MAX_RESIDENT_PROFILES are kept, dropping the least recently used.
 
-    # Example logic: Strength from mining, Dexterity from woodcutting, Intelligence from foraging
-    if "mining" in skills:
-        stats["strength"] += floor(
-            get_level_from_xp(skills["mining"])["level"] / 5)
-    if "woodcutting" in skills:
-        stats["dexterity"] += floor(
-            get_level_from_xp(skills["woodcutting"])["level"] / 5)
-    if "foraging" in skills:
-        stats["intelligence"] += floor(
-            get_level_from_xp(skills["foraging"])["level"] / 3)
 
-    return stats
+def get_processed_profiles(profile_names):
+    """
+    Returns profiles with processed skills, total_level and stats, or None for names with
+    no profile, reusing cached results. Profiles that changed are processed in one batch.
+    """
+    tenant = _tenant()
+    cache = tenant.processed_profiles
+    processed = []
+    stale = []  # (position, name, version, Profile, status) for each profile to process
+    for profile_name in profile_names:
+        # Read the version before the profile so a concurrent write can only make the entry stale
+        version = tenant.store.version(profile_name)
+        cached = cache.get(profile_name)
+        if cached is not None and cached[0] == version:
+            if MAX_RESIDENT_PROFILES is not None:
+                # Moved to the end, as the most recently used
+                cache[profile_name] = cache.pop(profile_name, cached)
+            processed.append(cached[1])
+            continue
+        try:
+            profile_obj, status = get_profile(profile_name), "ok"
+        except CorruptProfileError:
+            profile_obj, status = DEFAULT_PROFILE, "corrupt"
+        if profile_obj is not None:
+            stale.append((len(processed), profile_name, version, profile_obj, status))
+        processed.append(None)
+
+    if stale:
+        with metrics.span("compute"):
+            # Process skills for both valid and corrupt profiles to show levels if possible
+            results = process_skills([entry[3].skills for entry in stale])
+            for (position, profile_name, version, profile_obj, status), (skills, total_level, stats) \
+                    in zip(stale, results):
+                profile = {
+                    "name": profile_name,
+                    "data": {
+                        "skills": skills,
+                        "inventory": dict(profile_obj.inventory),
+                        "stats": stats,
+                        "idle_action": get_idle_status(profile_obj),
+                    },
+                    "status": status,
+                    "total_level": total_level,
+                }
+                cache.pop(profile_name, None)
+                cache[profile_name] = (version, profile)
+                processed[position] = profile
+        if MAX_RESIDENT_PROFILES is not None:
+            while len(cache) > MAX_RESIDENT_PROFILES:
+                cache.pop(next(iter(cache)), None)
+    return processed
+
+
+def get_processed_profile(profile_name):
+    """Returns a profile with processed skills, total_level and stats, reusing cached results."""
+    return get_processed_profiles([profile_name])[0]
 
 
 def get_processed_game_state():
-    """Builds the complete game state from individual files."""
+    """Builds the complete game state from the processed profiles."""
     profile_names = get_profile_list()
     selected_name = get_selected_profile_name()
     if not profile_names:
@@ -206,75 +660,483 @@ def get_processed_game_state():
         selected_name = "Adventurer"
     all_profiles = []
     selected_profile_index = 0
-    for i, name in enumerate(profile_names):
-        profile = read_profile(name)
-
-        # Store the raw skills before processing for stats calculation
-        raw_skills = profile["data"]["skills"].copy()
-
-        processed_skills, profile_total_level = {}, 0
-        # Process skills for both valid and corrupt profiles to show levels if possible
-        for skill_name, total_xp in profile["data"]["skills"].items():
-            derived_stats = get_level_from_xp(total_xp)
-            processed_skills[skill_name] = {
-                "total_xp": total_xp, **derived_stats}
-            profile_total_level += derived_stats["level"]
-        profile["data"]["skills"] = processed_skills
-        profile["total_level"] = profile_total_level
-
-        # Calculate stats using the raw skill XP values
-        profile["data"]["stats"] = calculate_stats(raw_skills)
-
-        all_profiles.append(profile)
+    for name, profile in zip(profile_names, get_processed_profiles(profile_names)):
+        if profile is None:
+            continue
         if name == selected_name:
-            selected_profile_index = i
+            selected_profile_index = len(all_profiles)
+        all_profiles.append(profile)
     return {
         "profiles": all_profiles,
         "selected_profile_index": selected_profile_index
     }
 
 
-def handle_action(action_id):
+# Differs between runs, so entity tags handed out before a restart never match
+_GAME_STATE_ETAG_SALT = token_hex(8)
+
+
+def get_game_state_etag():
+    """
+    Returns an entity tag for the current get_processed_game_state() result and the
+    selected profile's pending idle gain. It is derived from the profile store generation,
+    the selected profile and the number of idle repetitions due, so it is cheap to check
+    without building the state.
+    """
+    # Resolved first, since it creates the default profile if there are none
     selected_name = get_selected_profile_name()
-    profile = read_profile(selected_name)
+    tenant = _tenant()
+    pending = get_pending_idle_gain(selected_name)
+    idle_key = f"{pending['actions']}:{pending['stopped']}" if pending else ""
+    key = f"{_GAME_STATE_ETAG_SALT}:{tenant.id}:{tenant.store.generation()}:{selected_name}:{idle_key}"
+    return blake2b(key.encode(), digest_size=12).hexdigest()
 
-    if profile["status"] == "corrupt":
-        return {"error": "Cannot perform actions on a corrupt profile. Please fix it first."}
 
-    action_map = {
-        "gather-wood-button": {"skill": "woodcutting", "xp": 10, "item": "wood", "quantity": 1},
-        "mine-stone-button": {"skill": "mining", "xp": 15, "item": "stone", "quantity": 1},
-        "forage-herbs-button": {"skill": "foraging", "xp": 5, "item": "herbs", "quantity": 1},
+def get_processed_profile_delta(profile_name):
+    """Builds a partial game state containing only the given profile."""
+    profile_names = get_profile_list()
+    return {
+        "profile": get_processed_profile(profile_name),
+        "profile_index": profile_names.index(profile_name) if profile_name in profile_names else None,
+        "selected_profile_index": profile_names.index(get_selected_profile_name()),
     }
 
-    if action_id in action_map:
-        action_info = action_map[action_id]
-        skill = action_info["skill"]
-        item = action_info.get("item")
 
-        profile["data"]["skills"][skill] += action_info["xp"]
-        if item:
-            profile["data"]["inventory"][item] = profile["data"]["inventory"].get(
-                item, 0) + action_info.get("quantity", 0)
+# --- State Feed ---
+def get_state_snapshot():
+    """
+    Builds the game state in the form streamed to clients: processed profiles keyed by
+    name, so that a change to one profile diffs to a change under its name.
+    """
+    # Resolved first, since it creates the default profile if there are none
+    selected_name = get_selected_profile_name()
+    profiles = {}
+    profile_names = get_profile_list()
+    for name, profile in zip(profile_names, get_processed_profiles(profile_names)):
+        if profile is not None:
+            profiles[name] = profile
+    return {
+        "profile_names": list(profiles),
+        "profiles": profiles,
+        "selected_profile_name": selected_name,
+    }
+
+
+def stream_state_changes(last_event_id=None):
+    """
+    Streams the current tenant's state changes as Server-Sent Events text, keeping the
+    tenant loaded while the stream is open.
+    """
+    # Resolved now, since the stream is consumed after the request that opened it has ended
+    tenant = _tenant()
+
+    def stream():
+        # Pinned again, since that request releases its own pin first
+        acquired = tenant if tenant in (_default_tenant, _guest_tenant) else acquire_tenant(tenant.id)
+        try:
+            yield from acquired.state_feed.stream(last_event_id, end_when_idle=tenant is _guest_tenant)
+        finally:
+            release_tenant(acquired)
+
+    return stream()
+
+
+# Upper bound on the repeat count of a single entry in a batch of actions
+MAX_BATCH_ACTION_COUNT = 1000
+_action_table = None
+_action_table_lock = Lock()
+
+
+def get_xp_for_level(level):
+    """Returns the total XP needed to reach a level."""
+    while len(XP_THRESHOLDS) <= level:
+        extend_xp_table(XP_THRESHOLDS[-1] + XP_STEPS[-1])
+    return XP_THRESHOLDS[level]
+
 
-        write_profile(selected_name, profile["data"])
+def get_action_table():
+    """Returns the read-only table of actions, compiled from the content files on first use."""
+    global _action_table
+    if _action_table is None:
+        with _action_table_lock:
+            if _action_table is None:
+                _action_table = compile_actions(
+                    REGISTRY.actions, REGISTRY.recipes, REGISTRY.items, get_xp_for_level)
+    return _action_table
 
+
+def handle_action(action_id, delta=False):
+    """
+    Applies an action to the selected profile. Returns the full game state,
+    or only the changed profile if delta is set.
+    """
+    selected_name = get_selected_profile_name()
+    # The profile is locked from read to write so concurrent actions cannot lose updates
+    with _tenant().store.lock(selected_name):
+        try:
+            profile = get_profile(selected_name)
+        except CorruptProfileError:
+            return {"error": "Cannot perform actions on a corrupt profile. Please fix it first."}
+        if profile is None:
+            return {"error": "The selected profile no longer exists."}
+
+        action = get_action_table().get(action_id)
+        if action is None:
+            return {"error": "Unknown action ID"}
+        # Idle progress is credited first, so it can supply the action's ingredients
+        profile, idle_gain = accrue_idle_progress(profile, time())
+        error = check_action(action, profile.skills, profile.inventory)
+        if error:
+            return {"error": error}
+        skills, inventory = dict(profile.skills), dict(profile.inventory)
+        apply_action(skills, inventory, action)
+
+        # The gains are known to be valid, so the copy skips re-validation
+        write_profile(selected_name, profile.model_copy(update={"skills": skills, "inventory": inventory}))
+
+    if delta:
+        updated_state = get_processed_profile_delta(selected_name)
+    else:
         updated_state = get_processed_game_state()
-        updated_state["recent_gain"] = action_info
-        return updated_state
+    updated_state["recent_gain"] = action.summary
+    if idle_gain:
+        updated_state["idle_gain"] = idle_gain
+    return updated_state
+
+
+def handle_actions(actions, delta=False):
+    """
+    Applies a batch of actions to the selected profile with a single load and a single write.
+    Each entry is a dict with an "action_id" and an optional repeat "count" (default 1).
+    The returned state carries the combined gains of the whole batch in "recent_gain".
+    """
+    if not isinstance(actions, list) or not actions:
+        return {"error": "No actions provided"}
+    if len(actions) > MAX_BATCH_ACTIONS:
+        return {"error": f"A batch can hold at most {MAX_BATCH_ACTIONS} actions"}
+
+    action_table = get_action_table()
+    batch = []
+    for entry in actions:
+        action = action_table.get(entry.get("action_id")) if isinstance(entry, dict) else None
+        if action is None:
+            return {"error": "Unknown action ID"}
+        count = entry.get("count", 1)
+        if not isinstance(count, int) or isinstance(count, bool) or not (1 <= count <= MAX_BATCH_ACTION_COUNT):
+            return {"error": f"Action count must be an integer from 1 to {MAX_BATCH_ACTION_COUNT}"}
+        batch.append((action, count))
+
+    selected_name = get_selected_profile_name()
+    with _tenant().store.lock(selected_name):
+        try:
+            profile = get_profile(selected_name)
+        except CorruptProfileError:
+            return {"error": "Cannot perform actions on a corrupt profile. Please fix it first."}
+        if profile is None:
+            return {"error": "The selected profile no longer exists."}
+
+        profile, idle_gain = accrue_idle_progress(profile, time())
+        skills, inventory = dict(profile.skills), dict(profile.inventory)
+        recent_gain = {"xp": {}, "items": {}, "actions": 0}
+        # Entries are checked in order, so earlier ones can unlock or supply later ones.
+        # Nothing is written unless the whole batch succeeds.
+        for action, count in batch:
+            error = check_action(action, skills, inventory, count)
+            if error:
+                return {"error": error}
+            apply_action(skills, inventory, action, count)
+            recent_gain["xp"][action.skill] = recent_gain["xp"].get(action.skill, 0) + action.xp * count
+            for item, quantity in action.summary["items"].items():
+                recent_gain["items"][item] = recent_gain["items"].get(item, 0) + quantity * count
+            recent_gain["actions"] += count
+
+        write_profile(selected_name, profile.model_copy(update={"skills": skills, "inventory": inventory}))
+
+    if delta:
+        updated_state = get_processed_profile_delta(selected_name)
     else:
-        return {"error": "Unknown action ID"}
+        updated_state = get_processed_game_state()
+    updated_state["recent_gain"] = recent_gain
+    if idle_gain:
+        updated_state["idle_gain"] = idle_gain
+    return updated_state
+
+
+# --- Idle Actions ---
+# An idle action repeats once per its duration while the player is away. Nothing runs in
+# the meantime: the repetitions are credited in closed form when the profile is next
+# used, so the cost does not depend on how long it was idle or how many profiles idle.
+def get_idle_status(profile):
+    """
+    Returns the profile's idle action with its duration and the Unix time of the next
+    level-up in its skill, or None if the profile has no idle action.
+    """
+    idle = profile.idle_action
+    if idle is None:
+        return None
+    action = get_action_table().get(idle.action_id)
+    if action is None or action.duration is None:
+        return None
+    next_level_at = None
+    if action.xp > 0:
+        total_xp = profile.skills.get(action.skill, 0.0)
+        level = get_level_from_xp(total_xp)
+        repetitions = ceil((level["xp_to_next_level"] - level["current_xp"]) / action.xp)
+        next_level_at = idle.since + max(repetitions, 1) * action.duration
+    return {
+        "action_id": idle.action_id,
+        "since": idle.since,
+        "duration": action.duration,
+        "next_level_at": next_level_at,
+    }
+
+
+def accrue_idle_progress(profile, now):
+    """
+    Credits the profile's idle action with every repetition completed by now. Returns the
+    updated Profile and a summary of the gains, or the profile unchanged and None if no
+    repetition completed. The idle action stops when it runs out of ingredients.
+    """
+    idle = profile.idle_action
+    if idle is None:
+        return profile, None
+    action = get_action_table().get(idle.action_id)
+    if action is None or action.duration is None:
+        # The action was removed from the content files or can no longer run idle
+        return profile.model_copy(update={"idle_action": None}), {
+            "action_id": idle.action_id, "actions": 0, "xp": {}, "items": {}, "level_ups": {}, "stopped": True}
+
+    since = max(idle.since, now - IDLE_MAX_SECONDS)
+    count, ran_out = idle_repetitions(action, profile.inventory, now - since)
+    if not count and not ran_out:
+        return profile, None
+
+    skills, inventory = dict(profile.skills), dict(profile.inventory)
+    apply_action(skills, inventory, action, count)
+    # Time spent on the unfinished repetition carries over
+    idle = None if ran_out else idle.model_copy(update={"since": since + count * action.duration})
+    levels_before = get_level_from_xp(profile.skills.get(action.skill, 0.0))["level"]
+    levels_after = get_level_from_xp(skills[action.skill])["level"]
+    gain = {
+        "action_id": action.id,
+        "actions": count,
+        "xp": {action.skill: action.xp * count},
+        "items": {item: quantity * count for item, quantity in action.summary["items"].items()},
+        "level_ups": {action.skill: levels_after - levels_before} if levels_after > levels_before else {},
+        "stopped": ran_out,
+    }
+    return profile.model_copy(update={"skills": skills, "inventory": inventory, "idle_action": idle}), gain
+
+
+def get_pending_idle_gain(profile_name=None):
+    """
+    Returns the summary of the idle progress a profile (the selected one by default) has
+    made but not yet stored, or None if there is none. Nothing is written: the progress is
+    credited by the profile's next change, or by settle_idle_progress.
+    """
+    profile_name = profile_name or get_selected_profile_name()
+    try:
+        profile = get_profile(profile_name)
+    except CorruptProfileError:
+        return None
+    if profile is None:
+        return None
+    return accrue_idle_progress(profile, time())[1]
+
+
+def settle_idle_progress(profile_name=None):
+    """
+    Stores the idle progress of a profile (the selected one by default) made since it was
+    last used. Returns the summary of the gains, or None if there were none.
+    """
+    profile_name = profile_name or get_selected_profile_name()
+    # Checked without the lock first, so profiles with nothing due are never locked
+    if get_pending_idle_gain(profile_name) is None:
+        return None
+    with _tenant().store.lock(profile_name):
+        try:
+            profile = get_profile(profile_name)
+        except CorruptProfileError:
+            return None
+        if profile is None:
+            return None
+        profile, gain = accrue_idle_progress(profile, time())
+        if gain is not None:
+            write_profile(profile_name, profile)
+    return gain
+
+
+def start_idle_action(action_id):
+    """Makes an action the selected profile's idle action, replacing any current one."""
+    selected_name = get_selected_profile_name()
+    with _tenant().store.lock(selected_name):
+        try:
+            profile = get_profile(selected_name)
+        except CorruptProfileError:
+            return {"error": "Cannot perform actions on a corrupt profile. Please fix it first."}
+        if profile is None:
+            return {"error": "The selected profile no longer exists."}
+
+        action = get_action_table().get(action_id)
+        if action is None:
+            return {"error": "Unknown action ID"}
+        if action.duration is None:
+            return {"error": "This action cannot be performed idle"}
+        now = time()
+        profile, idle_gain = accrue_idle_progress(profile, now)
+        error = check_action(action, profile.skills, profile.inventory)
+        if error:
+            return {"error": error}
+        write_profile(selected_name, profile.model_copy(
+            update={"idle_action": IdleAction(action_id=action_id, since=now)}))
+
+    updated_state = get_processed_game_state()
+    if idle_gain:
+        updated_state["idle_gain"] = idle_gain
+    return updated_state
+
+
+def settle_idle_action():
+    """Credits the selected profile's idle progress, keeping its idle action running."""
+    idle_gain = settle_idle_progress()
+    updated_state = get_processed_game_state()
+    if idle_gain:
+        updated_state["idle_gain"] = idle_gain
+    return updated_state
+
+
+def stop_idle_action():
+    """Credits and stops the selected profile's idle action."""
+    selected_name = get_selected_profile_name()
+    with _tenant().store.lock(selected_name):
+        try:
+            profile = get_profile(selected_name)
+        except CorruptProfileError:
+            return {"error": "Cannot perform actions on a corrupt profile. Please fix it first."}
+        if profile is None:
+            return {"error": "The selected profile no longer exists."}
+
+        profile, idle_gain = accrue_idle_progress(profile, time())
+        if idle_gain or profile.idle_action is not None:
+            write_profile(selected_name, profile.model_copy(update={"idle_action": None}))
+
+    updated_state = get_processed_game_state()
+    if idle_gain:
+        updated_state["idle_gain"] = idle_gain
+    return updated_state
+
+
+# --- Leaderboard ---
+# Boards rank profiles by total level and by the total XP of each skill. The index is built
+# from every profile on the first query, then updated by write_profile and the other
+# mutations, so queries never process all profiles again. Each tenant has its own index.
+TOTAL_LEVEL_BOARD = "total_level"
+MAX_LEADERBOARD_LIMIT = 100
+
+
+def get_leaderboard_scores(profiles):
+    """Returns the score of each profile on each leaderboard."""
+    total_levels = get_total_levels([profile.skills for profile in profiles])
+    return [{**profile.skills, TOTAL_LEVEL_BOARD: total_level}
+            for profile, total_level in zip(profiles, total_levels)]
+
+
+def _index_profile(profile_name, profile):
+    """Updates the leaderboards after a profile changes, or is removed if profile is None."""
+    tenant = _tenant()
+    if tenant.leaderboard.ready:
+        scores = {} if profile is None else get_leaderboard_scores([profile])[0]
+        tenant.leaderboard.update(profile_name, tenant.store.version(profile_name), scores)
+
+
+def _sync_leaderboard():
+    """
+    Indexes every profile on first use. In shared mode, profiles changed by other processes
+    are also reindexed whenever the store generation moves, going by the names the store
+    reports changed, or by every profile if it cannot tell.
+    """
+    tenant = _tenant()
+    leaderboard = tenant.leaderboard
+    if leaderboard.ready and not SHARED_PROFILE_STORAGE:
+        return
+    with tenant.leaderboard_lock:
+        generation = tenant.store.generation()
+        if leaderboard.ready and generation == tenant.leaderboard_generation:
+            return
+        names = None
+        if leaderboard.ready and tenant.leaderboard_generation is not None:
+            names = tenant.store.changed_since(tenant.leaderboard_generation)
+        # Marked first, so writes from here on update the index themselves
+        leaderboard.ready = True
+        if names is None:
+            names = get_profile_list()
+            for name in leaderboard.names().difference(names):
+                leaderboard.update(name, tenant.store.version(name), {})
+        else:
+            # Removed profiles read as None below and are unranked
+            names = sorted(names)
+        ranked = []  # (name, version, Profile) for each profile to index
+        for name in names:
+            # Read the version before the profile so a concurrent write can only supersede it
+            version = tenant.store.version(name)
+            if leaderboard.version(name) == version:
+                continue
+            try:
+                profile = get_profile(name)
+            except CorruptProfileError:
+                profile = None  # Corrupt profiles are not ranked
+            if profile is None:
+                leaderboard.update(name, version, {})
+            else:
+                ranked.append((name, version, profile))
+        # Scored in one batch
+        scores = get_leaderboard_scores([profile for _, _, profile in ranked])
+        for (name, version, _), profile_scores in zip(ranked, scores):
+            leaderboard.update(name, version, profile_scores)
+        tenant.leaderboard_generation = generation
+
+
+def get_leaderboard_names():
+    """Returns the boards that can be queried: total level and every known skill."""
+    _sync_leaderboard()
+    skills = set(ALL_SKILLS).union(action.skill for action in get_action_table().values())
+    return [TOTAL_LEVEL_BOARD, *sorted(skills.union(_tenant().leaderboard.boards()) - {TOTAL_LEVEL_BOARD})]
+
+
+def get_leaderboard(board=TOTAL_LEVEL_BOARD, limit=10, offset=0, name=None):
+    """
+    Returns the top entries of a leaderboard, each with its rank, name and score, and the
+    entry of the named profile (the selected one by default) in "player".
+    """
+    if not isinstance(limit, int) or not (1 <= limit <= MAX_LEADERBOARD_LIMIT):
+        return {"error": f"Limit must be an integer from 1 to {MAX_LEADERBOARD_LIMIT}"}
+    if not isinstance(offset, int) or offset < 0:
+        return {"error": "Offset must be a non-negative integer"}
+    boards = get_leaderboard_names()
+    if board not in boards:
+        return {"error": f"Unknown leaderboard '{board}'"}
+    name = name or get_selected_profile_name()
+    return {
+        "board": board,
+        "boards": boards,
+        "entries": _tenant().leaderboard.top(board, limit, offset),
+        "total": _tenant().leaderboard.size(board),
+        "player": _tenant().leaderboard.rank(board, name),
+    }
 
 
 # --- Profile Management Functions ---
+# Functions that add, remove or look up profiles by index hold the whole-store lock,
+# so concurrent management requests see a consistent list of profiles.
 def new_profile(name):
     if not name or name.isspace():
         return {"error": "Profile name cannot be empty"}
-    if name.lower() in {p.lower() for p in get_profile_list()}:
-        return {"error": f"Profile name '{name}' already exists."}
+    with _tenant().store.lock():
+        if name.lower() in {p.lower() for p in get_profile_list()}:
+            return {"error": f"Profile name '{name}' already exists."}
 
-    write_profile(name, get_default_profile_data())
-    set_selected_profile_name(name)
+        write_profile(name, DEFAULT_PROFILE)
+        set_selected_profile_name(name)
     return get_processed_game_state()
 
 
@@ -284,77 +1146,87 @@ def select_profile(index):
         return {"error": "Invalid profile index"}
 
     set_selected_profile_name(profile_list[index])
-    return get_processed_game_state()
+    idle_gain = settle_idle_progress(profile_list[index])
+    updated_state = get_processed_game_state()
+    if idle_gain:
+        updated_state["idle_gain"] = idle_gain
+    return updated_state
 
 
 def rename_profile(new_name):
     if not new_name or new_name.isspace():
         return {"error": "New name cannot be empty"}
 
-    selected_name = get_selected_profile_name()
-    profile_list = get_profile_list()
-    # Exclude the current profile name from the check
-    if new_name.lower() in {p.lower() for p in profile_list if p.lower() != selected_name.lower()}:
-        return {"error": f"Profile name '{new_name}' already exists."}
-
-    profile_data = read_profile(selected_name)["data"]
-
-    write_profile(new_name, profile_data)
-    set_selected_profile_name(new_name)
-
-    old_file = PROFILES_DIR / f"{selected_name}.json"
-    if old_file.exists():
-        old_file.unlink()
+    with _tenant().store.lock():
+        selected_name = get_selected_profile_name()
+        profile_list = get_profile_list()
+        # Exclude the current profile name from the check
+        if new_name.lower() in {p.lower() for p in profile_list if p.lower() != selected_name.lower()}:
+            return {"error": f"Profile name '{new_name}' already exists."}
+
+        first, second = sorted([selected_name, new_name])
+        with _tenant().store.lock(first), _tenant().store.lock(second):
+            _tenant().store.rename(selected_name, new_name)
+            _tenant().state_feed.mark_changed()
+            _index_profile(selected_name, None)
+            try:
+                _index_profile(new_name, get_profile(new_name))
+            except CorruptProfileError:
+                _index_profile(new_name, None)
+            set_selected_profile_name(new_name)
 
     return get_processed_game_state()
 
 
 def delete_profile():
-    profile_list = get_profile_list()
-    if len(profile_list) <= 1:
-        return {"error": "Cannot delete the last profile"}
+    with _tenant().store.lock():
+        profile_list = get_profile_list()
+        if len(profile_list) <= 1:
+            return {"error": "Cannot delete the last profile"}
 
-    name_to_delete = get_selected_profile_name()
+        name_to_delete = get_selected_profile_name()
 
-    current_index = profile_list.index(name_to_delete)
-    new_index_to_select = max(0, current_index - 1)
-    if new_index_to_select < len(profile_list):
-        set_selected_profile_name(profile_list[new_index_to_select])
+        current_index = profile_list.index(name_to_delete)
+        new_index_to_select = max(0, current_index - 1)
+        if new_index_to_select < len(profile_list):
+            set_selected_profile_name(profile_list[new_index_to_select])
 
-    file_to_delete = PROFILES_DIR / f"{name_to_delete}.json"
-    if file_to_delete.exists():
-        file_to_delete.unlink()
+        with _tenant().store.lock(name_to_delete):
+            delete_profile_data(name_to_delete)
 
     return get_processed_game_state()
 
 
 def reset_profile():
     selected_name = get_selected_profile_name()
-    write_profile(selected_name, get_default_profile_data())
+    with _tenant().store.lock(selected_name):
+        write_profile(selected_name, DEFAULT_PROFILE)
     return get_processed_game_state()
 
 
 def fix_profile(index_to_fix):
     """'Fixes' a corrupt profile by resetting it to the default state."""
-    profile_list = get_profile_list()
-    if index_to_fix is None or not (0 <= index_to_fix < len(profile_list)):
-        return {"error": "Invalid index provided for fixing."}
+    with _tenant().store.lock():
+        profile_list = get_profile_list()
+        if index_to_fix is None or not (0 <= index_to_fix < len(profile_list)):
+            return {"error": "Invalid index provided for fixing."}
 
-    name_to_fix = profile_list[index_to_fix]
-    write_profile(name_to_fix, get_default_profile_data())
+        name_to_fix = profile_list[index_to_fix]
+        with _tenant().store.lock(name_to_fix):
+            write_profile(name_to_fix, DEFAULT_PROFILE)
     return get_processed_game_state()
 
 
 def hard_reset():
     """Deletes all profiles and starts fresh."""
-    for profile_file in PROFILES_DIR.glob("*.json"):
-        profile_file.unlink()
+    with _tenant().store.lock():
+        for name in get_profile_list():
+            delete_profile_data(name)
 
-    if SETTINGS_FILE.exists():
-        SETTINGS_FILE.unlink()
+        clear_settings()
 
-    # Create a new default profile
-    new_profile("Adventurer")
+        # Create a new default profile
+        new_profile("Adventurer")
 
     return get_processed_game_state()
 
@@ -367,26 +1239,61 @@ def get_settings():
         "font_size": 16,
         # selected_profile_name is handled elsewhere
     }
-    if not SETTINGS_FILE.exists():
-        return defaults
-    try:
-        settings = json_loads(SETTINGS_FILE.read_text())
-        for k, v in defaults.items():
-            if k not in settings:
-                settings[k] = v
-        return settings
-    except (IOError, JSONDecodeError):
-        return defaults
+    return {**defaults, **load_settings()}
 
 
 def set_settings(new_settings):
-    """Update settings.json with provided settings, preserving others."""
-    settings = {}
-    if SETTINGS_FILE.exists():
-        try:
-            settings = json_loads(SETTINGS_FILE.read_text())
-        except (IOError, JSONDecodeError):
-            settings = {}
-    settings.update(new_settings)
-    SETTINGS_FILE.write_text(json_dumps(settings, indent=2))
+    """Update settings with provided settings, preserving others."""
+    update_settings(new_settings)
     return True
+
+
+# --- Async Variants ---
+# Used by the ASGI app. Each runs the blocking function in the default thread pool, so
+# disk access and lock waits never stall the event loop that serves other clients.
+def _offload(func):
+    @wraps(func)
+    async def run_in_thread(*args, **kwargs):
+        # Imported here so the WSGI server does not pay for importing asyncio at startup
+        from asyncio import to_thread
+        return await to_thread(func, *args, **kwargs)
+
+    run_in_thread.__name__ = run_in_thread.__qualname__ = f"{func.__name__}_async"
+    return run_in_thread
+
+
+read_profile_async = _offload(read_profile)
+write_profile_async = _offload(write_profile)
+load_settings_async = _offload(load_settings)
+update_settings_async = _offload(update_settings)
+get_settings_async = _offload(get_settings)
+set_settings_async = _offload(set_settings)
+get_processed_game_state_async = _offload(get_processed_game_state)
+get_game_state_etag_async = _offload(get_game_state_etag)
+handle_action_async = _offload(handle_action)
+handle_actions_async = _offload(handle_actions)
+get_pending_idle_gain_async = _offload(get_pending_idle_gain)
+settle_idle_action_async = _offload(settle_idle_action)
+start_idle_action_async = _offload(start_idle_action)
+stop_idle_action_async = _offload(stop_idle_action)
+get_leaderboard_async = _offload(get_leaderboard)
+new_profile_async = _offload(new_profile)
+select_profile_async = _offload(select_profile)
+rename_profile_async = _offload(rename_profile)
+delete_profile_async = _offload(delete_profile)
+reset_profile_async = _offload(reset_profile)
+fix_profile_async = _offload(fix_profile)
+hard_reset_async = _offload(hard_reset)
+
+
+@asynccontextmanager
+async def tenant_session_async(session_id, read_only=False):
+    """The async counterpart of tenant_session, loading the tenant in a worker thread."""
+    from asyncio import to_thread
+    tenant = await to_thread(acquire_tenant, session_id, read_only)
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+        await to_thread(release_tenant, tenant)
@@ -1,10 +1,23 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import Dict
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Dict, Optional
+
+
+class IdleAction(BaseModel):
+    """A timed action that repeats while the player is away."""
+    model_config = ConfigDict(allow_inf_nan=False)
+
+    action_id: str
+    since: float  # Unix time up to which completed repetitions have been credited
 
 
 class Profile(BaseModel):
+    # NaN and infinity cannot be stored in JSON, so they are rejected rather than saved as null
+    model_config = ConfigDict(allow_inf_nan=False)
+
     skills: Dict[str, float] = Field(default_factory=dict)
     inventory: Dict[str, float] = Field(default_factory=dict)
+    idle_action: Optional[IdleAction] = None
+    schema_version: int = 0  # See migrations.py; profiles stored before versioning have none
 
     @field_validator('skills', mode='before')
     @classmethod
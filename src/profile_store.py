@@ -0,0 +1,683 @@
+import atexit
+import logging
+import os
+from bisect import insort
+from collections import deque
+from contextlib import contextmanager
+from hashlib import blake2b
+from pathlib import Path
+from threading import Event, Lock, RLock, Thread
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where locks only exclude other threads
+    fcntl = None
+
+from . import json_codec, metrics
+from .change_log import ChangeLog
+from .journal import ProfileJournal, profile_record, replay
+from .migrations import ProfileMigrations
+from .profile_model import Profile
+from .storage import ProfileBackend
+
+logger = logging.getLogger(__name__)
+
+# Marker cached in place of a Profile when the stored data cannot be decoded
+_CORRUPT = object()
+# Lock keys for operations on the set of profiles as a whole, and on the settings kept beside them
+_STORE_LOCK = object()
+_SETTINGS_LOCK = object()
+_LOCK_FILE_NAMES = {_STORE_LOCK: "store.lock", _SETTINGS_LOCK: "settings.lock"}
+# Number of recent changes remembered for changed_since
+_CHANGE_HISTORY = 4096
+
+
+def _digest(text):
+    return blake2b(text.encode(), digest_size=16).digest()
+
+
+class CorruptProfileError(Exception):
+    """Raised when a profile exists in storage but does not decode into a valid Profile."""
+
+
+def _decode(text, records, migrations):
+    """Returns the decoded profile and whether it had to be migrated."""
+    if not records:
+        try:
+            profile = Profile.model_validate_json(text)
+        except ValueError:
+            if migrations is None:
+                raise
+            profile = None  # Possibly valid once migrated
+        # Current profiles, the usual case, are decoded straight from the stored text
+        if profile is not None and (migrations is None or migrations.is_current(profile.schema_version)):
+            return profile, False
+        data = json_codec.loads(text)
+    else:
+        data = replay(text, records)
+    if migrations is None or migrations.is_current(data.get("schema_version", 0)):
+        return Profile.model_validate(data), False
+    return Profile.model_validate(migrations.upgrade(data)), True
+
+
+def decode_profile(text, records=None, migrations=None):
+    """
+    Decodes a stored profile, replaying its journal records if there are any, and upgrades
+    it with migrations if it is older. Raises an exception, usually a ValueError, if it does
+    not decode into a valid Profile.
+    """
+    return _decode(text, records, migrations)[0]
+
+
+class ProfileStore:
+    """
+    Keeps decoded Profile objects resident in memory and persists changes in the background.
+
+    The backend is listed once on first access; after that, reads are served from memory.
+    Writes only mark a profile dirty. A background writer flushes dirty profiles every
+    `flush_interval` seconds, or sooner once `max_dirty` profiles are waiting, and a final
+    flush runs at interpreter shutdown.
+
+    With `compact` set, profiles are serialized without indentation, and a profile whose
+    serialized form matches what is already stored is not rewritten.
+
+    With `max_resident` set, at most that many profiles are kept in memory. The least
+    recently used ones are dropped and read again on next use. Profiles with unsaved
+    changes are only dropped once they are written.
+
+    Cached Profile instances are shared and must be treated as immutable: callers replace
+    a profile with `put` instead of mutating it in place, and hold `lock(name)` around
+    read-modify-write sequences so concurrent updates are not lost.
+
+    Set `shared` when several processes serve the same storage. Locks then also take file
+    locks in `lock_dir`, cached profiles are checked against storage before use, and writes
+    go to storage immediately instead of in the background. Every write is also recorded in
+    a ChangeLog in `lock_dir`, so `generation` only checks the profiles changed since.
+
+    With a `journal`, every change to a stored profile is appended to the profile's journal
+    before `put` returns, and profiles are read back as their snapshot plus their journal.
+    A new profile is written to storage before `put` returns instead, since a profile that
+    only exists in its journal could not be listed. Once a journal reaches
+    `journal_max_bytes`, the profile is marked dirty so its next write folds the journal
+    into the snapshot. Profiles whose changes are all journaled can be dropped from memory.
+    If the journal syncs its records, those snapshot writes are synced before the journal
+    is emptied. Deletes are not journaled: they are persisted by the next background write.
+
+    With `migrations`, a profile stored at an older schema version is upgraded when it is
+    read. It is not written back until it next changes; that change is journaled as the
+    whole upgraded profile, and the profile is marked dirty to write it out.
+    """
+
+    def __init__(self, backend: ProfileBackend, flush_interval: float = 2.0, max_dirty: int = 32,
+                 compact: bool = False, shared: bool = False, lock_dir: Path = None, max_resident: int = None,
+                 journal: ProfileJournal = None, journal_max_bytes: int = 32768,
+                 migrations: ProfileMigrations = None):
+        self.backend = backend
+        self.migrations = migrations
+        self.journal = journal
+        self.journal_max_bytes = journal_max_bytes
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.compact = compact
+        self.max_resident = max_resident
+        self.shared = shared
+        self.lock_dir = lock_dir  # Created when the first file lock is taken
+        self._thread_locks = {}  # lock key -> RLock
+        self._thread_locks_guard = Lock()
+        self._file_locks = {}  # lock key -> [file descriptor, depth] while held by a thread
+        self._lock = RLock()
+        self._flush_lock = Lock()
+        self._names = None  # Ordered profile names, populated on warm-up
+        self._name_set = set()  # The same names, for constant-time membership tests
+        self._profiles = {}  # name -> Profile, or _CORRUPT, least recently used first
+        self._versions = {}  # name -> number of changes made through this store
+        self._generation = 0  # Total number of changes to any profile
+        self._history = deque(maxlen=_CHANGE_HISTORY)  # (generation, name) of the latest changes
+        self._history_start = 0  # Oldest generation changed_since can answer for
+        self._dirty = set()
+        self._deleted = set()
+        self._migrated = set()  # Names of resident profiles upgraded on read but not yet written
+        self._journaling = set()  # Names of profiles whose latest change is being journaled
+        self._flush_count = 0  # Number of flushes started, to order their journal discards
+        self._discarded = {}  # name -> number of the latest flush that emptied its journal
+        self._digests = {}  # name -> digest of the contents last loaded from or saved to storage
+        self._stamps = {}  # name -> backend stamp of the cached profile, in shared mode
+        self._list_stamp = None
+        self._change_log = ChangeLog(lock_dir / "changes.log") if shared else None
+        self._log_position = None  # How far this store has read the change log
+        self._flush_hooks = []
+        self._wake = Event()
+        self._stopping = Event()
+        self._writer = None
+
+    def _warm_up(self):
+        if self.shared:
+            # Pick up profiles added, renamed or deleted by other processes
+            list_stamp = self.backend.list_stamp()
+            if list_stamp != self._list_stamp:
+                self._names, self._list_stamp = None, list_stamp
+                self._generation += 1
+        if self._names is None:
+            self._names = self.backend.list_names()
+            self._name_set = set(self._names)
+
+    def _refresh(self, name):
+        """In shared mode, drops the cached profile if another process has changed it."""
+        if not self.shared or name not in self._profiles:
+            return
+        stamp = self._stamp(name)
+        if stamp != self._stamps.get(name):
+            self._profiles.pop(name, None)
+            self._migrated.discard(name)
+            self._digests.pop(name, None)
+            self._bump_version(name)
+            if stamp is None and name in self._name_set:
+                self._remove_name(name)
+
+    def _catch_up(self):
+        """In shared mode, refreshes the cached profiles changed since the last check. Requires _lock."""
+        self._log_position, names = self._change_log.changes_since(self._log_position)
+        if names is None:
+            for name in list(self._profiles):
+                self._refresh(name)
+            # Profiles that are not resident may have changed too
+            self._generation += 1
+            self._history_start = self._generation
+            return
+        for name in names:
+            if name in self._profiles:
+                self._refresh(name)
+            else:
+                self._bump_version(name)
+
+    def _log_changes(self, names):
+        """In shared mode, records that the named profiles were written to storage."""
+        if not self.shared:
+            return
+        try:
+            start, end = self._change_log.append(names)
+        except OSError:
+            logger.exception("Failed to record changes to profiles %s", sorted(names))
+            return
+        with self._lock:
+            # This store's own changes are not read back, unless other changes came first
+            if self._log_position == start:
+                self._log_position = end
+
+    def _stamp(self, name):
+        stamp = self.backend.stamp(name)
+        if self.journal is not None and stamp is not None:
+            return stamp, self.journal.stamp(name)
+        return stamp
+
+    def _add_name(self, name):
+        if self.backend.sorted_by_name:
+            insort(self._names, name, key=str.casefold)
+        else:
+            self._names.append(name)
+        self._name_set.add(name)
+
+    def _remove_name(self, name):
+        self._names.remove(name)
+        self._name_set.discard(name)
+
+    def _load(self, name):
+        try:
+            with metrics.span("read"):
+                if self.shared:
+                    # Taken before reading, so a concurrent write is detected on next use
+                    self._stamps[name] = self._stamp(name)
+                text = self.backend.load(name)
+                records = self.journal.read(name) if self.journal is not None else None
+            metrics.increment("profile_reads")
+            with metrics.span("validate"):
+                profile, migrated = _decode(text, records, self.migrations)
+        except Exception:
+            return _CORRUPT
+        if migrated:
+            self._migrated.add(name)
+            metrics.increment("profile_migrations")
+        if text is not None:
+            self._digests[name] = _digest(text)
+        return profile
+
+    def _evict(self):
+        """Drops the least recently used clean profiles beyond max_resident. Requires _lock."""
+        excess = len(self._profiles) - self.max_resident
+        if excess <= 0:
+            return
+        victims = []
+        for name in self._profiles:
+            if name not in self._dirty and name not in self._journaling:
+                victims.append(name)
+                if len(victims) == excess:
+                    break
+        for name in victims:
+            del self._profiles[name]
+            self._migrated.discard(name)
+            self._digests.pop(name, None)
+            self._stamps.pop(name, None)
+
+    def _append_to_journal(self, name, previous, profile):
+        """
+        Journals the change from previous (None if unknown) to profile. Returns whether the
+        change is stored, and the journal is still below journal_max_bytes. Requires lock(name).
+        """
+        record = profile_record(previous, profile)
+        if record is None:
+            return True
+        try:
+            with metrics.span("write"):
+                size = self.journal.append(name, record)
+        except OSError:
+            logger.exception("Failed to journal a change to profile %r", name)
+            return False
+        metrics.increment("journal_appends")
+        if self.shared:
+            stamp = self._stamp(name)
+            with self._lock:
+                self._stamps[name] = stamp
+            self._log_changes([name])
+        return size < self.journal_max_bytes
+
+    def _serialize(self, profile):
+        return profile.model_dump_json(indent=None if self.compact else 2)
+
+    def _bump_version(self, name):
+        self._versions[name] = self._versions.get(name, 0) + 1
+        self._generation += 1
+        if len(self._history) == self._history.maxlen:
+            self._history_start = self._history[0][0]
+        self._history.append((self._generation, name))
+
+    # --- Reads ---
+    def names(self):
+        """Returns the names of all known profiles."""
+        with self._lock:
+            self._warm_up()
+            return list(self._names)
+
+    def __contains__(self, name):
+        with self._lock:
+            self._warm_up()
+            return name in self._name_set
+
+    def version(self, name):
+        """Returns a counter that changes whenever the profile stored under name changes."""
+        if self.shared:
+            with self._lock:
+                self._refresh(name)
+        return self._versions.get(name, 0)
+
+    def generation(self):
+        """Returns a counter that changes whenever any profile is added, changed or removed."""
+        with self._lock:
+            if self.shared:
+                self._warm_up()
+                self._catch_up()
+            return self._generation
+
+    def changed_since(self, generation):
+        """
+        Returns the names of the profiles added, changed or removed after the given
+        generation, or None if that is too long ago to tell. Profiles other processes
+        changed are included up to the last call to `generation`.
+        """
+        with self._lock:
+            if generation < self._history_start:
+                return None
+            names = set()
+            for change_generation, name in reversed(self._history):
+                if change_generation <= generation:
+                    break
+                names.add(name)
+            return names
+
+    def get(self, name):
+        """
+        Returns the Profile stored under name, or None if there is no such profile.
+        Raises CorruptProfileError if the stored data cannot be decoded.
+        """
+        with self._lock:
+            self._warm_up()
+            self._refresh(name)
+            if name not in self._name_set:
+                return None
+            profile = self._profiles.get(name)
+            if profile is None:
+                profile = self._profiles[name] = self._load(name)
+                if self.max_resident is not None:
+                    self._evict()
+            elif self.max_resident is not None:
+                # Moved to the end, as the most recently used
+                self._profiles[name] = self._profiles.pop(name)
+        if profile is _CORRUPT:
+            raise CorruptProfileError(name)
+        return profile
+
+    # --- Writes ---
+    def put(self, name, profile):
+        """Stores a Profile under name and schedules it to be persisted."""
+        # Held around the journal append, which runs outside _lock, so the changes to a
+        # profile are journaled in order and never while its journal is being emptied
+        with self.lock(name):
+            with self._lock:
+                self._warm_up()
+                new = name not in self._name_set
+                if new:
+                    self._add_name(name)
+                previous = self._profiles.pop(name, None)
+                # Records would not apply to a migrated profile's stored version, and a corrupt
+                # profile has no usable snapshot, so both are journaled whole and written out again
+                rewrite = name in self._migrated or previous is _CORRUPT
+                self._migrated.discard(name)
+                self._profiles[name] = profile
+                self._bump_version(name)
+                # A pending delete of the name stays, so a profile created again is stored anew
+                # rather than in the old one's place
+                journal = self.journal is not None and not new
+                if not journal or rewrite:
+                    self._dirty.add(name)
+                if journal:
+                    self._journaling.add(name)
+                if self.max_resident is not None:
+                    self._evict()
+            if journal:
+                try:
+                    journaled = self._append_to_journal(name, None if rewrite else previous, profile)
+                finally:
+                    with self._lock:
+                        self._journaling.discard(name)
+                if not journaled:
+                    with self._lock:
+                        self._profiles.setdefault(name, profile)
+                        self._dirty.add(name)
+            with self._lock:
+                if name not in self._dirty:
+                    return
+                write_through = self.shared or (new and self.journal is not None)
+                if not write_through:
+                    self._start_writer()
+                    if len(self._dirty) >= self.max_dirty:
+                        self._wake.set()
+            if write_through:
+                self._write_through(name)
+
+    def delete(self, name):
+        """Removes a profile from memory and schedules it to be deleted from storage."""
+        with self._lock:
+            self._warm_up()
+            if name in self._name_set:
+                self._remove_name(name)
+            self._profiles.pop(name, None)
+            self._migrated.discard(name)
+            self._bump_version(name)
+            self._dirty.discard(name)
+            self._deleted.add(name)
+            if not self.shared:
+                self._start_writer()
+        if self.shared:
+            self._write_through(name)
+
+    def rename(self, old_name, new_name):
+        """Moves a profile to a new name in memory and in storage, replacing any profile there."""
+        if old_name == new_name:
+            return
+        with self._flush_lock, self._lock:
+            self._warm_up()
+            if old_name not in self._name_set:
+                raise KeyError(old_name)
+            # Bring storage up to date so the backend can rename in one step. Everything is
+            # flushed, so new profiles are still stored in the order they were created.
+            discards = self._flush_names()
+            if self.journal is not None:
+                # The replaced profile's journal must not be replayed over the renamed one
+                self.journal.delete(new_name)
+            self.backend.rename(old_name, new_name)
+            if self.journal is not None:
+                self.journal.rename(old_name, new_name)
+                if self.journal.sync:
+                    self.backend.sync()
+            self._log_changes([old_name, new_name])
+
+            if new_name in self._name_set:
+                self._remove_name(new_name)
+            if self.backend.sorted_by_name:
+                self._remove_name(old_name)
+                self._add_name(new_name)
+            else:
+                # Renamed in place, like the stored profile
+                self._names[self._names.index(old_name)] = new_name
+                self._name_set.discard(old_name)
+                self._name_set.add(new_name)
+            for mapping in (self._profiles, self._digests):
+                if old_name in mapping:
+                    mapping[new_name] = mapping.pop(old_name)
+                else:
+                    mapping.pop(new_name, None)
+            self._migrated.discard(new_name)
+            if old_name in self._migrated:
+                self._migrated.remove(old_name)
+                self._migrated.add(new_name)
+            self._bump_version(old_name)
+            self._bump_version(new_name)
+            if self.shared:
+                self._stamps.pop(old_name, None)
+                self._stamps[new_name] = self._stamp(new_name)
+        self._discard_journals(discards)
+
+    def clear(self):
+        """Removes every profile."""
+        with self._lock:
+            for name in self.names():
+                self.delete(name)
+
+    # --- Locking ---
+    def lock(self, name=None):
+        """
+        Holds an exclusive lock on the profile stored under name, or on the set of profiles
+        as a whole if name is None, for the duration of a with block. Locks are reentrant.
+        To avoid deadlocks, take the whole-store lock before any profile lock, and profile
+        locks in sorted order.
+        """
+        return self._hold(_STORE_LOCK if name is None else name)
+
+    def settings_lock(self):
+        """
+        Holds an exclusive lock on the settings stored beside the profiles. Take it after
+        any profile lock, and take no profile lock while holding it.
+        """
+        return self._hold(_SETTINGS_LOCK)
+
+    @contextmanager
+    def _hold(self, key):
+        with self._thread_locks_guard:
+            thread_lock = self._thread_locks.setdefault(key, RLock())
+        with thread_lock:
+            if not self.shared or fcntl is None:
+                yield
+                return
+            # Only the thread holding thread_lock touches this entry
+            held = self._file_locks.get(key)
+            if held is None:
+                held = self._file_locks[key] = [self._acquire_file_lock(key), 0]
+            held[1] += 1
+            try:
+                yield
+            finally:
+                held[1] -= 1
+                if held[1] == 0:
+                    del self._file_locks[key]
+                    os.close(held[0])  # Closing the descriptor releases the lock
+
+    def _acquire_file_lock(self, key):
+        file_name = _LOCK_FILE_NAMES.get(key) if not isinstance(key, str) else None
+        if file_name is None:
+            file_name = blake2b(key.encode(), digest_size=16).hexdigest() + ".lock"
+        try:
+            fd = os.open(self.lock_dir / file_name, os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.lock_dir / file_name, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    # --- Persistence ---
+    def add_flush_hook(self, hook):
+        """Registers a callable that runs on every flush, to persist other write-behind state."""
+        self._flush_hooks.append(hook)
+
+    def schedule_flush(self):
+        """Makes sure the background writer is running to pick up changes held by flush hooks."""
+        with self._lock:
+            self._start_writer()
+
+    def _write_through(self, name):
+        with self._flush_lock:
+            discards = self._flush_names({name})
+        self._discard_journals(discards)
+
+    def _flush_names(self, names=None):
+        """
+        Persists pending changes, only for the given names if provided. Requires _flush_lock.
+        Returns the journal records to discard with _discard_journals once _flush_lock is
+        released, as (name, flush number, journal stamp) for each profile.
+        """
+        self._flush_count += 1
+        flush_number = self._flush_count
+        journal_stamps = {}
+        if self.journal is not None:
+            with self._lock:
+                dirty_names = set(self._dirty if names is None else self._dirty & names)
+            # A profile changes in memory before the change is journaled, so the records up to
+            # here are included in the snapshots taken below
+            for name in dirty_names:
+                stamp = self.journal.stamp(name)
+                if stamp is not None:
+                    journal_stamps[name] = stamp
+        with self._lock:
+            deleted = self._deleted if names is None else self._deleted & names
+            dirty_names = self._dirty if names is None else self._dirty & names
+            dirty = {name: self._profiles[name] for name in dirty_names}
+            journal_stamps = {name: stamp for name, stamp in journal_stamps.items() if name in dirty}
+            self._deleted = self._deleted - deleted
+            self._dirty = self._dirty - dirty_names
+
+        if deleted:
+            try:
+                with metrics.span("write"):
+                    if self.journal is not None:
+                        # Journals go first, so a crash cannot leave one to be replayed over a new profile
+                        for name in deleted:
+                            self.journal.delete(name)
+                    self.backend.delete_many(deleted)
+                metrics.increment("profile_deletes", len(deleted))
+                self._log_changes(deleted)
+                for name in deleted:
+                    self._digests.pop(name, None)
+                    self._stamps.pop(name, None)
+                    self._discarded.pop(name, None)
+            except Exception:
+                logger.exception("Failed to delete profiles %s", sorted(deleted))
+                with self._lock:
+                    self._deleted |= {name for name in deleted if name not in self._name_set}
+
+        if not self.backend.sorted_by_name and len(dirty) > 1:
+            # Backends listing profiles in creation order store new ones in the order given
+            with self._lock:
+                position = {name: index for index, name in enumerate(self._names)}
+            dirty = dict(sorted(dirty.items(), key=lambda item: position.get(item[0], len(position))))
+        pending = {}
+        for name, profile in dirty.items():
+            text = self._serialize(profile)
+            digest = _digest(text)
+            # Another process may have changed the stored copy, so shared stores always write
+            if self.shared or self._digests.get(name) != digest:
+                pending[name] = (text, digest)
+        if pending:
+            try:
+                with metrics.span("write"):
+                    self.backend.save_many([(name, text) for name, (text, _) in pending.items()])
+                metrics.increment("profile_writes", len(pending))
+                self._log_changes(pending)
+            except Exception:
+                logger.exception("Failed to write profiles %s", sorted(pending))
+                with self._lock:
+                    for name in pending:
+                        # Skips profiles deleted meanwhile, and restores any dropped from memory
+                        if name in self._name_set:
+                            self._profiles.setdefault(name, dirty[name])
+                            self._dirty.add(name)
+                return []
+        discards = [(name, flush_number, stamp) for name, stamp in journal_stamps.items()]
+        if self.journal is not None and self.journal.sync and (pending or discards):
+            # Journal records are only discarded once the snapshots that include them are durable
+            try:
+                self.backend.sync()
+            except Exception:
+                logger.exception("Failed to sync profiles %s", sorted(pending))
+                discards = []
+        stamps = {name: self._stamp(name) for name in pending} if self.shared else {}
+        with self._lock:
+            for name, (_, digest) in pending.items():
+                self._digests[name] = digest
+            self._stamps.update(stamps)
+        return discards
+
+    def _discard_journals(self, discards):
+        """
+        Removes journal records that stored snapshots include, as returned by _flush_names.
+        Takes each profile's lock, so records are not appended meanwhile.
+        """
+        for name, flush_number, (inode, size) in discards:
+            with self.lock(name):
+                # A later flush may have emptied the journal already, and new records may
+                # have started another one since
+                if self._discarded.get(name, 0) > flush_number:
+                    continue
+                stamp = self.journal.stamp(name)
+                if stamp is None or stamp[0] != inode or stamp[1] < size:
+                    continue
+                self._discarded[name] = flush_number
+                try:
+                    self.journal.discard(name, size)
+                except OSError:
+                    # Harmless, since replaying records the snapshot includes changes nothing
+                    logger.exception("Failed to compact the journal of profile %r", name)
+
+    def flush(self):
+        """Persists all pending changes."""
+        with self._flush_lock:
+            discards = self._flush_names()
+        self._discard_journals(discards)
+        for hook in self._flush_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception("Flush hook %r failed", hook)
+
+    def _start_writer(self):
+        if self._writer is None:
+            self._writer = Thread(target=self._run_writer, name="profile-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.stop)
+
+    def _run_writer(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self):
+        """Stops the background writer and flushes any remaining changes."""
+        self._stopping.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+            atexit.unregister(self.stop)
+        self.flush()
+        self.backend.close()
@@ -0,0 +1,185 @@
+"""
+Bulk profile tools, run through app.py:
+
+  export  streams every profile into one JSON-lines file, compressed by its extension
+  import  streams the profiles in such a file back into storage
+  scan    validates every stored profile in a pool of worker processes and reports
+          the corrupt ones
+
+Each line of an export is {"name": ..., "profile": {...}}. Profiles pass through one at
+a time, so memory use does not grow with the number of profiles. Run imports while the
+server is stopped, or with SHARED_PROFILE_STORAGE set so the two coordinate.
+"""
+
+import bz2
+import gzip
+import lzma
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+from . import json_codec, profile_manager
+from .profile_model import Profile
+from .profile_store import CorruptProfileError, decode_profile
+from .tenants import is_session_id
+
+# Compressed export formats, by file extension
+_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+# Imported profiles are written out every this many, so they do not pile up in memory
+IMPORT_FLUSH_EVERY = 1000
+# Profiles validated per task in the integrity scan
+SCAN_CHUNK_SIZE = 500
+
+
+def open_export(path, mode):
+    """Opens an export file for binary reading ("r") or writing ("w"), compressed by its extension."""
+    return _OPENERS.get(Path(path).suffix, open)(path, mode + "b")
+
+
+# --- Export & Import ---
+def _upgrade(store, data):
+    # Exports made before a migration are upgraded like stored profiles
+    return data if store.migrations is None or not isinstance(data, dict) else store.migrations.upgrade(data)
+
+
+def export_profiles(path):
+    """Writes every profile to an export file. Corrupt profiles are left out and listed."""
+    start = perf_counter()
+    exported, corrupt = 0, []
+    with open_export(path, "w") as export_file:
+        for name in profile_manager.get_profile_list():
+            try:
+                profile = profile_manager.get_profile(name)
+            except CorruptProfileError:
+                corrupt.append(name)
+                continue
+            if profile is None:
+                continue  # Deleted meanwhile
+            export_file.write(json_codec.dumps({"name": name, "profile": profile.model_dump(mode="json")}) + b"\n")
+            exported += 1
+    return {"exported": exported, "corrupt": corrupt, "seconds": perf_counter() - start}
+
+
+def import_profiles(path, replace=False):
+    """
+    Adds the profiles in an export file. A profile named like an existing one, ignoring
+    case, is skipped, or replaces it if replace is set. Lines that are not valid profiles
+    are skipped and their line numbers listed.
+    """
+    start = perf_counter()
+    store = profile_manager.PROFILE_STORE
+    existing = {name.lower(): name for name in profile_manager.get_profile_list()}
+    result = {"imported": 0, "replaced": 0, "skipped": 0, "invalid": []}
+    with open_export(path, "r") as export_file:
+        for line_number, line in enumerate(export_file, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json_codec.loads(line)
+                name, profile = entry["name"], Profile.model_validate(_upgrade(store, entry["profile"]))
+                if not isinstance(name, str) or not name or name.isspace():
+                    raise ValueError("Profile name cannot be empty")
+            except (ValueError, KeyError, TypeError):
+                result["invalid"].append(line_number)
+                continue
+
+            current = existing.get(name.lower())
+            if current is not None and not replace:
+                result["skipped"] += 1
+                continue
+            target = current or name
+            with store.lock(), store.lock(target):
+                profile_manager.write_profile(target, profile)
+            existing[name.lower()] = target
+            result["replaced" if current is not None else "imported"] += 1
+            if (result["imported"] + result["replaced"]) % IMPORT_FLUSH_EVERY == 0:
+                store.flush()
+    store.flush()
+    result["seconds"] = perf_counter() - start
+    return result
+
+
+# --- Integrity Scan ---
+_scan_storage = None  # (backend, journal, migrations) in each scan worker
+
+
+def _init_scan_worker(backend, journal, migrations):
+    global _scan_storage
+    _scan_storage = backend, journal, migrations
+
+
+def _describe_error(error):
+    errors = getattr(error, "errors", None)
+    if callable(errors):
+        # A pydantic ValidationError: report the first problem and where it is
+        first = errors()[0]
+        return f"{'.'.join(map(str, first['loc'])) or 'profile'}: {first['msg']}"
+    return str(error) or type(error).__name__
+
+
+def _scan_chunk(names):
+    """Validates the stored profiles with the given names. Returns (name, problem) pairs for corrupt ones."""
+    backend, journal, migrations = _scan_storage
+    corrupt = []
+    for name in names:
+        text = backend.load(name)
+        records = journal.read(name) if journal is not None else None
+        if text is None and not records:
+            continue  # Deleted meanwhile
+        try:
+            decode_profile(text, records, migrations)
+        except Exception as error:
+            corrupt.append((name, _describe_error(error)))
+    return corrupt
+
+
+def scan_profiles(workers=None):
+    """
+    Validates every stored profile against the Profile model, reading storage directly in
+    `workers` processes (one per CPU by default). Lists the corrupt profiles.
+    """
+    start = perf_counter()
+    store = profile_manager.PROFILE_STORE
+    names = store.names()
+    chunks = [names[i:i + SCAN_CHUNK_SIZE] for i in range(0, len(names), SCAN_CHUNK_SIZE)]
+    corrupt = []
+    storage = (store.backend, store.journal, store.migrations)
+    with ProcessPoolExecutor(workers, initializer=_init_scan_worker, initargs=storage) as pool:
+        for chunk_corrupt in pool.map(_scan_chunk, chunks):
+            corrupt.extend(chunk_corrupt)
+    return {"scanned": len(names), "corrupt": corrupt, "seconds": perf_counter() - start}
+
+
+# --- Command Line ---
+def run_profile_command(args):
+    """Runs the export, import or scan command parsed by app.py's docopt usage. Returns the exit status."""
+    session_id = args["--session"]
+    if session_id is not None and not (profile_manager.MULTI_TENANT and is_session_id(session_id)):
+        print("--session requires MULTI_TENANT=1 and a 32-character hexadecimal session ID")
+        return 2
+
+    with profile_manager.tenant_session(session_id):
+        if args["export"]:
+            result = export_profiles(args["<file>"])
+            print(f"Exported {result['exported']} profiles to {args['<file>']} in {result['seconds']:.1f}s")
+            for name in result["corrupt"]:
+                print(f"Skipped corrupt profile {name!r}")
+            status = 1 if result["corrupt"] else 0
+        elif args["import"]:
+            result = import_profiles(args["<file>"], replace=args["--replace"])
+            print(f"Imported {result['imported']} profiles, replaced {result['replaced']} and skipped "
+                  f"{result['skipped']} existing ones in {result['seconds']:.1f}s")
+            if result["invalid"]:
+                print(f"Skipped {len(result['invalid'])} invalid lines: "
+                      f"{', '.join(map(str, result['invalid'][:20]))}{' ...' if len(result['invalid']) > 20 else ''}")
+            status = 1 if result["invalid"] else 0
+        else:
+            workers = int(args["--workers"]) if args["--workers"] else None
+            result = scan_profiles(workers)
+            print(f"Scanned {result['scanned']} profiles in {result['seconds']:.1f}s: "
+                  f"{len(result['corrupt'])} corrupt")
+            for name, problem in result["corrupt"]:
+                print(f"  {name}: {problem}")
+            status = 1 if result["corrupt"] else 0
+    profile_manager.close_tenants()
+    return status
@@ -392,9 +392,9 @@ async function handleAction(event) {
         recentGains.xp[gain.skill] =
           (recentGains.xp[gain.skill] || 0) + gain.xp;
       }
-      if (gain.item && gain.quantity) {
-        recentGains.items[gain.item] =
-          (recentGains.items[gain.item] || 0) + gain.quantity;
+      // Net item changes; consumed ingredients are negative
+      for (const [item, quantity] of Object.entries(gain.items || {})) {
+        recentGains.items[item] = (recentGains.items[item] || 0) + quantity;
       }
     }
 
@@ -409,11 +409,10 @@ async function handleAction(event) {
   }
 }
 
-["gather-wood-button", "mine-stone-button", "forage-herbs-button"].forEach(
-  (id) => {
-    document.getElementById(id).addEventListener("click", handleAction);
-  }
-);
+// Each button's id is the id of the action it performs
+document.querySelectorAll("#collect .action-button").forEach((button) => {
+  button.addEventListener("click", handleAction);
+});
 
 migrateProfileButton.addEventListener("click", async () => {
   await fetchApi("/api/profile/migrate", { method: "POST" });
@@ -0,0 +1,72 @@
+"""
+Skill XP of many profiles packed into one flat array of doubles, so derived values such as
+levels can be computed for a whole batch of profiles at once instead of skill by skill.
+
+Every skill name has a fixed column, assigned by SkillColumns: the skills from
+init_profile.json first, then any others in the order they are first seen. A matrix has
+one row per profile and NaN where a profile has no XP in a skill. Stored XP is always
+finite, so NaN cannot be mistaken for a real total. The array can be handed to NumPy
+without copying. Integer totals beyond 2**53 would be rounded as doubles, so a batch with
+any of them is packed into a list instead, keeping every total exact.
+"""
+
+from array import array
+from math import nan
+from threading import Lock
+
+
+class SkillColumns:
+    """Assigns each skill name a fixed column. Columns are only ever added, never reordered."""
+
+    def __init__(self, skills=()):
+        self._lock = Lock()
+        self.index = {}  # skill name -> column
+        for skill in skills:
+            self.column(skill)
+
+    def column(self, skill):
+        """Returns the column of a skill, assigning the next free one to a new skill."""
+        column = self.index.get(skill)
+        if column is None:
+            with self._lock:
+                column = self.index.setdefault(skill, len(self.index))
+        return column
+
+    def __len__(self):
+        return len(self.index)
+
+
+class SkillMatrix:
+    """The XP totals of several profiles. Row r, column c is values[r * width + c]."""
+
+    __slots__ = ("values", "width", "rows")
+
+    def __init__(self, values, width, rows):
+        self.values = values
+        self.width = width
+        self.rows = rows
+
+    @classmethod
+    def pack(cls, columns, skill_dicts):
+        """Packs dicts of skill name -> total XP into a matrix with one row per dict."""
+        index = columns.index
+        for skills in skill_dicts:
+            if not index.keys() >= skills.keys():
+                for skill in skills:
+                    columns.column(skill)
+        # Read after every skill has a column, so the width covers them all
+        width = len(columns)
+        values = array("d", [nan]) * (width * len(skill_dicts))
+        offset, inexact = 0, []
+        for skills in skill_dicts:
+            for skill, total_xp in skills.items():
+                position = offset + index[skill]
+                values[position] = total_xp
+                if values[position] != total_xp:
+                    inexact.append((position, total_xp))
+            offset += width
+        if inexact:
+            values = values.tolist()
+            for position, total_xp in inexact:
+                values[position] = total_xp
+        return cls(values, width, len(skill_dicts))
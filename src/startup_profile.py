@@ -0,0 +1,196 @@
+"""
+Measures the cost of starting the server in a fresh interpreter.
+
+Each startup phase (heavy imports, app setup, content loading, profile warm-up) is timed
+and its memory allocations are traced. `-X importtime` gives the time of each individual
+import, and the allocations of each newly imported module are traced around its import
+statement. Run through `app.py --profile-startup`, or call run_startup_profile().
+"""
+
+import builtins
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import nullcontext
+from importlib.util import resolve_name
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+
+def _warm_profiles():
+    from src import profile_manager
+    profile_manager.get_processed_profiles(profile_manager.get_profile_list())
+
+
+def _compile_actions():
+    from src import profile_manager
+    profile_manager.get_action_table()
+
+
+def _load_static_assets():
+    from src.http_cache import STATIC_ASSETS
+    STATIC_ASSETS.load()
+
+
+def _load_content():
+    from src.content import REGISTRY
+    REGISTRY.load()
+
+
+# Startup phases in the order the server goes through them. Imports go through __import__,
+# as import statements do, so _ImportAllocations sees them.
+PHASES = [
+    ("import flask", lambda: __import__("flask")),
+    ("import pydantic", lambda: __import__("pydantic")),
+    ("import docopt", lambda: __import__("docopt")),
+    ("import src.profile_manager", lambda: __import__("src.profile_manager")),
+    ("import app", lambda: __import__("app")),
+    ("load content", _load_content),
+    ("compile actions", _compile_actions),
+    ("load static assets", _load_static_assets),
+    ("warm profiles", _warm_profiles),
+]
+
+
+class _ImportAllocations:
+    """
+    Replaces builtins.__import__ while in use, to record the memory still allocated after
+    each module is first imported, by the module itself and including its own imports.
+    """
+
+    def __init__(self):
+        self.modules = {}  # module -> (self bytes, cumulative bytes)
+        self._children = []  # Cumulative bytes of the nested imports of each import in progress
+        self._import = None
+
+    def __enter__(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._traced_import
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__ = self._import
+
+    def _traced_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = name
+        if level:
+            try:
+                module = resolve_name("." * level + name, globals.get("__package__") if globals else None)
+            except (ImportError, ValueError):
+                module = None  # Left for the import itself to report
+        if module is None or module in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        self._children.append(0)
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = tracemalloc.get_traced_memory()[0] - before
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += cumulative
+            self.modules[module] = (cumulative - children, cumulative)
+
+
+def _run_phases(trace_malloc):
+    """
+    Runs every phase in this interpreter. Returns one measurement per phase, and with
+    trace_malloc, the (module, self_bytes, cumulative_bytes) allocated by each import.
+    """
+    results = []
+    import_allocations = _ImportAllocations()
+    if trace_malloc:
+        tracemalloc.start()
+    with import_allocations if trace_malloc else nullcontext():
+        for label, phase in PHASES:
+            modules_before = len(sys.modules)
+            if trace_malloc:
+                tracemalloc.reset_peak()
+                allocated_before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            phase()
+            result = {
+                "phase": label,
+                "seconds": time.perf_counter() - start,
+                "modules": len(sys.modules) - modules_before,
+            }
+            if trace_malloc:
+                current, peak = tracemalloc.get_traced_memory()
+                result["allocated_bytes"] = current - allocated_before
+                result["peak_bytes"] = peak - allocated_before
+            results.append(result)
+    return results, [(module, *sizes) for module, sizes in import_allocations.modules.items()]
+
+
+def _parse_importtime(stderr):
+    """Parses `-X importtime` output into (module, self_us, cumulative_us) tuples."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def _run_child(*args):
+    completed = subprocess.run(
+        [sys.executable, *args, "-m", "src.startup_profile"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.splitlines()[-1]), completed.stderr
+
+
+def run_startup_profile(top=15):
+    """
+    Profiles a cold start in fresh interpreters. Timings come from a run without
+    tracemalloc, which would otherwise slow the imports down, and allocations, per phase
+    and per import, from a second run.
+    """
+    (phases, _), stderr = _run_child("-X", "importtime")
+    (traced_phases, import_allocations), _ = _run_child("-X", "tracemalloc")
+    for phase, traced in zip(phases, traced_phases):
+        phase["allocated_bytes"] = traced["allocated_bytes"]
+        phase["peak_bytes"] = traced["peak_bytes"]
+    imports = sorted(_parse_importtime(stderr), key=lambda i: i[2], reverse=True)
+    import_allocations.sort(key=lambda i: i[2], reverse=True)
+    return {
+        "total_seconds": sum(phase["seconds"] for phase in phases),
+        "phases": phases,
+        "imports": [
+            {"module": module, "self_us": self_us, "cumulative_us": cumulative_us}
+            for module, self_us, cumulative_us in imports[:top]
+        ],
+        "import_allocations": [
+            {"module": module, "self_bytes": self_bytes, "cumulative_bytes": cumulative_bytes}
+            for module, self_bytes, cumulative_bytes in import_allocations[:top]
+        ],
+    }
+
+
+def format_startup_report(report):
+    """Formats a startup profile as a plain-text table."""
+    lines = [f"{'Phase':<28}{'Time (ms)':>12}{'Allocated (KiB)':>18}{'Peak (KiB)':>13}{'Modules':>10}"]
+    for phase in report["phases"]:
+        lines.append(
+            f"{phase['phase']:<28}{phase['seconds'] * 1000:>12.1f}"
+            f"{phase['allocated_bytes'] / 1024:>18.1f}{phase['peak_bytes'] / 1024:>13.1f}"
+            f"{phase['modules']:>10}")
+    lines.append(f"{'Total':<28}{report['total_seconds'] * 1000:>12.1f}")
+    lines.append("")
+    lines.append(f"{'Slowest imports (cumulative)':<44}{'Self (ms)':>12}{'Cumulative (ms)':>18}")
+    for entry in report["imports"]:
+        lines.append(
+            f"{entry['module']:<44}{entry['self_us'] / 1000:>12.1f}{entry['cumulative_us'] / 1000:>18.1f}")
+    lines.append("")
+    lines.append(f"{'Largest imports (cumulative)':<44}{'Self (KiB)':>12}{'Cumulative (KiB)':>18}")
+    for entry in report["import_allocations"]:
+        lines.append(
+            f"{entry['module']:<44}{entry['self_bytes'] / 1024:>12.1f}{entry['cumulative_bytes'] / 1024:>18.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(json.dumps(_run_phases(trace_malloc=tracemalloc.is_tracing())))
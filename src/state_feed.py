@@ -0,0 +1,215 @@
+"""
+A feed of game state changes for streaming clients (Server-Sent Events).
+
+Mutations only call mark_changed(). The diff against the last published snapshot is
+computed when a client asks for events, so changes cost nothing while nobody is listening
+and a burst of changes coalesces into one event. Each event carries a cursor in its id;
+a client reconnecting with that id (the Last-Event-ID header) receives one merged diff of
+everything it missed, or the full state if the cursor is too old or from an earlier run.
+
+Diffs mirror the snapshot: nested dicts hold only the changed keys, None marks a removed
+key, and any other value (including lists) replaces the old one.
+"""
+
+from collections import deque
+from secrets import token_hex
+from threading import Condition, Lock
+
+from . import json_codec
+
+KEEPALIVE_SECONDS = 15.0
+
+
+def diff_state(old, new):
+    """Returns the changes that turn the dict old into the dict new."""
+    changes = {}
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+            continue
+        old_value = old[key]
+        if old_value is value:  # Cached processed profiles are reused while unchanged
+            continue
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            nested = diff_state(old_value, value)
+            if nested:
+                changes[key] = nested
+        elif old_value != value:
+            changes[key] = value
+    for key in old.keys() - new.keys():
+        changes[key] = None
+    return changes
+
+
+def merge_changes(base, changes):
+    """Returns the diff base followed by the diff changes, without modifying either."""
+    merged = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_changes(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class StateEvent:
+    __slots__ = ("id", "kind", "data")
+
+    def __init__(self, event_id, kind, data):
+        self.id = event_id
+        self.kind = kind  # "state" for a full snapshot, "diff" for changes
+        self.data = data
+
+    def to_sse(self):
+        return f"id: {self.id}\nevent: {self.kind}\ndata: {json_codec.dumps_str(self.data)}\n\n"
+
+
+class StateFeed:
+    """
+    Publishes changes to the snapshot returned by build_snapshot, keeping the last
+    `history` diffs for catch-up. Set `poll_interval` when other processes can change
+    the state, so waiting clients periodically look for changes they were not told about.
+    """
+
+    def __init__(self, build_snapshot, history=256, poll_interval=None):
+        self.build_snapshot = build_snapshot
+        self.poll_interval = poll_interval
+        # Identifies this run, so cursors handed out before a restart are not reused
+        self.epoch = token_hex(4)
+        self._lock = Lock()
+        self._changed_condition = Condition(self._lock)
+        self._build_lock = Lock()
+        self._history = deque(maxlen=history)  # (sequence, diff)
+        self._sequence = 0
+        self._snapshot = None
+        self._changed = True
+        self._async_waiters = set()
+
+    def mark_changed(self):
+        """Records that the state may have changed and wakes up waiting clients."""
+        with self._lock:
+            self._changed = True
+            self._changed_condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _collect(self):
+        """Publishes a diff if the state changed since the last snapshot."""
+        # Snapshots are built without holding _lock, so a mutation that calls mark_changed
+        # while holding profile locks never waits on a snapshot that needs those locks
+        with self._build_lock:
+            with self._lock:
+                if not self._changed:
+                    return
+                self._changed = False
+            snapshot = self.build_snapshot()
+            with self._lock:
+                if self._snapshot is not None:
+                    changes = diff_state(self._snapshot, snapshot)
+                    if changes:
+                        self._sequence += 1
+                        self._history.append((self._sequence, changes))
+                self._snapshot = snapshot
+
+    def parse_cursor(self, event_id):
+        """Returns the sequence number in an event id from this run, or None."""
+        epoch, _, sequence = (event_id or "").partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def events_since(self, cursor):
+        """
+        Returns a StateEvent with everything that changed after cursor, or None if nothing
+        did. A cursor of None, or one no longer covered by the history, gets the full state.
+        """
+        self._collect()
+        with self._lock:
+            sequence, snapshot = self._sequence, self._snapshot
+            event_id = f"{self.epoch}-{sequence}"
+            if cursor == sequence:
+                return None
+            if cursor is None or cursor > sequence or not self._history or self._history[0][0] > cursor + 1:
+                return StateEvent(event_id, "state", snapshot)
+            changes = {}
+            for event_sequence, diff in self._history:
+                if event_sequence > cursor:
+                    changes = merge_changes(changes, diff)
+        return StateEvent(event_id, "diff", changes)
+
+    def _timeout(self, timeout):
+        return timeout if self.poll_interval is None else min(timeout, self.poll_interval)
+
+    def _timed_out(self):
+        if self.poll_interval is not None:
+            self.mark_changed()
+        return False
+
+    def wait(self, cursor, timeout=KEEPALIVE_SECONDS):
+        """
+        Blocks until the state may have changed after cursor, or timeout seconds pass.
+        Returns False on timeout.
+        """
+        with self._lock:
+            if self._changed or self._sequence != cursor:
+                return True
+            if self._changed_condition.wait(self._timeout(timeout)):
+                return True
+        return self._timed_out()
+
+    async def wait_async(self, cursor, timeout=KEEPALIVE_SECONDS):
+        """Like wait(), but suspends the calling coroutine instead of blocking a thread."""
+        from asyncio import get_running_loop, wait_for
+
+        loop = get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._lock:
+            if self._changed or self._sequence != cursor:
+                return True
+            self._async_waiters.add(waiter)
+        try:
+            await wait_for(future, self._timeout(timeout))
+            return True
+        except TimeoutError:
+            return self._timed_out()
+        finally:
+            with self._lock:
+                self._async_waiters.discard(waiter)
+
+    def stream(self, last_event_id=None, end_when_idle=False):
+        """
+        Yields Server-Sent Events text, starting after last_event_id, until closed. With
+        end_when_idle, the stream ends instead of sending its first keepalive.
+        """
+        cursor = self.parse_cursor(last_event_id)
+        while True:
+            event = self.events_since(cursor)
+            if event is not None:
+                cursor = self.parse_cursor(event.id)
+                yield event.to_sse()
+            elif not self.wait(cursor):
+                if end_when_idle:
+                    return
+                yield ": keepalive\n\n"
+
+    async def stream_async(self, last_event_id=None, end_when_idle=False):
+        """Like stream(), but builds snapshots in a worker thread and waits without one."""
+        from asyncio import to_thread
+
+        cursor = self.parse_cursor(last_event_id)
+        while True:
+            event = await to_thread(self.events_since, cursor)
+            if event is not None:
+                cursor = self.parse_cursor(event.id)
+                yield event.to_sse()
+            elif not await self.wait_async(cursor):
+                if end_when_idle:
+                    return
+                yield ": keepalive\n\n"
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,295 @@
+import os
+import sqlite3
+from pathlib import Path
+from secrets import token_hex
+from threading import Lock
+
+from .file_utils import atomic_write_text, fsync_directory
+
+
+class ProfileBackend:
+    """
+    Persists serialized profiles by name. The ProfileStore keeps decoded profiles in memory
+    and only talks to a backend to warm up and to flush changes.
+    """
+
+    # Whether list_names() returns names in alphabetical order, so new names are inserted
+    # in place rather than appended
+    sorted_by_name = False
+
+    def list_names(self):
+        """Returns all profile names in a stable order."""
+        raise NotImplementedError
+
+    def load(self, name):
+        """Returns the serialized profile stored under name, or None if there is none."""
+        raise NotImplementedError
+
+    def save_many(self, items):
+        """Stores each (name, text) pair, replacing existing profiles."""
+        raise NotImplementedError
+
+    def delete_many(self, names):
+        """Deletes the profiles with the given names, ignoring missing ones."""
+        raise NotImplementedError
+
+    def rename(self, old_name, new_name):
+        """Moves the profile stored under old_name to new_name."""
+        raise NotImplementedError
+
+    def stamp(self, name):
+        """
+        Returns a value that changes whenever the profile stored under name is written,
+        renamed or deleted by any process, or None if there is no such profile.
+        """
+        raise NotImplementedError
+
+    def list_stamp(self):
+        """Returns a value that changes whenever another process adds, renames or deletes a profile."""
+        raise NotImplementedError
+
+    def sync(self):
+        """Makes the profiles saved so far survive a power loss, not just a process crash."""
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(ProfileBackend):
+    """Keeps profiles in memory only, listed in creation order. Nothing survives a restart."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._profiles = {}  # name -> text
+        self._stamps = {}  # name -> number of the write that stored the profile
+        self._writes = 0
+
+    def list_names(self):
+        with self._lock:
+            return list(self._profiles)
+
+    def load(self, name):
+        with self._lock:
+            return self._profiles.get(name)
+
+    def save_many(self, items):
+        with self._lock:
+            for name, text in items:
+                self._writes += 1
+                self._profiles[name] = text
+                self._stamps[name] = self._writes
+
+    def delete_many(self, names):
+        with self._lock:
+            for name in names:
+                self._profiles.pop(name, None)
+                self._stamps.pop(name, None)
+
+    def rename(self, old_name, new_name):
+        with self._lock:
+            # Renamed in place, keeping the creation order
+            self._profiles = {new_name if name == old_name else name: text
+                              for name, text in self._profiles.items() if name != new_name}
+            self._writes += 1
+            self._stamps.pop(old_name)
+            self._stamps[new_name] = self._writes
+
+    def stamp(self, name):
+        with self._lock:
+            return self._stamps.get(name)
+
+    def list_stamp(self):
+        # Only this process can see the profiles
+        return None
+
+
+class JsonDirectoryBackend(ProfileBackend):
+    """
+    Stores each profile as <name>.json in a directory, listed in alphabetical order.
+    The directory is created with the first profile written to it.
+
+    The directory's own mtime changes with every atomic write, so the list stamp is kept
+    in a separate file that is only replaced when a profile is added, renamed or deleted.
+    """
+
+    sorted_by_name = True
+    LIST_STAMP_FILE = ".list-stamp"
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def _path(self, name):
+        return self.directory / f"{name}.json"
+
+    def _bump_list_stamp(self):
+        atomic_write_text(self.directory / self.LIST_STAMP_FILE, token_hex(8))
+
+    def list_names(self):
+        return sorted((p.stem for p in self.directory.glob("*.json")), key=str.casefold)
+
+    def load(self, name):
+        try:
+            return self._path(name).read_text()
+        except FileNotFoundError:
+            return None
+
+    def save_many(self, items):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        added = False
+        for name, text in items:
+            path = self._path(name)
+            added = added or not path.exists()
+            atomic_write_text(path, text)
+        if added:
+            self._bump_list_stamp()
+
+    def delete_many(self, names):
+        deleted = False
+        for name in names:
+            try:
+                self._path(name).unlink()
+                deleted = True
+            except FileNotFoundError:
+                pass
+        if deleted:
+            self._bump_list_stamp()
+
+    def rename(self, old_name, new_name):
+        os.replace(self._path(old_name), self._path(new_name))
+        self._bump_list_stamp()
+
+    def stamp(self, name):
+        try:
+            stat = self._path(name).stat()
+        except FileNotFoundError:
+            return None
+        # Atomic writes replace the file, so the inode changes along with the mtime
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def list_stamp(self):
+        try:
+            stat = (self.directory / self.LIST_STAMP_FILE).stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def sync(self):
+        # Profile files are fsynced as they are written; their renames are in the directory
+        if self.directory.exists():
+            fsync_directory(self.directory)
+
+
+class SqliteBackend(ProfileBackend):
+    """
+    Stores profiles in an SQLite database in WAL mode. Names are indexed for lookups,
+    profiles are listed in creation order, and batches, renames and deletes are transactional.
+    The database is created with the first profile written to it.
+    """
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self._lock = Lock()
+        self._conn = None
+
+    def _connection(self, create=True):
+        """
+        Returns the connection to the database, opening it on first use. Returns None rather
+        than creating the database unless create is set. Requires _lock.
+        """
+        if self._conn is None:
+            if not create and not self.db_file.exists():
+                return None
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " name TEXT NOT NULL UNIQUE,"
+                " data TEXT NOT NULL,"
+                " version INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(profiles)")}
+            if "version" not in columns:
+                conn.execute("ALTER TABLE profiles ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            # Counts additions, renames and deletes, but not writes to existing profiles
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS list_version ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " version INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO list_version VALUES (0, 0)")
+            for trigger, event in [("profile_added", "INSERT"), ("profile_deleted", "DELETE"),
+                                   ("profile_renamed", "UPDATE OF name")]:
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON profiles"
+                    " BEGIN UPDATE list_version SET version = version + 1; END"
+                )
+            self._conn = conn
+        return self._conn
+
+    def __reduce__(self):
+        # Pickled as its path, so another process opens its own connection
+        return SqliteBackend, (self.db_file,)
+
+    def _transaction(self, statements):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    conn.executemany(sql, params)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        """Returns the rows of a query, or no rows if the database does not exist yet."""
+        with self._lock:
+            conn = self._connection(create=False)
+            return [] if conn is None else conn.execute(sql, params).fetchall()
+
+    def list_names(self):
+        return [row[0] for row in self._query("SELECT name FROM profiles ORDER BY id")]
+
+    def load(self, name):
+        rows = self._query("SELECT data FROM profiles WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+
+    def save_many(self, items):
+        self._transaction([(
+            "INSERT INTO profiles (name, data) VALUES (?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = version + 1",
+            list(items),
+        )])
+
+    def delete_many(self, names):
+        self._transaction([("DELETE FROM profiles WHERE name = ?", [(name,) for name in names])])
+
+    def rename(self, old_name, new_name):
+        self._transaction([
+            ("DELETE FROM profiles WHERE name = ?", [(new_name,)]),
+            ("UPDATE profiles SET name = ?, version = version + 1 WHERE name = ?", [(new_name, old_name)]),
+        ])
+
+    def stamp(self, name):
+        rows = self._query("SELECT id, version FROM profiles WHERE name = ?", (name,))
+        return tuple(rows[0]) if rows else None
+
+    def list_stamp(self):
+        rows = self._query("SELECT version FROM list_version")
+        return rows[0][0] if rows else None
+
+    def sync(self):
+        with self._lock:
+            conn = self._connection(create=False)
+            if conn is not None:
+                # A checkpoint syncs the WAL first, making every committed transaction durable
+                conn.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
@@ -0,0 +1,156 @@
+"""
+Per-session tenancy.
+
+Each browser session is identified by a random ID in a cookie. In multi-tenant mode every
+session has its own tenant, with its own profiles and settings in a directory under
+data/tenants. The directories are sharded by a hash of the ID, so no single directory
+grows with the number of players. A tenant's directory is only created once something
+is written to it. Only the most recently used tenants are kept in memory: the rest are
+written out and dropped, and are loaded again on next use.
+"""
+
+import re
+from collections import OrderedDict
+from hashlib import blake2b
+from http.cookies import CookieError, SimpleCookie
+from pathlib import Path
+from secrets import token_hex
+from threading import Event, Lock
+
+SESSION_COOKIE = "number_sense_session"
+SESSION_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+_SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def new_session_id():
+    return token_hex(16)
+
+
+def is_session_id(value):
+    """Returns whether value is a well-formed session ID, and so safe to use in a path."""
+    return isinstance(value, str) and _SESSION_ID.fullmatch(value) is not None
+
+
+def session_id_from_cookies(cookie_header):
+    """Returns the session ID in a Cookie header value, or None if there is no valid one."""
+    if not cookie_header:
+        return None
+    try:
+        morsel = SimpleCookie(cookie_header).get(SESSION_COOKIE)
+    except CookieError:
+        return None
+    return morsel.value if morsel is not None and is_session_id(morsel.value) else None
+
+
+def session_cookie(session_id):
+    """Returns the Set-Cookie header value that stores a session ID in the browser."""
+    return f"{SESSION_COOKIE}={session_id}; Max-Age={SESSION_COOKIE_MAX_AGE}; Path=/; HttpOnly; SameSite=Lax"
+
+
+def tenant_directory(root: Path, tenant_id):
+    """Returns the directory of a tenant: root/<shard>/<tenant ID>, with 256 shards."""
+    shard = blake2b(tenant_id.encode(), digest_size=1).hexdigest()
+    return root / shard / tenant_id
+
+
+class TenantCache:
+    """
+    Keeps up to `max_resident` tenants in memory, created on demand by factory(tenant_id).
+    Tenants are pinned while in use and only the least recently used unpinned ones are
+    evicted, so the cache can briefly hold more. Evicted tenants are closed, which writes
+    out their pending changes, before the same tenant can be loaded again.
+    """
+
+    def __init__(self, factory, max_resident):
+        self.factory = factory
+        self.max_resident = max_resident
+        self._lock = Lock()
+        self._tenants = OrderedDict()  # tenant ID -> tenant, least recently used first
+        self._users = {}  # tenant ID -> number of holders
+        self._loading = {}  # tenant ID -> Event set once the tenant is loaded, or failed to load
+        self._closing = {}  # tenant ID -> Event set once the evicted tenant is closed
+
+    def acquire(self, tenant_id):
+        """
+        Returns the tenant with the given ID, loading it if needed, and pins it. Tenants are
+        loaded outside the cache lock, so loading one does not hold up requests for others.
+        """
+        while True:
+            with self._lock:
+                pending = self._closing.get(tenant_id) or self._loading.get(tenant_id)
+                if pending is None:
+                    tenant = self._tenants.get(tenant_id)
+                    if tenant is None:
+                        # Later requests for the tenant wait on this until it is loaded
+                        loading = self._loading[tenant_id] = Event()
+                    else:
+                        self._tenants.move_to_end(tenant_id)
+                        evicted = self._pin(tenant_id)
+                    break
+            pending.wait()
+        if tenant is None:
+            try:
+                tenant = self.factory(tenant_id)
+            finally:
+                with self._lock:
+                    del self._loading[tenant_id]
+                    if tenant is not None:
+                        self._tenants[tenant_id] = tenant
+                        evicted = self._pin(tenant_id)
+                loading.set()
+        self._close(evicted)
+        return tenant
+
+    def _pin(self, tenant_id):
+        """Pins a resident tenant. Returns the tenants evicted to make room. Requires _lock."""
+        self._users[tenant_id] = self._users.get(tenant_id, 0) + 1
+        return self._evict()
+
+    def release(self, tenant_id):
+        """Unpins a tenant returned by acquire."""
+        with self._lock:
+            self._users[tenant_id] -= 1
+            if not self._users[tenant_id]:
+                del self._users[tenant_id]
+            evicted = self._evict()
+        self._close(evicted)
+
+    def _evict(self):
+        """Removes the least recently used unpinned tenants beyond max_resident. Requires _lock."""
+        excess = len(self._tenants) - self.max_resident
+        evicted = []
+        for tenant_id, tenant in self._tenants.items():
+            if excess <= 0:
+                break
+            if tenant_id not in self._users:
+                evicted.append((tenant_id, tenant))
+                excess -= 1
+        for tenant_id, _ in evicted:
+            del self._tenants[tenant_id]
+            self._closing[tenant_id] = Event()
+        return evicted
+
+    def _close(self, evicted):
+        for tenant_id, tenant in evicted:
+            try:
+                tenant.close()
+            finally:
+                with self._lock:
+                    self._closing.pop(tenant_id).set()
+
+    def close_all(self):
+        """Closes every resident tenant, e.g. at shutdown."""
+        with self._lock:
+            evicted = list(self._tenants.items())
+            self._tenants.clear()
+            for tenant_id, _ in evicted:
+                self._closing[tenant_id] = Event()
+        self._close(evicted)
+
+    def __contains__(self, tenant_id):
+        """Returns whether a tenant is loaded, being loaded, or still writing out after eviction."""
+        with self._lock:
+            return tenant_id in self._tenants or tenant_id in self._loading or tenant_id in self._closing
+
+    def __len__(self):
+        return len(self._tenants)
@@ -0,0 +1,23 @@
+import pytest
+
+from src import profile_manager
+
+
+@pytest.fixture
+def tenant(tmp_path):
+    """Makes a tenant stored in a temporary directory the current one."""
+    tenant = profile_manager.Tenant("test", tmp_path)
+    token = profile_manager._current_tenant.set(tenant)
+    yield tenant
+    profile_manager._current_tenant.reset(token)
+    tenant.close()
+
+
+@pytest.fixture
+def shared_tenants(tmp_path, monkeypatch):
+    """Two tenants on the same storage, as two server processes sharing it would have."""
+    monkeypatch.setattr(profile_manager, "SHARED_PROFILE_STORAGE", True)
+    tenants = [profile_manager.Tenant("test", tmp_path) for _ in range(2)]
+    yield [tenant.bind for tenant in tenants]
+    for tenant in tenants:
+        tenant.close()
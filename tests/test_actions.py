@@ -0,0 +1,14 @@
+from src import profile_manager
+
+
+def test_batches_above_the_limit_are_rejected(tenant, monkeypatch):
+    monkeypatch.setattr(profile_manager, "MAX_BATCH_ACTIONS", 3)
+    profile_manager.new_profile("Adventurer")
+    profile_manager.select_profile(0)
+    entry = {"action_id": "gather-wood-button"}
+
+    assert "error" in profile_manager.handle_actions([entry] * 4)
+    assert profile_manager.get_profile("Adventurer").skills.get("woodcutting", 0) == 0
+
+    result = profile_manager.handle_actions([entry] * 3)
+    assert "error" not in result and result["recent_gain"]["actions"] == 3
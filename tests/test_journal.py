@@ -0,0 +1,116 @@
+from threading import Event, Thread
+
+from src import json_codec
+from src.journal import ProfileJournal, profile_record, replay
+from src.migrations import ProfileMigrations
+from src.profile_model import Profile
+from src.profile_store import ProfileStore, decode_profile
+from src.storage import JsonDirectoryBackend
+
+
+def make_store(tmp_path, **kwargs):
+    return ProfileStore(JsonDirectoryBackend(tmp_path / "profiles"), flush_interval=3600,
+                        journal=ProfileJournal(tmp_path / "journal", sync=True), **kwargs)
+
+
+def test_replay_over_snapshot_that_includes_some_records(tmp_path):
+    journal = ProfileJournal(tmp_path)
+    profiles = [Profile(skills={"mining": xp}, inventory={"stone": xp / 10}) for xp in (0, 10, 20, 30)]
+    for old, new in zip(profiles, profiles[1:]):
+        journal.append("a", profile_record(old, new))
+    # A record cut short by a crash, which must be skipped
+    with open(journal._path("a"), "ab") as journal_file:
+        journal_file.write(b'{"set": {"skills": {"mining": 9')
+
+    records = journal.read("a")
+    assert len(records) == 3
+    for included in range(len(profiles)):
+        # Snapshots written after some of the records replay to the same result
+        snapshot = profiles[included].model_dump_json()
+        assert Profile.model_validate(replay(snapshot, records)) == profiles[-1]
+
+
+def test_append_after_torn_record_keeps_the_new_record(tmp_path):
+    journal = ProfileJournal(tmp_path)
+    journal.append("a", {"set": {"skills": {"mining": 1}}})
+    with open(journal._path("a"), "ab") as journal_file:
+        journal_file.write(b'{"set": {"sk')
+    journal.append("a", {"set": {"skills": {"mining": 2}}})
+    assert journal.read("a") == [{"set": {"skills": {"mining": 1}}}, {"set": {"skills": {"mining": 2}}}]
+
+
+def test_whole_profile_record_stands_in_for_a_corrupt_snapshot():
+    profile = Profile(skills={"mining": 5})
+    records = [profile_record(None, profile), profile_record(profile, Profile(skills={"mining": 7}))]
+    assert decode_profile("not json", records) == Profile(skills={"mining": 7})
+
+
+def test_journaled_changes_survive_a_crash_before_the_flush(tmp_path):
+    store = make_store(tmp_path)
+    store.put("a", Profile(skills={"mining": 1}))
+    # New profiles are written right away, since a journal alone cannot be listed
+    assert (tmp_path / "profiles" / "a.json").exists()
+    store.put("a", Profile(skills={"mining": 2}))
+    store.put("a", Profile(skills={"mining": 3}, inventory={"stone": 1}))
+
+    # A store opened on the same files without flushing sees every change
+    assert make_store(tmp_path).get("a") == Profile(skills={"mining": 3}, inventory={"stone": 1})
+
+
+def test_compaction_keeps_the_journal_consistent(tmp_path):
+    store = make_store(tmp_path, journal_max_bytes=100)
+    store.put("a", Profile())
+    for xp in range(1, 6):
+        store.put("a", Profile(skills={"mining": xp}))
+    store.flush()
+    assert store.journal.size("a") == 0
+    store.put("a", Profile(skills={"mining": 6}))
+    assert json_codec.loads((tmp_path / "profiles" / "a.json").read_bytes())["skills"] == {"mining": 5}
+    assert make_store(tmp_path).get("a") == Profile(skills={"mining": 6})
+
+
+def test_migrated_profile_is_journaled_whole(tmp_path):
+    migrations = ProfileMigrations()
+
+    @migrations.migration(1)
+    def rename_skill(data):
+        return {**data, "skills": {"mining": data["skills"].get("digging", 0)}}
+
+    (tmp_path / "profiles").mkdir()
+    (tmp_path / "profiles" / "a.json").write_text('{"skills": {"digging": 4}}')
+    store = make_store(tmp_path, migrations=migrations)
+    assert store.get("a").skills == {"mining": 4}
+    store.put("a", store.get("a").model_copy(update={"skills": {"mining": 5}}))
+
+    # Replayed over the old snapshot, the records must not be migrated a second time
+    assert make_store(tmp_path, migrations=migrations).get("a").skills == {"mining": 5}
+
+
+def test_journal_appends_do_not_hold_up_other_profiles(tmp_path):
+    appending, release = Event(), Event()
+
+    class SlowJournal(ProfileJournal):
+        def append(self, name, record):
+            if name == "a":
+                appending.set()
+                release.wait(30)
+            return super().append(name, record)
+
+    store = ProfileStore(JsonDirectoryBackend(tmp_path / "profiles"), flush_interval=3600,
+                         journal=SlowJournal(tmp_path / "journal"))
+    store.put("a", Profile())
+    store.put("b", Profile())
+    writer = Thread(target=store.put, args=("a", Profile(skills={"mining": 1})))
+    writer.start()
+    try:
+        assert appending.wait(5)
+        other = Thread(target=store.put, args=("b", Profile(skills={"mining": 2})))
+        other.start()
+        other.join(5)
+        assert not other.is_alive()
+        assert store.get("a").skills == {"mining": 1}
+    finally:
+        release.set()
+        writer.join()
+    assert make_store(tmp_path).get("a").skills == {"mining": 1}
+    assert make_store(tmp_path).get("b").skills == {"mining": 2}
@@ -0,0 +1,92 @@
+from src import profile_manager
+from src.leaderboard import Leaderboard
+from src.profile_model import Profile
+
+
+def ranking(leaderboard, board):
+    return [(entry["rank"], entry["name"], entry["score"]) for entry in leaderboard.top(board, 100)]
+
+
+def test_updates_keep_boards_sorted():
+    leaderboard = Leaderboard()
+    leaderboard.update("a", 1, {"mining": 10})
+    leaderboard.update("b", 1, {"mining": 30})
+    leaderboard.update("c", 1, {"mining": 20})
+    assert ranking(leaderboard, "mining") == [(1, "b", 30), (2, "c", 20), (3, "a", 10)]
+    leaderboard.update("a", 2, {"mining": 40})
+    leaderboard.update("c", 2, {"mining": 30})
+    # Equal scores share a rank
+    assert ranking(leaderboard, "mining") == [(1, "a", 40), (2, "b", 30), (2, "c", 30)]
+    assert leaderboard.rank("mining", "c") == {"rank": 2, "name": "c", "score": 30}
+
+
+def test_older_versions_never_replace_newer_ones():
+    leaderboard = Leaderboard()
+    leaderboard.update("a", 2, {"mining": 20})
+    leaderboard.update("a", 1, {"mining": 10})
+    assert ranking(leaderboard, "mining") == [(1, "a", 20)]
+
+
+def test_empty_scores_unrank():
+    leaderboard = Leaderboard()
+    leaderboard.update("a", 1, {"mining": 10})
+    leaderboard.update("b", 1, {"mining": 5})
+    leaderboard.update("a", 2, {})
+    assert ranking(leaderboard, "mining") == [(1, "b", 5)]
+    assert leaderboard.rank("mining", "a") is None and leaderboard.size("mining") == 1
+
+
+def set_mining_xp(name, xp):
+    profile_manager.write_profile(name, Profile(skills={"mining": xp}))
+
+
+def entries(board):
+    result = profile_manager.get_leaderboard(board, limit=100)
+    return [(entry["name"], entry["score"]) for entry in result["entries"]]
+
+
+def test_profile_changes_update_the_index(tenant):
+    for name, xp in [("Alice", 100), ("Bob", 300), ("Carol", 200)]:
+        profile_manager.new_profile(name)
+        set_mining_xp(name, xp)
+    assert entries("mining") == [("Bob", 300), ("Carol", 200), ("Alice", 100)]
+
+    # Updates after the index is built
+    set_mining_xp("Alice", 400)
+    assert entries("mining") == [("Alice", 400), ("Bob", 300), ("Carol", 200)]
+
+    # Renaming the selected profile moves its entry to the new name
+    profile_manager.select_profile(profile_manager.get_profile_list().index("Bob"))
+    profile_manager.rename_profile("Robert")
+    assert entries("mining") == [("Alice", 400), ("Robert", 300), ("Carol", 200)]
+    assert profile_manager.get_leaderboard("mining")["player"]["name"] == "Robert"
+
+    # Deleting the selected profile removes its entry
+    profile_manager.delete_profile()
+    assert entries("mining") == [("Alice", 400), ("Carol", 200)]
+    assert entries(profile_manager.TOTAL_LEVEL_BOARD)[0][0] == "Alice"
+
+
+def test_shared_mode_reindexes_only_changed_profiles(shared_tenants, monkeypatch):
+    in_a, in_b = shared_tenants
+    for name, xp in [("Alice", 100), ("Bob", 300), ("Carol", 200)]:
+        in_a(profile_manager.new_profile)(name)
+        in_a(set_mining_xp)(name, xp)
+    assert in_b(entries)("mining") == [("Bob", 300), ("Carol", 200), ("Alice", 100)]
+    assert in_a(entries)("mining") == [("Bob", 300), ("Carol", 200), ("Alice", 100)]
+
+    reads = []
+    get_profile = profile_manager.get_profile
+    monkeypatch.setattr(profile_manager, "get_profile", lambda name: reads.append(name) or get_profile(name))
+    in_a(set_mining_xp)("Alice", 400)
+    # The writing process indexed its own change already
+    assert in_a(entries)("mining") == [("Alice", 400), ("Bob", 300), ("Carol", 200)]
+    assert reads == []
+    assert in_b(entries)("mining") == [("Alice", 400), ("Bob", 300), ("Carol", 200)]
+    assert reads == ["Alice"]
+
+    in_a(profile_manager.select_profile)(1)
+    in_a(profile_manager.delete_profile)()
+    reads.clear()
+    assert in_b(entries)("mining") == [("Alice", 400), ("Carol", 200)]
+    assert reads == ["Bob"]
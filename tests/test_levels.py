@@ -0,0 +1,61 @@
+from math import floor
+
+import pytest
+
+from src import profile_manager
+from src.profile_manager import (BASE_XP, NUMPY_MIN_BATCH, XP_GROWTH_RATE, XP_THRESHOLDS,
+                                 get_level_from_xp, get_levels_from_xp, get_xp_for_level, process_skills)
+
+MAX_LEVEL = 300
+
+
+def walk_level(total_xp):
+    """The level-by-level walk get_level_from_xp used before the threshold table."""
+    level, xp_for_next_level, total_xp_for_this_level = 0, BASE_XP, 0
+    while total_xp >= total_xp_for_this_level + xp_for_next_level:
+        total_xp_for_this_level += xp_for_next_level
+        level += 1
+        xp_for_next_level = floor(xp_for_next_level * XP_GROWTH_RATE)
+    return level
+
+
+def boundary_totals():
+    get_xp_for_level(MAX_LEVEL)
+    totals = [-1, 0, 0.5, 99.5]
+    for level in range(1, MAX_LEVEL):
+        threshold = XP_THRESHOLDS[level]
+        totals += [threshold - 1, threshold, threshold + 1]
+        if threshold < profile_manager.EXACT_FLOAT_LIMIT:
+            totals += [threshold - 0.5, threshold + 0.5]
+    return totals
+
+
+def test_scalar_lookup_matches_walk():
+    for total_xp in boundary_totals():
+        assert get_level_from_xp(total_xp)["level"] == walk_level(total_xp), total_xp
+
+
+def test_small_batch_matches_walk():
+    totals = boundary_totals()
+    for start in range(0, len(totals), NUMPY_MIN_BATCH - 1):
+        batch = totals[start:start + NUMPY_MIN_BATCH - 1]
+        assert get_levels_from_xp(batch) == [walk_level(total_xp) for total_xp in batch]
+
+
+@pytest.mark.parametrize("high", [False, True])
+def test_large_batch_matches_walk(high):
+    # Below 2**53 the batch may be looked up with NumPy; above it, it must not lose precision
+    totals = [total_xp for total_xp in boundary_totals()
+              if (total_xp >= profile_manager.EXACT_FLOAT_LIMIT) == high]
+    assert len(totals) >= NUMPY_MIN_BATCH
+    assert get_levels_from_xp(totals) == [walk_level(total_xp) for total_xp in totals]
+
+
+def test_process_skills_keeps_high_totals_exact():
+    get_xp_for_level(MAX_LEVEL)
+    skill_dicts = [{"mining": XP_THRESHOLDS[level] + offset}
+                   for level in range(223, MAX_LEVEL) for offset in (-1, 0, 1)]
+    for skills, (processed, total_level, _) in zip(skill_dicts, process_skills(skill_dicts)):
+        expected = walk_level(skills["mining"])
+        assert processed["mining"]["level"] == total_level == expected
+        assert 0 <= processed["mining"]["current_xp"] < processed["mining"]["xp_to_next_level"]
@@ -0,0 +1,62 @@
+import pytest
+
+from src.migrations import ProfileMigrations
+from src.profile_model import Profile
+from src.profile_store import ProfileStore
+from src.storage import JsonDirectoryBackend
+
+
+@pytest.fixture
+def migrations():
+    migrations = ProfileMigrations()
+
+    @migrations.migration(1)
+    def add_herbs(data):
+        return {**data, "inventory": {"herbs": 0, **data.get("inventory", {})}}
+
+    @migrations.migration(2)
+    def double_mining(data):
+        skills = dict(data.get("skills", {}))
+        skills["mining"] = skills.get("mining", 0) * 2
+        return {**data, "skills": skills}
+
+    return migrations
+
+
+def test_upgrade_runs_pending_migrations_in_order(migrations):
+    unversioned = {"skills": {"mining": 3}, "inventory": {"wood": 1}}
+    assert migrations.upgrade(unversioned) == {
+        "skills": {"mining": 6}, "inventory": {"herbs": 0, "wood": 1}, "schema_version": 2}
+    # Only the migrations after the stored version run
+    assert migrations.upgrade({"skills": {"mining": 3}, "schema_version": 1}) == {
+        "skills": {"mining": 6}, "schema_version": 2}
+    assert unversioned == {"skills": {"mining": 3}, "inventory": {"wood": 1}}
+
+
+@pytest.mark.parametrize("version", [2, 3])
+def test_upgrade_leaves_current_and_newer_profiles_alone(migrations, version):
+    data = {"skills": {"mining": 3}, "schema_version": version}
+    assert migrations.upgrade(data) is data
+
+
+def test_migrations_must_be_registered_in_order(migrations):
+    with pytest.raises(ValueError):
+        migrations.migration(4)
+    assert migrations.version == 2
+
+
+def test_store_upgrades_on_read_and_writes_on_next_change(tmp_path, migrations):
+    profiles_dir = tmp_path / "profiles"
+    profiles_dir.mkdir()
+    stored = '{"skills": {"mining": 3}}'
+    (profiles_dir / "a.json").write_text(stored)
+    store = ProfileStore(JsonDirectoryBackend(profiles_dir), flush_interval=3600, migrations=migrations)
+
+    profile = store.get("a")
+    assert profile.schema_version == 2 and profile.skills == {"mining": 6.0}
+    store.flush()
+    assert (profiles_dir / "a.json").read_text() == stored
+
+    store.put("a", profile.model_copy(update={"inventory": {"herbs": 1.0}}))
+    store.flush()
+    assert Profile.model_validate_json((profiles_dir / "a.json").read_text()).schema_version == 2
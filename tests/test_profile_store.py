@@ -0,0 +1,99 @@
+import pytest
+
+from src.profile_model import Profile
+from src.profile_store import ProfileStore
+from src.storage import JsonDirectoryBackend, MemoryBackend, SqliteBackend
+
+
+def make_store(backend):
+    return ProfileStore(backend, flush_interval=3600)
+
+
+@pytest.mark.parametrize("backend", [lambda tmp_path: SqliteBackend(tmp_path / "profiles.db"),
+                                     lambda tmp_path: MemoryBackend()])
+def test_creation_order_survives_a_restart(tmp_path, backend):
+    backend = backend(tmp_path)
+    store = make_store(backend)
+    names = ["Adventurer", "Bob", "Carl", "Dora", "Eve", "Finn", "Gus", "Hal"]
+    for name in names:
+        store.put(name, Profile(skills={"mining": len(name)}))
+    store.flush()
+    for name in names[4:]:
+        store.put(name, Profile(skills={"mining": 1}))
+    store.put("Ivy", Profile())
+    store.put("Jo", Profile())
+    # Renaming flushes, and the renamed profile keeps its place
+    store.rename("Jo", "Jay")
+    store.rename("Carl", "Cal")
+    store.delete("Bob")
+    store.put("Bob", Profile())
+    store.flush()
+    live = store.names()
+    assert live == ["Adventurer", "Cal", "Dora", "Eve", "Finn", "Gus", "Hal", "Ivy", "Jay", "Bob"]
+
+    if isinstance(backend, SqliteBackend):
+        backend.close()
+        backend = SqliteBackend(tmp_path / "profiles.db")
+    assert make_store(backend).names() == live
+
+
+@pytest.mark.parametrize("backend_class, file_name", [(JsonDirectoryBackend, "profiles"), (SqliteBackend, "profiles.db")])
+def test_shared_stores_only_relist_when_names_change(tmp_path, backend_class, file_name):
+    class CountingBackend(backend_class):
+        listings = 0
+
+        def list_names(self):
+            CountingBackend.listings += 1
+            return super().list_names()
+
+    def shared_store():
+        return ProfileStore(CountingBackend(tmp_path / file_name), shared=True, lock_dir=tmp_path / "locks")
+
+    writer, reader = shared_store(), shared_store()
+    writer.put("a", Profile())
+    assert reader.names() == writer.names() == ["a"]
+    listings = CountingBackend.listings
+    for xp in range(20):
+        writer.put("a", Profile(skills={"mining": xp}))
+        assert reader.get("a").skills == {"mining": xp}
+    assert CountingBackend.listings == listings
+
+    writer.put("b", Profile())
+    assert reader.names() == ["a", "b"]
+    writer.rename("b", "c")
+    assert reader.names() == ["a", "c"]
+    writer.delete("c")
+    assert reader.names() == ["a"]
+
+
+def test_shared_generation_only_checks_changed_profiles(tmp_path):
+    class CountingBackend(JsonDirectoryBackend):
+        stamps = 0
+
+        def stamp(self, name):
+            CountingBackend.stamps += 1
+            return super().stamp(name)
+
+    def shared_store():
+        return ProfileStore(CountingBackend(tmp_path / "profiles"), shared=True, lock_dir=tmp_path / "locks")
+
+    writer, reader = shared_store(), shared_store()
+    for index in range(10):
+        writer.put(f"p{index}", Profile())
+    for name in reader.names():
+        reader.get(name)
+    generation = reader.generation()
+    stamps = CountingBackend.stamps
+    assert reader.generation() == generation
+    assert CountingBackend.stamps == stamps
+
+    writer.put("p3", Profile(skills={"mining": 1}))
+    writer_generation = writer.generation()
+    stamps = CountingBackend.stamps
+    assert reader.generation() != generation
+    assert CountingBackend.stamps == stamps + 1
+    assert reader.get("p3").skills == {"mining": 1}
+    # A store does not check its own changes again
+    stamps = CountingBackend.stamps
+    assert writer.generation() == writer_generation
+    assert CountingBackend.stamps == stamps
@@ -0,0 +1,23 @@
+from src import profile_manager
+
+
+def test_shared_settings_are_seen_by_other_processes(shared_tenants):
+    in_a, in_b = shared_tenants
+    in_a(profile_manager.new_profile)("Adventurer")
+    in_a(profile_manager.new_profile)("Bob")
+    in_a(profile_manager.select_profile)(0)
+    assert in_b(profile_manager.get_selected_profile_name)() == "Adventurer"
+
+    in_a(profile_manager.select_profile)(1)
+    assert in_b(profile_manager.get_selected_profile_name)() == "Bob"
+
+
+def test_shared_settings_changes_are_merged(shared_tenants):
+    in_a, in_b = shared_tenants
+    in_a(profile_manager.load_settings)()
+    in_b(profile_manager.load_settings)()
+    in_a(profile_manager.update_settings)({"theme": "light"})
+    in_b(profile_manager.update_settings)({"font_size": 20})
+    for in_tenant in shared_tenants:
+        settings = in_tenant(profile_manager.load_settings)()
+        assert settings["theme"] == "light" and settings["font_size"] == 20
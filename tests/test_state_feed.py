@@ -0,0 +1,79 @@
+from src.state_feed import StateFeed, diff_state, merge_changes
+
+
+def apply_changes(state, changes):
+    """Applies a diff the way a streaming client does: None removes a key."""
+    result = dict(state)
+    for key, value in changes.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = apply_changes(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+STATES = [
+    {"profile_names": ["A"], "profiles": {"A": {"skills": {"mining": 1}, "stats": {"strength": 1}}},
+     "selected_profile_name": "A"},
+    {"profile_names": ["A", "B"], "profiles": {"A": {"skills": {"mining": 2}, "stats": {"strength": 1}},
+                                               "B": {"skills": {}, "stats": {"strength": 1}}},
+     "selected_profile_name": "B"},
+    {"profile_names": ["B"], "profiles": {"B": {"skills": {"woodcutting": 5}, "stats": {"strength": 1}}},
+     "selected_profile_name": "B"},
+    {"profile_names": ["B"], "profiles": {"B": {"skills": {"woodcutting": 5}, "stats": {"strength": 2}}},
+     "selected_profile_name": "B"},
+]
+
+
+def test_diff_round_trips():
+    for old in STATES:
+        for new in STATES:
+            assert apply_changes(old, diff_state(old, new)) == new
+    assert diff_state(STATES[0], STATES[0]) == {}
+
+
+def test_diff_holds_only_changed_keys():
+    assert diff_state(STATES[2], STATES[3]) == {"profiles": {"B": {"stats": {"strength": 2}}}}
+    assert diff_state(STATES[1], STATES[2])["profiles"]["A"] is None
+
+
+def test_merged_changes_match_the_direct_diff():
+    for start in range(len(STATES)):
+        merged = {}
+        for old, new in zip(STATES[start:], STATES[start + 1:]):
+            merged = merge_changes(merged, diff_state(old, new))
+        assert apply_changes(STATES[start], merged) == STATES[-1]
+
+
+def test_merge_does_not_modify_its_arguments():
+    base = {"profiles": {"A": {"skills": {"mining": 1}}}}
+    changes = {"profiles": {"A": {"skills": {"mining": 2}}}}
+    merge_changes(base, changes)
+    assert base == {"profiles": {"A": {"skills": {"mining": 1}}}}
+    assert changes == {"profiles": {"A": {"skills": {"mining": 2}}}}
+
+
+def test_feed_catches_up_from_a_cursor():
+    states = iter(STATES)
+    current = {}
+
+    def build_snapshot():
+        current["state"] = next(states, current.get("state"))
+        return current["state"]
+
+    feed = StateFeed(build_snapshot)
+    first = feed.events_since(None)
+    assert first.kind == "state" and first.data == STATES[0]
+    cursor = feed.parse_cursor(first.id)
+    assert feed.events_since(cursor) is None
+    for _ in STATES[1:]:
+        feed.mark_changed()
+        feed.events_since(None)
+    catch_up = feed.events_since(cursor)
+    assert catch_up.kind == "diff"
+    assert apply_changes(STATES[0], catch_up.data) == STATES[-1]
+    # Cursors from another run get the full state
+    assert feed.events_since(None).kind == "state"
+    assert feed.parse_cursor("other-1") is None
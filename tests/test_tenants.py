@@ -0,0 +1,63 @@
+from threading import Event, Thread
+
+from src.tenants import TenantCache
+
+
+class FakeTenant:
+    def __init__(self, tenant_id):
+        self.id = tenant_id
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_loading_one_tenant_does_not_block_others():
+    started, finish = Event(), Event()
+
+    def factory(tenant_id):
+        if tenant_id == "slow":
+            started.set()
+            assert finish.wait(5)
+        return FakeTenant(tenant_id)
+
+    cache = TenantCache(factory, max_resident=4)
+    loaded = {}
+    slow = Thread(target=lambda: loaded.setdefault("slow", cache.acquire("slow")))
+    waiter = Thread(target=lambda: loaded.setdefault("waiter", cache.acquire("slow")))
+    slow.start()
+    assert started.wait(5)
+    waiter.start()
+    # Loads while "slow" is still being built, and both requests for it see it as resident
+    assert cache.acquire("fast").id == "fast"
+    assert "slow" in cache
+    finish.set()
+    slow.join(5)
+    waiter.join(5)
+    assert loaded["slow"] is loaded["waiter"]
+
+
+def test_failed_load_can_be_retried():
+    attempts = []
+
+    def factory(tenant_id):
+        attempts.append(tenant_id)
+        if len(attempts) == 1:
+            raise OSError("disk full")
+        return FakeTenant(tenant_id)
+
+    cache = TenantCache(factory, max_resident=4)
+    try:
+        cache.acquire("a")
+    except OSError:
+        pass
+    assert "a" not in cache
+    assert cache.acquire("a").id == "a"
+
+
+def test_unpinned_tenants_are_evicted_and_closed():
+    cache = TenantCache(FakeTenant, max_resident=1)
+    first = cache.acquire("a")
+    cache.release("a")
+    cache.acquire("b")
+    assert first.closed and "a" not in cache and len(cache) == 1